@@ -17,11 +17,16 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenRefreshView
-from core.views import CustomTokenObtainPairView, portfolio_by_username
+from core.views import CustomTokenObtainPairView, portfolio_by_username, portfolios_by_slugs
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from portfolio.media import serve_media
+import re
+
+if getattr(settings, 'ASYNC_PUBLIC_VIEWS', False):
+    # Event-loop versions of the public endpoints, for ASGI deployments
+    from core.async_views import portfolio_by_username
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -48,6 +53,9 @@ urlpatterns = [
     # Portfolio by username (public)
     path('api/v1/portfolio/<str:username_slug>/', portfolio_by_username, name='portfolio-by-username'),
     
+    # Many portfolios at once (public): ?slugs=a,b,c
+    path('api/v1/portfolios/', portfolios_by_slugs, name='portfolios-by-slugs'),
+    
     # Portfolio API
     path('api/v1/', include('portfolio.urls')),
     
@@ -57,6 +65,8 @@ urlpatterns = [
     path('api/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
 
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media files: access-checked, offloaded to the front proxy when MEDIA_SENDFILE_BACKEND is set
+if not settings.MEDIA_URL.startswith(('http://', 'https://')):
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
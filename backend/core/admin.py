@@ -1,3 +1,58 @@
 from django.contrib import admin
+from django.utils import timezone
+from .models import EmailOutbox, Task, VerificationToken
 
-# Register your models here.
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'to', 'last_error')
+    readonly_fields = ('subject', 'body', 'html_body', 'from_email', 'to', 'status', 'attempts',
+                       'last_error', 'next_attempt_at', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='To')
+    def recipients(self, obj):
+        return ', '.join(obj.to)
+
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} emails queued for another attempt')
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at', 'created_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'key', 'last_error')
+    readonly_fields = ('name', 'args', 'kwargs', 'key', 'status', 'attempts', 'max_attempts',
+                       'run_at', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry_now']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Retry selected failed tasks now')
+    def retry_now(self, request, queryset):
+        # Skip tasks whose key already has a queued successor
+        queued_keys = Task.objects.filter(status='queued', key__isnull=False).values('key')
+        updated = queryset.filter(status='failed').exclude(key__in=queued_keys).update(status='queued', attempts=0, run_at=timezone.now(), finished_at=None)
+        self.message_user(request, f'{updated} tasks queued again')
+
+
+@admin.register(VerificationToken)
+class VerificationTokenAdmin(admin.ModelAdmin):
+    # Only hashes are stored, so there is nothing to show but who, what for and until when
+    list_display = ('user', 'purpose', 'expires_at', 'created_at')
+    list_filter = ('purpose',)
+    search_fields = ('user__username', 'user__email')
+    readonly_fields = ('user', 'purpose', 'expires_at', 'created_at')
+    exclude = ('token_hash',)
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,153 @@
+"""
+Async versions of the public portfolio endpoints.
+
+portfolio_by_username and create_message_for_user are the endpoints anonymous
+visitors hit, and mostly wait: on slow clients and on the cache/database. As
+sync DRF views under ASGI, each request holds a thread for all of that time.
+These views run on the event loop instead and only leave it for the database
+and cache calls themselves, so one ASGI process can hold many more slow
+connections. Responses are identical to the DRF views (same bodies, ETags and
+precompressed encodings).
+
+The DRF views stay the default. With ASYNC_PUBLIC_VIEWS = True the URLconfs
+route these paths here; only enable it when serving through backend/asgi.py,
+since under WSGI every async view runs through an event loop of its own.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+import json
+import logging
+
+from .query_budget import query_budget
+
+logger = logging.getLogger(__name__)
+
+
+def not_published_response(resolved):
+    return JsonResponse({
+        'error': 'Portfolio is not published. Please publish it from your dashboard.',
+        'username_slug': resolved.username_slug,
+        'portfolio_published': False,
+    }, status=status.HTTP_403_FORBIDDEN)
+
+
+def request_data(request):
+    """The submitted fields, from a JSON or form body"""
+    if request.content_type == 'application/json':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('JSON body must be an object')
+        return data
+    return request.POST
+
+
+@query_budget(3)
+@require_GET
+async def portfolio_by_username(request, username_slug):
+    """Get portfolio data by username slug"""
+    from portfolio.models import PortfolioSnapshot
+    from portfolio.snapshots import build_snapshot, absolutize_media_urls, compute_etag, response_etag
+    from portfolio.resolver import aresolve_portfolio_slug
+    from portfolio.fieldsets import parse_sections, parse_fields, apply_sparse_fieldsets
+    from portfolio.compression import aprecompressed_response, matching_etag
+    from portfolio.media_urls import absolute_url_builder
+
+    try:
+        sections = parse_sections(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    fields = parse_fields(request.GET)
+
+    async def snapshot_response(snapshot):
+        if not snapshot.etag:
+            # response_etag() would load the deferred document synchronously
+            snapshot.data = await snapshot_data(snapshot)
+            snapshot.etag = compute_etag(snapshot.data)
+        etag = response_etag(snapshot, request, sections, fields)
+        client_etag = matching_etag(request, etag)
+        if client_etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = client_etag
+            return response
+
+        async def render():
+            data = apply_sparse_fieldsets(await snapshot_data(snapshot), sections, fields)
+            return JSONRenderer().render(absolutize_media_urls(data, absolute_url_builder(request)))
+
+        return await aprecompressed_response(request, f'portfolio:{snapshot.user_id}:{etag}', render, etag=etag)
+
+    async def snapshot_data(snapshot):
+        if 'data' in snapshot.__dict__:
+            return snapshot.data
+        return await PortfolioSnapshot.objects.filter(pk=snapshot.pk).values_list('data', flat=True).afirst()
+
+    try:
+        resolved = await aresolve_portfolio_slug(username_slug)
+        if resolved is None:
+            logger.warning(f"Profile not found for username_slug: {username_slug}")
+            return JsonResponse({
+                'error': f'Portfolio not found for username: {username_slug}',
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        if not resolved.published:
+            logger.warning(f"Portfolio not published for user ID: {resolved.user_id}")
+            return not_published_response(resolved)
+
+        snapshot = await PortfolioSnapshot.objects.filter(user_id=resolved.user_id).defer('data').afirst()
+        if snapshot:
+            return await snapshot_response(snapshot)
+
+        # Published but no snapshot yet: built for this response only, in one trip to the sync side
+        logger.info(f"Building unsaved portfolio snapshot for user ID: {resolved.user_id}")
+        snapshot = await sync_to_async(build_snapshot)(resolved.user_id)
+        if snapshot is None:
+            return not_published_response(resolved)
+        return await snapshot_response(snapshot)
+    except Exception as e:
+        logger.error(f"Error fetching portfolio: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'error': f'An error occurred while fetching portfolio: {str(e)}',
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@query_budget(3)
+@csrf_exempt
+@require_POST
+async def create_message_for_user(request, username_slug):
+    """Create a contact message for a specific user's portfolio"""
+    from portfolio.models import ContactMessage
+    from portfolio.serializers import ContactMessageCreateSerializer
+    from portfolio.resolver import aresolve_portfolio_slug
+
+    try:
+        data = request_data(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        resolved = await aresolve_portfolio_slug(username_slug)
+        if resolved is None:
+            return JsonResponse({
+                'error': f'Portfolio not found for username: {username_slug}',
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        if not resolved.published:
+            return JsonResponse({
+                'error': 'Portfolio is not published.',
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        # Field validation only touches the database for unique fields, which this serializer has none of
+        serializer = ContactMessageCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        message = await ContactMessage.objects.acreate(user_id=resolved.user_id, status='new', **serializer.validated_data)
+        return JsonResponse(ContactMessageCreateSerializer(message).data, status=status.HTTP_201_CREATED)
+    except Exception as e:
+        logger.error(f"Error creating message: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'error': f'An error occurred while creating message: {str(e)}',
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,259 @@
+"""
+Bulk moderation: approve, activate or publish many users at once.
+
+The per-user endpoints load a user, get_or_create the profile, save it and
+queue an email per request. The bulk versions take either explicit ids or a
+filter, and per chunk of BULK_USER_CHUNK_SIZE users run one SELECT, one
+set-based UPDATE of the rows that actually change and one INSERT for all
+notification emails. UPDATE bypasses model signals, so what those would have
+done (slug and CV access cache invalidation, snapshot rebuilds) is done here
+per chunk.
+
+Every requested id gets a result:
+
+    'updated'     - the value changed (and the user was notified, where applicable)
+    'unchanged'   - the value already matched
+    'not_found'   - no such user
+    'skipped'     - not allowed for this user (staff/superuser approval, your own
+                    account, publishing a portfolio without a slug)
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils.html import strip_tags
+from datetime import datetime
+import logging
+
+from portfolio.models import UserProfile
+from .mail import queue_mass_mail
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_MAX_USERS = 5000
+
+# filter key -> (lookup, parser)
+USER_FILTERS = {
+    'is_approved': ('profile__is_approved', 'boolean'),
+    'email_verified': ('profile__email_verified', 'boolean'),
+    'portfolio_published': ('profile__portfolio_published', 'boolean'),
+    'is_active': ('is_active', 'boolean'),
+    'joined_after': ('date_joined__gte', 'datetime'),
+    'joined_before': ('date_joined__lt', 'datetime'),
+}
+
+
+class BulkRequestError(ValueError):
+    """The ids/filter of a bulk request are invalid; the message is user-facing"""
+
+
+def parse_boolean_value(key, value):
+    """A JSON boolean, or the strings "true"/"false" (as sent by query-string minded clients)"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    raise BulkRequestError(f'Filter {key} must be true or false.')
+
+
+def parse_datetime_value(value):
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        day = parse_date(str(value))
+        if day is None:
+            raise BulkRequestError(f'Invalid date: {value}')
+        parsed = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def resolve_user_ids(data):
+    """
+    The user ids a bulk request targets, from `user_ids` or `filter` (exactly one).
+
+    Raises BulkRequestError for malformed input or more than BULK_USER_MAX users.
+    """
+    max_users = getattr(settings, 'BULK_USER_MAX', DEFAULT_MAX_USERS)
+    user_ids, filters = data.get('user_ids'), data.get('filter')
+    if (user_ids is None) == (filters is None):
+        raise BulkRequestError('Provide either user_ids or filter.')
+
+    if user_ids is not None:
+        if not isinstance(user_ids, list) or not user_ids:
+            raise BulkRequestError('user_ids must be a non-empty list.')
+        try:
+            # Keep the requested order, drop duplicates
+            user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        except (TypeError, ValueError):
+            raise BulkRequestError('user_ids must be integers.')
+        if len(user_ids) > max_users:
+            raise BulkRequestError(f'At most {max_users} users per request.')
+        return user_ids
+
+    if not isinstance(filters, dict) or not filters:
+        raise BulkRequestError('filter must be a non-empty object.')
+    unknown = set(filters) - set(USER_FILTERS)
+    if unknown:
+        raise BulkRequestError(f"Unknown filter keys: {', '.join(sorted(unknown))}. Allowed: {', '.join(USER_FILTERS)}.")
+    lookups = {}
+    for key, value in filters.items():
+        lookup, parser = USER_FILTERS[key]
+        lookups[lookup] = parse_datetime_value(value) if parser == 'datetime' else parse_boolean_value(key, value)
+    user_ids = list(User.objects.filter(**lookups).order_by('pk').values_list('pk', flat=True)[:max_users + 1])
+    if len(user_ids) > max_users:
+        raise BulkRequestError(f'The filter matches more than {max_users} users; narrow it down.')
+    return user_ids
+
+
+def chunks(items):
+    size = getattr(settings, 'BULK_USER_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def render_email(user, content):
+    subject, template, context = content
+    html_message = render_to_string(template, context)
+    return {
+        'subject': subject,
+        'message': strip_tags(html_message),
+        'from_email': settings.DEFAULT_FROM_EMAIL,
+        'recipient_list': [user.email],
+        'html_message': html_message,
+    }
+
+
+def notify(users, build_content):
+    """Queue one email per user that has an address, as a single INSERT"""
+    messages = []
+    for user in users:
+        if not user.email:
+            continue
+        try:
+            messages.append(render_email(user, build_content(user)))
+        except Exception as e:
+            logger.error(f"Failed to render bulk notification for user ID {user.id}: {str(e)}", exc_info=True)
+    if messages:
+        queue_mass_mail(messages)
+
+
+def load_chunk(chunk):
+    """Users of a chunk with their profiles, creating missing profiles in one INSERT"""
+    users = {user.pk: user for user in User.objects.filter(pk__in=chunk).select_related('profile')}
+    missing = [user for user in users.values() if not hasattr(user, 'profile')]
+    if missing:
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in missing], ignore_conflicts=True)
+        for profile in UserProfile.objects.filter(user__in=missing):
+            users[profile.user_id].profile = profile
+    return users
+
+
+def bulk_update_approval(user_ids, is_approved):
+    """Approve or revoke users; notifies those whose status changed. Returns {id: result}."""
+    from portfolio.tasks import rebuild_portfolio_snapshots
+    from .views import approval_email_content
+
+    results = {}
+    for chunk in chunks(user_ids):
+        with transaction.atomic():
+            users = load_chunk(chunk)
+            changed = []
+            for user_id in chunk:
+                user = users.get(user_id)
+                if user is None:
+                    results[user_id] = 'not_found'
+                elif user.is_staff or user.is_superuser:
+                    results[user_id] = 'skipped'
+                elif user.profile.is_approved == is_approved:
+                    results[user_id] = 'unchanged'
+                else:
+                    results[user_id] = 'updated'
+                    changed.append(user)
+            if changed:
+                UserProfile.objects.filter(user__in=changed).update(is_approved=is_approved, updated_at=timezone.now())
+                # is_approved and updated_at are part of the snapshot's profile section
+                published = [user.id for user in changed if user.profile.portfolio_published]
+                if published:
+                    rebuild_portfolio_snapshots.delay(published)
+                notify(changed, lambda user: approval_email_content(user, is_approved))
+    return results
+
+
+def bulk_update_active(user_ids, is_active, acting_user):
+    """Activate or deactivate users (never the acting user). Returns {id: result}."""
+    results = {}
+    for chunk in chunks(user_ids):
+        current = dict(User.objects.filter(pk__in=chunk).values_list('pk', 'is_active'))
+        changed = []
+        for user_id in chunk:
+            if user_id not in current:
+                results[user_id] = 'not_found'
+            elif user_id == acting_user.id:
+                results[user_id] = 'skipped'
+            elif current[user_id] == is_active:
+                results[user_id] = 'unchanged'
+            else:
+                results[user_id] = 'updated'
+                changed.append(user_id)
+        if changed:
+            User.objects.filter(pk__in=changed).update(is_active=is_active)
+    return results
+
+
+def bulk_update_published(user_ids, is_published):
+    """
+    Publish or unpublish portfolios. Unpublishing is recorded as done by an admin.
+
+    Refreshes the slug cache and the affected snapshots, and notifies the owners.
+    Returns {id: result}.
+    """
+    from portfolio.media import invalidate_cv_access
+    from portfolio.resolver import invalidate_portfolio_slugs
+    from portfolio.tasks import rebuild_portfolio_snapshots
+    from .views import portfolio_status_email_content
+
+    results = {}
+    for chunk in chunks(user_ids):
+        with transaction.atomic():
+            users = load_chunk(chunk)
+            changed = []
+            for user_id in chunk:
+                user = users.get(user_id)
+                if user is None:
+                    results[user_id] = 'not_found'
+                elif user.profile.portfolio_published == is_published:
+                    results[user_id] = 'unchanged'
+                elif is_published and not user.profile.username_slug:
+                    # A portfolio without a slug has no public page to publish
+                    results[user_id] = 'skipped'
+                else:
+                    results[user_id] = 'updated'
+                    changed.append(user)
+            if not changed:
+                continue
+            UserProfile.objects.filter(user__in=changed).update(portfolio_published=is_published, updated_at=timezone.now())
+            # What the UserProfile post_save receivers would have done
+            invalidate_portfolio_slugs(*[user.profile.username_slug for user in changed], *[user.username for user in changed])
+            invalidate_cv_access(*[user.id for user in changed])
+            rebuild_portfolio_snapshots.delay([user.id for user in changed])
+            notify(changed, lambda user: portfolio_status_email_content(
+                user, is_published, unpublished_by_admin=not is_published, username_slug=user.profile.username_slug,
+            ))
+    return results
+
+
+def summarize(results):
+    """Response body of a bulk endpoint: per-id results plus counts"""
+    counts = {}
+    for result in results.values():
+        counts[result] = counts.get(result, 0) + 1
+    return {
+        'results': {str(user_id): result for user_id, result in results.items()},
+        'counts': counts,
+    }
@@ -0,0 +1,68 @@
+"""
+Circuit breaker for calls to an external service.
+
+After `failure_threshold` consecutive failures the breaker opens: callers
+check allow() and skip the call (deferring the work) instead of waiting on a
+service that is down. Once `reset_timeout` seconds have passed it is half-open
+and lets exactly one caller through as a probe; a success closes it, a failure
+opens it for another period.
+
+State lives in the Django cache, so every worker process and thread sees the
+same breaker. With the default per-process LocMemCache each process simply
+has its own.
+"""
+from django.core.cache import cache
+import time
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def key(self, part):
+        return f'circuit:{self.name}:{part}'
+
+    def opened_until(self):
+        """Unix time the open period ends, or None when the breaker is closed"""
+        return cache.get(self.key('opened_until'))
+
+    def state(self):
+        opened_until = self.opened_until()
+        if opened_until is None:
+            return 'closed'
+        return 'open' if time.time() < opened_until else 'half-open'
+
+    def allow(self):
+        """Whether a call may go ahead now"""
+        opened_until = self.opened_until()
+        if opened_until is None:
+            return True
+        if time.time() < opened_until:
+            return False
+        # Half-open: only the caller that wins this add() probes the service
+        return cache.add(self.key('probe'), 1, self.reset_timeout)
+
+    def record_success(self):
+        if self.opened_until() is not None or cache.get(self.key('failures')):
+            cache.delete_many([self.key('failures'), self.key('opened_until'), self.key('probe')])
+
+    def record_failure(self):
+        """Count a failure; returns True when this failure opened the breaker"""
+        cache.add(self.key('failures'), 0, None)
+        try:
+            failures = cache.incr(self.key('failures'))
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(self.key('failures'), 1, None)
+            failures = 1
+        if failures < self.failure_threshold and self.opened_until() is None:
+            return False
+        # Tripped, or the half-open probe failed: open for another period
+        cache.set(self.key('opened_until'), time.time() + self.reset_timeout, None)
+        cache.delete(self.key('probe'))
+        return True
+
+    def reset(self):
+        cache.delete_many([self.key('failures'), self.key('opened_until'), self.key('probe')])
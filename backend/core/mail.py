@@ -0,0 +1,297 @@
+"""
+Outbound email queue.
+
+Request handlers used to call send_mail() inline, so registration, password
+resets and replies waited on the SMTP handshake (and hung with it when the
+server stalled). queue_mail() takes the same arguments but only stores the
+message in EmailOutbox, in the request's transaction; the worker
+
+    python manage.py send_queued_mail [--loop]
+
+delivers due messages in batches over one SMTP connection per batch. A failed
+message is retried with exponential backoff (EMAIL_OUTBOX_RETRY_DELAY seconds,
+doubled per attempt up to EMAIL_OUTBOX_MAX_RETRY_DELAY) and marked failed after
+EMAIL_OUTBOX_MAX_ATTEMPTS. Claimed messages get a lease (next_attempt_at moves
+EMAIL_OUTBOX_LEASE seconds ahead, 600 by default) with a conditional UPDATE, so
+a crashed worker's batch is picked up again later and concurrent workers never
+send the same message. A slow batch can't outlive its lease either: send_batch()
+gives back the messages whose lease would run out while they are being sent.
+
+Delivery is guarded against a slow or failing provider:
+
+- Connections get timeouts (EMAIL_CONNECT_TIMEOUT, 10 s, for connecting and
+  EMAIL_SEND_TIMEOUT, 30 s, per SMTP command; both default to EMAIL_TIMEOUT
+  when that is set), so a stalled server fails a batch instead of hanging it.
+- Retry delays are jittered, so messages that failed together don't all come
+  back at the same moment.
+- A circuit breaker (see core/circuit.py) opens after
+  EMAIL_CIRCUIT_FAILURE_THRESHOLD (5) consecutive provider failures. While it
+  is open, batches are deferred until it half-opens
+  (EMAIL_CIRCUIT_RESET_TIMEOUT, 60 s) without using up their attempts.
+  Rejections of a single message (bad recipient, 5xx reply) don't count.
+
+mail_stats() reports the delivery counters and the breaker state.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+import random
+import smtplib
+
+from .circuit import CircuitBreaker
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 60
+DEFAULT_MAX_RETRY_DELAY = 60 * 60
+DEFAULT_LEASE = 10 * 60
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_SEND_TIMEOUT = 30
+# SMTP round trips of one message (MAIL, RCPT, DATA, the body, RSET), each bounded by the send timeout
+MESSAGE_ROUND_TRIPS = 5
+
+# Counters kept by mail_stats()
+STATS = ('attempts', 'sent', 'failures', 'deferred', 'breaker_opened')
+
+
+def get_breaker():
+    return CircuitBreaker(
+        'smtp',
+        failure_threshold=getattr(settings, 'EMAIL_CIRCUIT_FAILURE_THRESHOLD', 5),
+        reset_timeout=getattr(settings, 'EMAIL_CIRCUIT_RESET_TIMEOUT', 60),
+    )
+
+
+def incr_stat(name, count=1):
+    key = f'mail:stats:{name}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, count)
+    except ValueError:
+        cache.set(key, count, None)
+
+
+def mail_stats():
+    """Delivery counters since the cache was last cleared, plus the circuit breaker state"""
+    stats = cache.get_many([f'mail:stats:{name}' for name in STATS])
+    result = {name: stats.get(f'mail:stats:{name}', 0) for name in STATS}
+    breaker = get_breaker()
+    result['breaker_state'] = breaker.state()
+    opened_until = breaker.opened_until()
+    result['breaker_retry_at'] = (
+        datetime.fromtimestamp(opened_until, tz=dt_timezone.utc).isoformat() if opened_until else None
+    )
+    return result
+
+
+def queue_mail(subject, message, from_email, recipient_list, html_message=None):
+    """Queue an email for the send_queued_mail worker (arguments as for send_mail); returns the EmailOutbox row"""
+    return EmailOutbox.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+
+
+def queue_mass_mail(messages):
+    """Queue many emails with one INSERT; `messages` are dicts of queue_mail() arguments. Returns the rows."""
+    return EmailOutbox.objects.bulk_create([
+        EmailOutbox(
+            subject=message['subject'],
+            body=message['message'],
+            html_body=message.get('html_message'),
+            from_email=message.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+            to=list(message['recipient_list']),
+        )
+        for message in messages
+    ])
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try after `attempts` failed ones"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    cap = getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', DEFAULT_MAX_RETRY_DELAY)
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+def jittered(delay):
+    """A random delay between half and all of `delay`"""
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def get_timeouts():
+    """(connect timeout, per-command send timeout) in seconds"""
+    default_timeout = getattr(settings, 'EMAIL_TIMEOUT', None)
+    return (
+        getattr(settings, 'EMAIL_CONNECT_TIMEOUT', default_timeout or DEFAULT_CONNECT_TIMEOUT),
+        getattr(settings, 'EMAIL_SEND_TIMEOUT', default_timeout or DEFAULT_SEND_TIMEOUT),
+    )
+
+
+def message_time_limit():
+    """Worst-case seconds to send one message: reconnecting, then every SMTP round trip timing out"""
+    connect_timeout, send_timeout = get_timeouts()
+    return connect_timeout + MESSAGE_ROUND_TRIPS * send_timeout
+
+
+def get_lease():
+    """Seconds a claimed batch stays leased; always long enough for a couple of worst-case messages"""
+    return max(getattr(settings, 'EMAIL_OUTBOX_LEASE', DEFAULT_LEASE), 2 * message_time_limit())
+
+
+def get_mail_connection():
+    """The configured email backend, with a connect timeout (see apply_send_timeout())"""
+    return get_connection(timeout=get_timeouts()[0])
+
+
+def apply_send_timeout(mail_connection):
+    """Switch an open SMTP connection's socket to the (longer) per-command send timeout"""
+    sock = getattr(getattr(mail_connection, 'connection', None), 'sock', None)
+    if sock is not None:
+        sock.settimeout(get_timeouts()[1])
+
+
+def is_provider_failure(error):
+    """Whether an error means the provider is unreachable or unwell, rather than rejecting one message"""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 4xx replies are temporary trouble on the server; 5xx reject this message
+        return error.smtp_code < 500
+    return isinstance(error, OSError)
+
+
+def claim_batch(batch_size=None):
+    """Lease up to `batch_size` due messages to this worker and return them"""
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=get_lease())
+    due = EmailOutbox.objects.filter(status='pending', next_attempt_at__lte=now)
+    candidates = list(due.order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:batch_size])
+    # One conditional UPDATE per message: a message another worker leased meanwhile is no longer due.
+    # No lock is held across statements, which SQLite can't upgrade while worker threads write.
+    ids = [pk for pk in candidates if due.filter(pk=pk).update(next_attempt_at=lease_until)]
+    return list(EmailOutbox.objects.filter(pk__in=ids).order_by('next_attempt_at', 'pk'))
+
+
+def build_message(outbox, mail_connection):
+    message = EmailMultiAlternatives(outbox.subject, outbox.body, outbox.from_email, outbox.to, connection=mail_connection)
+    if outbox.html_body:
+        message.attach_alternative(outbox.html_body, 'text/html')
+    return message
+
+
+def record_failure(outbox, error):
+    outbox.attempts += 1
+    outbox.last_error = str(error)[:2000]
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    if outbox.attempts >= max_attempts:
+        outbox.status = 'failed'
+        logger.error(f"Giving up on email {outbox.pk} to {', '.join(outbox.to)} after {outbox.attempts} attempts: {outbox.last_error}")
+    else:
+        outbox.next_attempt_at = timezone.now() + timedelta(seconds=jittered(retry_delay(outbox.attempts)))
+        logger.warning(f"Email {outbox.pk} to {', '.join(outbox.to)} failed (attempt {outbox.attempts}), retrying at {outbox.next_attempt_at}: {outbox.last_error}")
+    outbox.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def defer(messages, until):
+    """Release claimed messages until `until` without counting an attempt"""
+    if messages:
+        EmailOutbox.objects.filter(pk__in=[outbox.pk for outbox in messages]).update(next_attempt_at=until)
+        incr_stat('deferred', len(messages))
+
+
+def release(messages):
+    """Give claimed messages back to be claimed again right away, without counting an attempt"""
+    if messages:
+        EmailOutbox.objects.filter(pk__in=[outbox.pk for outbox in messages]).update(next_attempt_at=timezone.now())
+
+
+def record_provider_failure(breaker, error):
+    """Count a failure against the breaker; returns True when it is open now"""
+    if not is_provider_failure(error):
+        return False
+    if breaker.record_failure():
+        incr_stat('breaker_opened')
+        logger.error(f"Email provider failing, pausing delivery for {breaker.reset_timeout}s: {str(error)}")
+        return True
+    return False
+
+
+def breaker_retry_at(breaker):
+    return timezone.now() + timedelta(seconds=breaker.reset_timeout)
+
+
+def send_batch(messages, mail_connection=None):
+    """
+    Deliver claimed messages over one connection and record the outcome of each; returns (sent, failed).
+
+    While the circuit breaker is open the batch is deferred instead (neither sent nor failed).
+    """
+    breaker = get_breaker()
+    if not breaker.allow():
+        defer(messages, breaker_retry_at(breaker))
+        return 0, 0
+
+    mail_connection = mail_connection or get_mail_connection()
+    sent = failed = 0
+    try:
+        mail_connection.open()
+        apply_send_timeout(mail_connection)
+    except Exception as e:
+        # No session at all: every message in the batch is retried later
+        incr_stat('attempts', len(messages))
+        incr_stat('failures', len(messages))
+        if record_provider_failure(breaker, e):
+            defer(messages, breaker_retry_at(breaker))
+            return 0, 0
+        for outbox in messages:
+            record_failure(outbox, e)
+        return 0, len(messages)
+
+    try:
+        for position, outbox in enumerate(messages):
+            if timezone.now() + timedelta(seconds=message_time_limit()) > outbox.next_attempt_at:
+                # Its lease could run out mid-send and another worker claim it again
+                logger.warning(f"Email batch ran close to its lease; releasing {len(messages) - position} unsent emails")
+                release(messages[position:])
+                break
+            incr_stat('attempts')
+            try:
+                if not mail_connection.send_messages([build_message(outbox, mail_connection)]):
+                    raise RuntimeError('The email backend did not accept the message')
+            except Exception as e:
+                failed += 1
+                incr_stat('failures')
+                record_failure(outbox, e)
+                if record_provider_failure(breaker, e):
+                    # Don't keep feeding a provider that is down
+                    defer(messages[position + 1:], breaker_retry_at(breaker))
+                    break
+                # The SMTP session may be unusable after an error; continue on a fresh one
+                mail_connection.close()
+                try:
+                    mail_connection.open()
+                    apply_send_timeout(mail_connection)
+                except Exception as reopen_error:
+                    logger.warning(f"Could not reopen the email connection: {str(reopen_error)}")
+                continue
+            sent += 1
+            incr_stat('sent')
+            breaker.record_success()
+            outbox.attempts += 1
+            outbox.status = 'sent'
+            outbox.sent_at = timezone.now()
+            outbox.last_error = ''
+            outbox.save(update_fields=['attempts', 'status', 'sent_at', 'last_error'])
+    finally:
+        mail_connection.close()
+    return sent, failed
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.tokens import DEFAULT_PURGE_BATCH_SIZE, purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired email verification codes and password reset tokens in batches. runworker does this hourly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'VERIFICATION_TOKEN_PURGE_BATCH_SIZE', DEFAULT_PURGE_BATCH_SIZE),
+                            help='Rows deleted per statement (default: VERIFICATION_TOKEN_PURGE_BATCH_SIZE or 1000)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        purged = purge_expired_tokens(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired tokens'))
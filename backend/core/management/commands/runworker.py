@@ -0,0 +1,101 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import django
+import signal
+import time
+
+from core.taskqueue import autodiscover, claim_tasks, ensure_periodic_tasks, execute_task_by_id, registry
+
+# Seconds between checks that every periodic task has its next run queued
+PERIODIC_CHECK_INTERVAL = 60
+
+
+def init_process():
+    # Pool processes may be spawned rather than forked
+    django.setup()
+    autodiscover()
+
+
+class Command(BaseCommand):
+    help = 'Run background tasks from the task table (see core/taskqueue.py) on a pool of threads or processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=getattr(settings, 'TASK_WORKER_CONCURRENCY', 4),
+                            help='Tasks run at the same time (default: TASK_WORKER_CONCURRENCY or 4)')
+        parser.add_argument('--pool', choices=['thread', 'process'],
+                            default=getattr(settings, 'TASK_WORKER_POOL', 'thread'),
+                            help='thread for I/O-bound tasks, process for CPU-bound ones such as image processing (default: thread)')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds between polls when idle (default: 1)')
+        parser.add_argument('--task', action='append', dest='tasks',
+                            help='Only run this task name (repeatable; default: all registered tasks)')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no task is due instead of polling (for cron and tests)')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1')
+        autodiscover()
+        names = options['tasks'] or sorted(registry)
+        unknown = set(names) - set(registry)
+        if unknown:
+            raise CommandError(f"Unknown tasks: {', '.join(sorted(unknown))}")
+
+        self.stopping = False
+        if not options['burst']:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        if options['pool'] == 'process':
+            # Children must not share the parent's database connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=concurrency, initializer=init_process)
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='task-worker')
+
+        pool_label = 'threads' if options['pool'] == 'thread' else 'processes'
+        self.stdout.write(f"Running {len(names)} task types on {concurrency} {pool_label}")
+        completed = {}
+        in_flight = set()
+        next_periodic_check = 0
+        try:
+            while not self.stopping:
+                if time.monotonic() >= next_periodic_check:
+                    ensure_periodic_tasks(names)
+                    next_periodic_check = time.monotonic() + PERIODIC_CHECK_INTERVAL
+
+                claimed = []
+                free = concurrency - len(in_flight)
+                if free > 0:
+                    claimed = claim_tasks(free, names)
+                    for task_row in claimed:
+                        in_flight.add(executor.submit(execute_task_by_id, task_row.pk))
+
+                if not in_flight:
+                    if options['burst'] and not claimed:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                done, in_flight = wait(in_flight, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    status = future.exception() and 'crashed' or future.result()
+                    completed[status] = completed.get(status, 0) + 1
+        finally:
+            # Let running tasks finish; unfinished ones would be retried after their lease anyway
+            for future in in_flight:
+                try:
+                    status = future.result()
+                except Exception:
+                    status = 'crashed'
+                completed[status] = completed.get(status, 0) + 1
+            executor.shutdown(wait=True)
+
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(completed.items())) or 'no tasks'
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped: {summary}'))
+
+    def stop(self, signum, frame):
+        self.stdout.write('Stopping after the running tasks finish...')
+        self.stopping = True
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from core.mail import DEFAULT_BATCH_SIZE, claim_batch, get_breaker, mail_stats, send_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox in batches, one SMTP connection per batch, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                            help='Emails sent per connection (default: EMAIL_OUTBOX_BATCH_SIZE or 50)')
+        parser.add_argument('--loop', action='store_true', help='Keep running and poll for new emails')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop (default: 5)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        total_sent = total_failed = 0
+        try:
+            while True:
+                messages = claim_batch(batch_size)
+                if messages:
+                    sent, failed = send_batch(messages)
+                    total_sent += sent
+                    total_failed += failed
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'Sent {sent}, failed {failed}')
+                    if get_breaker().state() != 'open':
+                        continue
+                    # Provider down: the batch was deferred, don't claim the rest just to defer it too
+                    self.stderr.write(f"Email provider circuit is open until {mail_stats()['breaker_retry_at']}")
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed attempts'))
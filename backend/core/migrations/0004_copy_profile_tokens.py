@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def copy_profile_tokens(apps, schema_editor):
+    """Carry outstanding OTPs and reset tokens over from UserProfile, so links already sent keep working"""
+    from core.tokens import EMAIL_OTP, PASSWORD_RESET, hash_token, token_lifetime
+
+    UserProfile = apps.get_model('portfolio', 'UserProfile')
+    VerificationToken = apps.get_model('core', 'VerificationToken')
+    now = timezone.now()
+    tokens = []
+    rows = (UserProfile.objects
+            .exclude(email_verification_token__isnull=True)
+            .exclude(email_verification_token='')
+            .values_list('user_id', 'email_verification_token', 'email_verification_otp_expires')
+            .iterator(chunk_size=1000))
+    for user_id, token, otp_expires in rows:
+        if len(token) == 6 and token.isdigit():
+            # OTPs always had an expiry; one without is from before 0010 and long stale
+            tokens.append(VerificationToken(
+                user_id=user_id, purpose=EMAIL_OTP, token_hash=hash_token(EMAIL_OTP, token, user_id),
+                expires_at=otp_expires or now,
+            ))
+        else:
+            # Reset tokens never expired before; give them the standard lifetime from now
+            tokens.append(VerificationToken(
+                user_id=user_id, purpose=PASSWORD_RESET, token_hash=hash_token(PASSWORD_RESET, token),
+                expires_at=now + token_lifetime(PASSWORD_RESET),
+            ))
+    VerificationToken.objects.bulk_create(tokens, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_verificationtoken'),
+        ('portfolio', '0017_owner_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_profile_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_copy_profile_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificationtoken',
+            name='failed_attempts',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Wrong codes entered; the token is deleted after EMAIL_OTP_MAX_ATTEMPTS'),
+        ),
+    ]
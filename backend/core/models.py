@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 @receiver(post_save, sender=User)
@@ -10,3 +11,101 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         from portfolio.models import UserProfile
         UserProfile.objects.get_or_create(user=instance)
+
+
+class EmailOutbox(models.Model):
+    """An outgoing email, queued by core.mail.queue_mail() and delivered by the send_queued_mail command"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list, help_text='Recipient addresses')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # Next time a worker may pick the message up; also the lease while a worker is sending it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Queued Email'
+        verbose_name_plural = 'Email Outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+
+class Task(models.Model):
+    """A background task run by the runworker command (see core/taskqueue.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=200, help_text='Registered task name, e.g. portfolio.tasks.rebuild_portfolio_snapshot')
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Queued tasks with the same key are coalesced into one
+    key = models.CharField(max_length=200, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # When a queued task becomes due; while running, when its lease (visibility timeout) expires
+    run_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='core_task_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status='queued'), name='core_task_unique_queued_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class VerificationToken(models.Model):
+    """
+    A one-time secret sent to a user: an email verification OTP or a password reset token.
+
+    Only a keyed hash of the secret is stored (see core.tokens), so the table can be
+    read without exposing usable codes, and reset links are found through its unique index.
+    """
+    PURPOSE_CHOICES = [
+        ('email_otp', 'Email verification code'),
+        ('password_reset', 'Password reset'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='verification_tokens')
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    token_hash = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField()
+    failed_attempts = models.PositiveSmallIntegerField(default=0, help_text='Wrong codes entered; the token is deleted after EMAIL_OTP_MAX_ATTEMPTS')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'purpose'], name='core_token_user_purpose_idx'),
+            models.Index(fields=['expires_at'], name='core_token_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_purpose_display()} for user ID {self.user_id}"
@@ -0,0 +1,254 @@
+"""
+Per-endpoint SQL query budgets.
+
+Views declare how many queries (and optionally how much SQL time) a single
+request may spend:
+
+    @query_budget(3)
+    @api_view(['GET'])
+    def my_view(request): ...
+
+    class MyViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+        query_budgets = {'list': 2, 'retrieve': 2, ...}
+
+QueryBudgetMiddleware records the SQL of every request with a budget and logs
+(or, with QUERY_BUDGET_STRICT = True, raises) when it is exceeded, adding
+X-Query-Count / X-Query-Time-Ms headers in DEBUG. QueryBudgetTestMixin makes
+the same check inside tests so regressions such as N+1 loops fail CI instead
+of being found in production. In tests, reports group the offending queries
+by the project call site that issued them; on live requests the middleware
+only records SQL and timings (walking the stack on every query is too costly)
+and groups them by statement instead.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connection
+from django.urls import resolve
+import logging
+import os
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request runs more queries (or SQL time) than its budget allows"""
+
+
+class QueryBudget:
+    def __init__(self, max_queries, max_time_ms=None):
+        self.max_queries = max_queries
+        self.max_time_ms = max_time_ms
+
+    def __repr__(self):
+        if self.max_time_ms is None:
+            return f'QueryBudget({self.max_queries})'
+        return f'QueryBudget({self.max_queries}, max_time_ms={self.max_time_ms})'
+
+
+def query_budget(max_queries, max_time_ms=None):
+    """Declare the query budget of a function-based view (apply above @api_view)"""
+    def decorator(view_func):
+        view_func.query_budget = QueryBudget(max_queries, max_time_ms)
+        return view_func
+    return decorator
+
+
+class QueryBudgetMixin:
+    """
+    ViewSet mixin that exposes per-action budgets.
+
+    query_budgets maps action names (list, retrieve, create, update,
+    partial_update, destroy and custom @action names) to a query count or a
+    QueryBudget.
+    """
+    query_budgets = {}
+
+    @classmethod
+    def get_query_budget(cls, action):
+        budget = cls.query_budgets.get(action)
+        if budget is None or isinstance(budget, QueryBudget):
+            return budget
+        return QueryBudget(budget)
+
+
+def get_view_budget(view_func, method):
+    """Find the budget declared for a resolved view function and HTTP method"""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is not None:
+        return budget
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if view_class is not None and actions and hasattr(view_class, 'get_query_budget'):
+        action = actions.get(method.lower())
+        if action:
+            return view_class.get_query_budget(action)
+    return None
+
+
+def _call_site():
+    """The innermost stack frame that belongs to project code rather than Django or DRF"""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = os.path.abspath(frame.filename)
+        if filename == _THIS_FILE or not filename.startswith(_PROJECT_ROOT):
+            continue
+        if 'site-packages' in filename:
+            continue
+        return f'{os.path.relpath(filename, _PROJECT_ROOT)}:{frame.lineno} in {frame.name}'
+    return '<framework>'
+
+
+class QueryRecorder:
+    """Database execute wrapper that records each query's SQL and duration, and with `call_sites` its call site"""
+
+    def __init__(self, call_sites=False):
+        self.call_sites = call_sites
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            query = {'sql': sql, 'time_ms': (time.perf_counter() - start) * 1000}
+            if self.call_sites:
+                query['call_site'] = _call_site()
+            self.queries.append(query)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def time_ms(self):
+        return sum(query['time_ms'] for query in self.queries)
+
+    def violations(self, budget):
+        problems = []
+        if budget.max_queries is not None and self.count > budget.max_queries:
+            problems.append(f'{self.count} queries (budget {budget.max_queries})')
+        if budget.max_time_ms is not None and self.time_ms > budget.max_time_ms:
+            problems.append(f'{self.time_ms:.1f}ms of SQL (budget {budget.max_time_ms}ms)')
+        return problems
+
+    def report(self):
+        """Queries grouped by call site (or by statement without call sites), largest groups first"""
+        groups = OrderedDict()
+        for query in self.queries:
+            groups.setdefault(query.get('call_site', query['sql']), []).append(query)
+        lines = []
+        for key, queries in sorted(groups.items(), key=lambda item: -len(item[1])):
+            total = sum(query['time_ms'] for query in queries)
+            if not self.call_sites:
+                # Parameterized SQL: an N+1 loop shows up as one statement run many times
+                lines.append(f'  {len(queries)}x, {total:.1f}ms: {key[:200]}')
+                continue
+            lines.append(f'  {key}: {len(queries)} queries, {total:.1f}ms')
+            for query in queries[:5]:
+                lines.append(f'      {query["sql"][:200]}')
+            if len(queries) > 5:
+                lines.append(f'      ... {len(queries) - 5} more')
+        return '\n'.join(lines)
+
+
+def check_budget(label, budget, recorder):
+    """Raise QueryBudgetExceeded with a grouped report when the recorder is over budget"""
+    problems = recorder.violations(budget)
+    if problems:
+        raise QueryBudgetExceeded(
+            f'{label} exceeded its query budget: {", ".join(problems)}\n{recorder.report()}'
+        )
+
+
+class QueryBudgetMiddleware:
+    """
+    Measure SQL per request and flag endpoints that go over their declared budget.
+
+    Works in sync and async stacks, so it doesn't force async views back onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        match, budget = self.match_budget(request)
+        if budget is None:
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.check(request, match, budget, recorder, response)
+
+    async def __acall__(self, request):
+        match, budget = self.match_budget(request)
+        if budget is None:
+            return await self.get_response(request)
+
+        # Database connections are per thread: the async ORM runs its queries on the
+        # request's sync thread, so the recorder has to wrap that thread's connection
+        recorder = QueryRecorder()
+        await sync_to_async(recorder.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.__exit__)(None, None, None)
+        return self.check(request, match, budget, recorder, response)
+
+    def match_budget(self, request):
+        try:
+            match = resolve(request.path_info)
+        except Exception:
+            return None, None
+        return match, get_view_budget(match.func, request.method)
+
+    def check(self, request, match, budget, recorder, response):
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.time_ms:.1f}'
+
+        label = f'{request.method} {request.path_info} ({match.view_name})'
+        try:
+            check_budget(label, budget, recorder)
+        except QueryBudgetExceeded as e:
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise
+            logger.warning(str(e))
+        return response
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin: run a request and fail if its endpoint exceeds its declared budget"""
+
+    def assertWithinQueryBudget(self, method, path, client=None, **kwargs):
+        client = client or self.client
+        match = resolve(path.split('?')[0])
+        budget = get_view_budget(match.func, method)
+        if budget is None:
+            self.fail(f'{method} {path} ({match.view_name}) has no declared query budget')
+        with QueryRecorder(call_sites=True) as recorder:
+            response = getattr(client, method.lower())(path, **kwargs)
+        try:
+            check_budget(f'{method} {path} ({match.view_name})', budget, recorder)
+        except QueryBudgetExceeded as e:
+            self.fail(str(e))
+        return response
@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.settings import api_settings
+from portfolio.uploads import BoundedImageField
 import secrets
 
 User = get_user_model()
@@ -145,19 +146,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         
         # Create or get UserProfile (signal might have already created it)
         from portfolio.models import UserProfile
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        profile, created = UserProfile.objects.get_or_create(user=user)
-        
-        # Generate 6-digit OTP
-        import random
-        otp = str(random.randint(100000, 999999))
-        
-        # Set OTP and expiration (15 minutes from now)
-        profile.email_verification_token = otp
-        profile.email_verification_otp_expires = timezone.now() + timedelta(minutes=15)
-        profile.save(update_fields=['email_verification_token', 'email_verification_otp_expires'])
+        UserProfile.objects.get_or_create(user=user)
         
         return user
 
@@ -167,13 +156,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
     first_name = serializers.CharField(source='user.first_name', read_only=True)
     last_name = serializers.CharField(source='user.last_name', read_only=True)
-    banner_image = serializers.ImageField(required=False, allow_null=True)
+    banner_image = BoundedImageField(required=False, allow_null=True)
 
     class Meta:
         model = None  # Will be set dynamically
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'username_slug', 
                   'portfolio_published', 'is_approved', 'email_verified', 'banner_image',
-                  'created_at', 'updated_at')
+                  'message_digest', 'created_at', 'updated_at')
         read_only_fields = ('id', 'is_approved', 'email_verified', 'created_at', 'updated_at')
 
     def __init__(self, *args, **kwargs):
@@ -183,15 +172,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        if representation.get('banner_image'):
-            request = self.context.get('request')
-            if request:
-                image_path = representation['banner_image']
-                if not image_path.startswith('http'):
-                    if not image_path.startswith('/'):
-                        image_path = f'/media/{image_path}'
-                    representation['banner_image'] = request.build_absolute_uri(image_path)
-        return representation
+        from portfolio.images import add_image_derivatives
+        return add_image_derivatives(representation, instance, self.context.get('request'))
 
 
 class PasswordResetRequestSerializer(serializers.Serializer):
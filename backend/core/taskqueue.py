@@ -0,0 +1,239 @@
+"""
+Database-backed background tasks.
+
+Work that doesn't have to happen inside a request (image variants, snapshot
+rebuilds, notification emails, cleanups) is declared as a task:
+
+    from core.taskqueue import task
+
+    @task(max_attempts=5, timeout=600)
+    def rebuild_portfolio_snapshot(user_id): ...
+
+    @task(every=timedelta(hours=1))
+    def purge_expired_uploads(): ...
+
+    rebuild_portfolio_snapshot.delay(user.id)
+    rebuild_portfolio_snapshot.schedule(args=[user.id], key=f'snapshot:{user.id}', countdown=5)
+
+Tasks live in `<app>/tasks.py` modules, which `python manage.py runworker`
+imports on start. delay()/schedule() insert a Task row in the current
+transaction, so a task exists exactly when the change that caused it was
+committed. Queued rows with the same `key` are coalesced into one.
+
+Delivery is at least once: a worker claims due rows (a conditional UPDATE per
+row, so concurrent workers never share a claim) and leases them for the task's
+timeout (TASK_VISIBILITY_TIMEOUT, 300 seconds by default). A task whose worker
+dies becomes due again when the lease expires. Failures are retried with
+exponential backoff from `retry_delay` until `max_attempts` is reached, so
+tasks must be safe to run more than once. Periodic tasks (`every=`) are queued
+again after each run.
+
+With TASK_QUEUE_ENABLED = False (the default) no worker is needed: delay()
+and schedule() run the task in-process once the transaction commits, which is
+what the code did before the queue existed. Periodic tasks only run under
+runworker.
+"""
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+from datetime import timedelta
+import logging
+import traceback
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VISIBILITY_TIMEOUT = 300
+
+# name -> TaskDefinition
+registry = {}
+
+
+def queue_enabled():
+    return getattr(settings, 'TASK_QUEUE_ENABLED', False)
+
+
+class TaskDefinition:
+    """A registered task; calling it runs the function directly"""
+
+    def __init__(self, func, name, max_attempts, retry_delay, timeout, every):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.every = every
+        self.__doc__ = func.__doc__
+        self.__wrapped__ = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    @property
+    def visibility_timeout(self):
+        return self.timeout or getattr(settings, 'TASK_VISIBILITY_TIMEOUT', DEFAULT_VISIBILITY_TIMEOUT)
+
+    def delay(self, *args, **kwargs):
+        """Queue the task with these arguments (JSON-serializable); see schedule()"""
+        return self.schedule(args=args, kwargs=kwargs)
+
+    def schedule(self, args=(), kwargs=None, key=None, run_at=None, countdown=None):
+        """
+        Queue the task to run at `run_at` (or `countdown` seconds from now).
+
+        Returns the Task row, or the already-queued row with the same `key`.
+        Without the queue the task runs in-process on commit and None is returned.
+        """
+        args, kwargs = list(args), dict(kwargs or {})
+        if not queue_enabled():
+            transaction.on_commit(lambda: self.run_safely(args, kwargs))
+            return None
+        return self.enqueue(args, kwargs, key=key, run_at=run_at, countdown=countdown)
+
+    def enqueue(self, args=(), kwargs=None, key=None, run_at=None, countdown=None):
+        """Insert the Task row for schedule(), whether or not the queue is enabled"""
+        args, kwargs = list(args), dict(kwargs or {})
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=countdown or 0)
+        values = {
+            'name': self.name, 'args': args, 'kwargs': kwargs, 'key': key,
+            'max_attempts': self.max_attempts, 'run_at': run_at,
+        }
+        if key is None:
+            return Task.objects.create(**values)
+        try:
+            with transaction.atomic():
+                return Task.objects.create(**values)
+        except IntegrityError:
+            # Coalesced into the queued task with this key
+            return Task.objects.filter(key=key, status='queued').first()
+
+    def run_safely(self, args, kwargs):
+        try:
+            self.func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error running task {self.name}: {str(e)}", exc_info=True)
+
+
+def task(func=None, *, name=None, max_attempts=3, retry_delay=30, timeout=None, every=None):
+    """
+    Register a function as a background task.
+
+    max_attempts - runs (including ones cut short by a dying worker) before the task is marked failed
+    retry_delay  - seconds before the first retry, doubled for each further one
+    timeout      - lease in seconds; a task still running after it may be started again elsewhere
+    every        - timedelta; makes this a periodic task, queued again after each run
+    """
+    def decorator(func):
+        definition = TaskDefinition(
+            func, name or f'{func.__module__}.{func.__name__}', max_attempts, retry_delay, timeout, every,
+        )
+        registry[definition.name] = definition
+        return definition
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def autodiscover():
+    """Import every installed app's tasks module so its tasks are registered"""
+    autodiscover_modules('tasks')
+
+
+def periodic_key(definition):
+    return f'periodic:{definition.name}'
+
+
+def ensure_periodic_tasks(names=None):
+    """Queue the next run of each periodic task that has none queued or running"""
+    for definition in registry.values():
+        if not definition.every or (names is not None and definition.name not in names):
+            continue
+        key = periodic_key(definition)
+        if not Task.objects.filter(key=key, status__in=['queued', 'running']).exists():
+            definition.enqueue(key=key)
+
+
+def claim_tasks(limit, names=None):
+    """
+    Lease up to `limit` due tasks to this worker and return them.
+
+    Due are queued tasks whose run_at has passed, and running tasks whose
+    lease expired (their worker died or overran the timeout). Each task is
+    claimed with a conditional UPDATE on its attempt count, so when two
+    workers race for a task exactly one of them gets it, without holding
+    locks across statements (which SQLite can't upgrade under concurrency).
+    """
+    names = list(registry) if names is None else list(names)
+    now = timezone.now()
+    due = Task.objects.filter(status__in=['queued', 'running'], run_at__lte=now, name__in=names)
+    candidates = due.order_by('run_at', 'pk').values_list('pk', 'name', 'attempts')[:limit * 2]
+    claimed = []
+    for pk, name, attempts in candidates:
+        if len(claimed) >= limit:
+            break
+        lease = timedelta(seconds=registry[name].visibility_timeout)
+        if due.filter(pk=pk, attempts=attempts).update(status='running', attempts=attempts + 1, run_at=now + lease):
+            claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_at', 'pk'))
+
+
+def finish(task_row, **values):
+    """Record a task's outcome unless another worker has claimed it since (its lease expired)"""
+    return Task.objects.filter(pk=task_row.pk, status='running', attempts=task_row.attempts).update(**values)
+
+
+def execute_task(task_row):
+    """Run a claimed task and record the outcome; returns the final status"""
+    definition = registry.get(task_row.name)
+    now = timezone.now()
+    if definition is None:
+        finish(task_row, status='failed', last_error=f'Unknown task {task_row.name}', finished_at=now)
+        return 'failed'
+    if task_row.attempts > task_row.max_attempts:
+        # Claimed again after its lease expired on the last attempt
+        status = 'failed'
+        finish(task_row, status=status, last_error=task_row.last_error or 'Lease expired on the final attempt', finished_at=now)
+    else:
+        try:
+            definition.func(*task_row.args, **task_row.kwargs)
+        except Exception as e:
+            error = traceback.format_exc()
+            if task_row.attempts < task_row.max_attempts:
+                status = 'queued'
+                delay = definition.retry_delay * 2 ** (task_row.attempts - 1)
+                logger.warning(f"Task {task_row.name} ({task_row.pk}) failed on attempt {task_row.attempts}, retrying in {delay}s: {str(e)}")
+                try:
+                    with transaction.atomic():
+                        finish(task_row, status=status, last_error=error, run_at=timezone.now() + timedelta(seconds=delay))
+                except IntegrityError:
+                    # A task with the same key was queued meanwhile and will do the same work
+                    status = 'failed'
+                    finish(task_row, status=status, finished_at=timezone.now(),
+                           last_error=f'{error}\nRetry coalesced into the queued task with key {task_row.key}')
+            else:
+                status = 'failed'
+                logger.error(f"Task {task_row.name} ({task_row.pk}) failed after {task_row.attempts} attempts: {str(e)}")
+                finish(task_row, status=status, last_error=error, finished_at=timezone.now())
+        else:
+            status = 'done'
+            finish(task_row, status=status, finished_at=timezone.now())
+    if definition.every and status != 'queued':
+        definition.enqueue(key=periodic_key(definition), countdown=definition.every.total_seconds())
+    return status
+
+
+def execute_task_by_id(pk):
+    """Pool entry point: load and run a claimed task, then release this thread's/process's connection"""
+    from django.db import close_old_connections
+    try:
+        task_row = Task.objects.get(pk=pk)
+        return execute_task(task_row)
+    finally:
+        close_old_connections()
+        connection.close()
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import time
+
+from .mail import claim_batch, get_breaker, get_lease, send_batch
+from .models import Task
+from .taskqueue import task
+
+logger = logging.getLogger(__name__)
+
+# A delivery run stops claiming batches after this many seconds or batches
+DELIVERY_RUN_SECONDS = 5 * 60
+DEFAULT_BATCHES_PER_RUN = 20
+
+
+# send_batch() never runs past a batch's lease, so a run always ends within this timeout
+# and a second worker can't start draining while the first is still sending
+@task(every=timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_POLL_INTERVAL', 30)), max_attempts=1,
+      timeout=DELIVERY_RUN_SECONDS + get_lease() + 60)
+def deliver_queued_mail():
+    """Drain the email outbox, so runworker can replace a separate send_queued_mail process"""
+    started = time.monotonic()
+    for _ in range(getattr(settings, 'EMAIL_OUTBOX_BATCHES_PER_RUN', DEFAULT_BATCHES_PER_RUN)):
+        if time.monotonic() - started > DELIVERY_RUN_SECONDS:
+            break
+        messages = claim_batch()
+        if not messages:
+            break
+        send_batch(messages)
+        if get_breaker().state() == 'open':
+            # The batch was deferred; the rest can wait for the next run
+            break
+
+
+@task(every=timedelta(days=1), max_attempts=1)
+def purge_finished_tasks():
+    """Delete finished tasks older than TASK_RETENTION_DAYS (default 7)"""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'TASK_RETENTION_DAYS', 7))
+    deleted, _ = Task.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    if deleted:
+        logger.info(f"Purged {deleted} finished tasks")
+
+
+@task(every=timedelta(hours=1), max_attempts=1)
+def purge_expired_tokens():
+    """Delete expired verification codes and reset tokens (see core/tokens.py)"""
+    from .tokens import purge_expired_tokens as purge
+    purged = purge()
+    if purged:
+        logger.info(f"Purged {purged} expired verification tokens")
@@ -1,3 +1,632 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, TestCase, override_settings
+import gzip
+import io
+import json
+import re
+import time
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from core.mail import send_batch, claim_batch, mail_stats
+from core.models import EmailOutbox, Task, VerificationToken
+from core.tokens import check_email_otp, consume_password_reset_token, issue_email_otp, issue_password_reset_token
+from core.taskqueue import task, claim_tasks, execute_task, ensure_periodic_tasks
+from core.query_budget import QueryBudget, QueryBudgetExceeded, QueryBudgetTestMixin, QueryRecorder, check_budget
+from portfolio.models import AboutMe, Project, Skill, ContactMessage, UserProfile, PortfolioSnapshot
+from portfolio.resolver import slug_resolver
+from portfolio.snapshots import rebuild_snapshot
 
-# Create your tests here.
+User = get_user_model()
+
+
+def auth_header(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+class QueryBudgetTests(TestCase):
+    def test_report_groups_queries_by_call_site(self):
+        with QueryRecorder(call_sites=True) as recorder:
+            for _ in range(3):
+                list(User.objects.all())
+        self.assertEqual(recorder.count, 3)
+        with self.assertRaises(QueryBudgetExceeded) as ctx:
+            check_budget('loop', QueryBudget(1), recorder)
+        self.assertIn('3 queries (budget 1)', str(ctx.exception))
+        self.assertIn('core/tests.py', str(ctx.exception))
+        self.assertIn('3 queries', recorder.report())
+
+    def test_live_recorder_skips_call_sites(self):
+        with mock.patch('core.query_budget.traceback.extract_stack') as extract_stack:
+            with QueryRecorder() as recorder:
+                for _ in range(3):
+                    list(User.objects.all())
+        extract_stack.assert_not_called()
+        self.assertEqual(recorder.count, 3)
+        self.assertIn('3x', recorder.report())
+
+
+class CoreEndpointQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password123', is_staff=True)
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        for i in range(5):
+            User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password123')
+        profile = cls.owner.profile
+        profile.portfolio_published = True
+        profile.save()
+        AboutMe.objects.create(user=cls.owner, name='Owner', title='Developer', bio='Bio')
+        for i in range(5):
+            Project.objects.create(user=cls.owner, title=f'Project {i}', description='Description')
+            Skill.objects.create(user=cls.owner, name=f'Skill {i}', level='Advanced')
+            ContactMessage.objects.create(user=cls.owner, name='Visitor', email='v@example.com', message='Hi')
+        # Signals rebuild snapshots on commit, which never happens inside a TestCase
+        rebuild_snapshot(cls.owner.id)
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        slug_resolver.clear_local()
+
+    def test_portfolio_by_username(self):
+        response = self.assertWithinQueryBudget('GET', '/api/v1/portfolio/owner/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['projects']), 5)
+
+    def test_portfolio_by_username_precompressed(self):
+        path = '/api/v1/portfolio/owner/'
+        identity = self.client.get(path)
+        self.assertNotIn('Content-Encoding', identity)
+        self.assertIn('Accept-Encoding', identity['Vary'])
+
+        with mock.patch('portfolio.compression.compress_variants') as compress:
+            response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            compress.assert_not_called()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertNotEqual(response['ETag'], identity['ETag'])
+        self.assertEqual(response['ETag'], identity['ETag'][:-1] + '-gzip"')
+        self.assertEqual(gzip.decompress(response.content), identity.content)
+
+        # Every encoding's validator revalidates, and the 304 echoes the one the client holds
+        for etag in (identity['ETag'], response['ETag']):
+            revalidated = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated['ETag'], etag)
+
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_create_message_for_user(self):
+        response = self.assertWithinQueryBudget(
+            'POST', '/api/v1/auth/portfolio/owner/message/',
+            data={'name': 'Visitor', 'email': 'v@example.com', 'message': 'Hello'},
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_list_users(self):
+        response = self.assertWithinQueryBudget('GET', '/api/v1/auth/users/', **auth_header(self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_users'], 7)
+
+    def test_user_profile_detail(self):
+        response = self.assertWithinQueryBudget(
+            'GET', f'/api/v1/auth/users/{self.owner.id}/profile/', **auth_header(self.staff)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['messages']), 5)
+
+    def test_system_overview(self):
+        response = self.assertWithinQueryBudget('GET', '/api/v1/auth/system/overview/', **auth_header(self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_users'], 7)
+        self.assertEqual(response.data['new_messages'], 5)
+
+    def test_portfolios_by_slugs(self):
+        for i in range(3):
+            profile = User.objects.get(username=f'user{i}').profile
+            profile.portfolio_published = True
+            profile.save()
+            Project.objects.create(user=profile.user, title='Project', description='Description')
+        # user3 is unpublished, 'ghost' doesn't exist; user0..2 have no snapshot yet
+        path = '/api/v1/portfolios/?slugs=owner,user0,user1,user2,user3,ghost'
+        response = self.assertWithinQueryBudget('GET', path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [portfolio['profile']['username_slug'] for portfolio in json.loads(response.content)['results']],
+            ['owner', 'user0', 'user1', 'user2'],
+        )
+        self.assertEqual(json.loads(response.content)['not_found'], ['user3', 'ghost'])
+        response = self.assertWithinQueryBudget('GET', path, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class PortfolioETagTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        slug_resolver.clear_local()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.owner.profile
+            profile.portfolio_published = True
+            profile.save()
+            self.project = Project.objects.create(user=self.owner, title='Project', description='Description')
+
+    def test_not_modified_until_edited(self):
+        path = '/api/v1/portfolio/owner/'
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.title = 'Renamed'
+            self.project.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['projects'][0]['title'], 'Renamed')
+
+
+class CountingBackend(locmem.EmailBackend):
+    """locmem backend that counts the connections it opens and can fail on chosen recipients"""
+    opened = 0
+    fail_for = ()
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any(address in self.fail_for for message in messages for address in message.to):
+            raise ConnectionError('SMTP server stalled')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.fail_for = ()
+        cache.clear()
+        User.objects.create_user('owner', 'owner@example.com', 'password123')
+
+    def test_request_queues_and_worker_delivers(self):
+        response = APIClient().post('/api/v1/auth/password-reset/', {'email': 'owner@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # Nothing is sent inside the request
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual((queued.status, queued.to), ('pending', ['owner@example.com']))
+
+        call_command('send_queued_mail', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Password Reset - Portfy')
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('sent', 1))
+        self.assertIsNotNone(queued.sent_at)
+
+    @override_settings(EMAIL_BACKEND='core.tests.CountingBackend')
+    def test_batch_reuses_one_connection_and_backs_off_failures(self):
+        for address in ['a@example.com', 'b@example.com', 'c@example.com']:
+            EmailOutbox.objects.create(subject='Hi', body='Body', from_email='x@example.com', to=[address])
+        CountingBackend.fail_for = ('b@example.com',)
+
+        sent, failed = send_batch(claim_batch(10))
+        self.assertEqual((sent, failed), (2, 1))
+        # One connection for the batch, plus a fresh one after the failure
+        self.assertEqual(CountingBackend.opened, 2)
+        failed_mail = EmailOutbox.objects.get(to=['b@example.com'])
+        self.assertEqual((failed_mail.status, failed_mail.attempts), ('pending', 1))
+        self.assertIn('stalled', failed_mail.last_error)
+        self.assertGreater(failed_mail.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(claim_batch(10), [])
+
+        EmailOutbox.objects.filter(pk=failed_mail.pk).update(next_attempt_at=timezone.now())
+        send_batch(claim_batch(10))
+        failed_mail.refresh_from_db()
+        self.assertEqual((failed_mail.status, failed_mail.attempts), ('failed', 2))
+
+    @override_settings(EMAIL_BACKEND='core.tests.CountingBackend', EMAIL_CIRCUIT_FAILURE_THRESHOLD=2,
+                       EMAIL_CIRCUIT_RESET_TIMEOUT=60, EMAIL_OUTBOX_MAX_ATTEMPTS=5)
+    def test_circuit_breaker_defers_during_outage(self):
+        addresses = [f'user{i}@example.com' for i in range(5)]
+        for address in addresses:
+            EmailOutbox.objects.create(subject='Hi', body='Body', from_email='x@example.com', to=[address])
+        CountingBackend.fail_for = addresses
+
+        # Two provider failures open the breaker; the rest of the batch is deferred untried
+        self.assertEqual(send_batch(claim_batch(10)), (0, 2))
+        self.assertEqual(mail_stats()['breaker_state'], 'open')
+        self.assertEqual(sorted(EmailOutbox.objects.values_list('attempts', flat=True)), [0, 0, 0, 1, 1])
+        # Messages claimed while it's open are deferred without spending an attempt
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        opened = CountingBackend.opened
+        self.assertEqual(send_batch(claim_batch(10)), (0, 0))
+        self.assertEqual(CountingBackend.opened, opened)
+        self.assertEqual(sorted(EmailOutbox.objects.values_list('attempts', flat=True)), [0, 0, 0, 1, 1])
+        self.assertEqual(claim_batch(10), [])
+
+        # After the reset timeout one probe goes through; its success closes the breaker
+        CountingBackend.fail_for = ()
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        cache.set('circuit:smtp:opened_until', time.time() - 1, None)
+        self.assertEqual(mail_stats()['breaker_state'], 'half-open')
+        self.assertEqual(send_batch(claim_batch(10)), (5, 0))
+        stats = mail_stats()
+        self.assertEqual(stats['breaker_state'], 'closed')
+        self.assertEqual((stats['attempts'], stats['sent'], stats['failures'], stats['deferred'], stats['breaker_opened']),
+                         (7, 5, 2, 8, 1))
+
+    @override_settings(EMAIL_BACKEND='core.tests.CountingBackend', EMAIL_CIRCUIT_FAILURE_THRESHOLD=1)
+    def test_rejected_message_does_not_trip_breaker(self):
+        import smtplib
+        EmailOutbox.objects.create(subject='Hi', body='Body', from_email='x@example.com', to=['gone@example.com'])
+        with mock.patch.object(CountingBackend, 'send_messages',
+                               side_effect=smtplib.SMTPRecipientsRefused({'gone@example.com': (550, b'No such user')})):
+            self.assertEqual(send_batch(claim_batch(10)), (0, 1))
+        self.assertEqual(mail_stats()['breaker_state'], 'closed')
+
+
+@override_settings(EMAIL_BACKEND='core.tests.CountingBackend')
+class OutboxLeaseTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.fail_for = ()
+        cache.clear()
+
+    def queue(self, count):
+        from core.mail import queue_mass_mail
+        queue_mass_mail([
+            {'subject': 'Hi', 'message': 'Hello', 'recipient_list': [f'user{i}@example.com']} for i in range(count)
+        ])
+
+    def test_batch_releases_messages_near_the_end_of_its_lease(self):
+        from core.mail import message_time_limit
+        self.queue(3)
+        messages = claim_batch(10)
+        # The lease of the last one would run out while it is being sent
+        almost_over = timezone.now() + timedelta(seconds=message_time_limit() / 2)
+        EmailOutbox.objects.filter(pk=messages[-1].pk).update(next_attempt_at=almost_over)
+        messages[-1].next_attempt_at = almost_over
+        self.assertEqual(send_batch(messages), (2, 0))
+        released = EmailOutbox.objects.get(pk=messages[-1].pk)
+        self.assertEqual((released.status, released.attempts), ('pending', 0))
+        self.assertLessEqual(released.next_attempt_at, timezone.now())
+
+    @override_settings(EMAIL_OUTBOX_BATCH_SIZE=2, EMAIL_OUTBOX_BATCHES_PER_RUN=2)
+    def test_delivery_run_is_capped(self):
+        from core.tasks import deliver_queued_mail
+        from core.mail import get_lease
+        self.assertGreater(deliver_queued_mail.timeout, get_lease())
+        self.queue(5)
+        deliver_queued_mail()
+        self.assertEqual(EmailOutbox.objects.filter(status='sent').count(), 4)
+        self.assertEqual(EmailOutbox.objects.filter(status='pending').count(), 1)
+
+
+calls = []
+
+
+@task(name='core.tests.record', retry_delay=60, max_attempts=2)
+def record_call(value):
+    calls.append(value)
+    if value == 'flaky' and calls.count('flaky') == 1:
+        raise RuntimeError('first attempt fails')
+
+
+@task(name='core.tests.tick', every=timedelta(minutes=5))
+def tick():
+    calls.append('tick')
+
+
+@override_settings(TASK_QUEUE_ENABLED=True)
+class TaskQueueTests(TestCase):
+    names = ['core.tests.record', 'core.tests.tick']
+
+    def setUp(self):
+        calls.clear()
+
+    def make_due(self, row):
+        Task.objects.filter(pk=row.pk).update(run_at=timezone.now() - timedelta(seconds=1))
+
+    def test_queued_in_transaction_run_by_worker_and_retried(self):
+        record_call.delay('flaky')
+        self.assertEqual(calls, [])
+        row = Task.objects.get()
+        self.assertEqual((row.status, row.args), ('queued', ['flaky']))
+
+        claimed = claim_tasks(5, self.names)
+        self.assertEqual([t.pk for t in claimed], [row.pk])
+        self.assertEqual(execute_task(claimed[0]), 'queued')
+        row.refresh_from_db()
+        # Retried after the backoff, not immediately
+        self.assertGreater(row.run_at, timezone.now())
+        self.assertIn('first attempt fails', row.last_error)
+        self.assertEqual(claim_tasks(5, self.names), [])
+
+        self.make_due(row)
+        self.assertEqual(execute_task(claim_tasks(5, self.names)[0]), 'done')
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('done', 2))
+        self.assertEqual(calls, ['flaky', 'flaky'])
+
+    def test_expired_lease_is_claimed_again_and_keys_coalesce(self):
+        record_call.schedule(args=['a'], key='same')
+        record_call.schedule(args=['b'], key='same')
+        self.assertEqual(Task.objects.count(), 1)
+
+        first = claim_tasks(5, self.names)[0]
+        # The worker died: once the lease runs out another worker gets the task
+        self.make_due(first)
+        second = claim_tasks(5, self.names)[0]
+        self.assertEqual((second.pk, second.attempts), (first.pk, 2))
+        self.assertEqual(execute_task(second), 'done')
+        # The first worker's late result doesn't overwrite the newer claim
+        self.assertEqual(execute_task(first), 'done')
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    def test_periodic_task_requeues_itself(self):
+        ensure_periodic_tasks(self.names)
+        ensure_periodic_tasks(self.names)
+        self.assertEqual(Task.objects.filter(name='core.tests.tick').count(), 1)
+        execute_task(claim_tasks(5, self.names)[0])
+        self.assertEqual(calls, ['tick'])
+        upcoming = Task.objects.get(name='core.tests.tick', status='queued')
+        self.assertGreater(upcoming.run_at, timezone.now() + timedelta(minutes=4))
+
+    @override_settings(TASK_QUEUE_ENABLED=False)
+    def test_without_queue_tasks_run_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.delay('inline')
+        self.assertEqual(calls, ['inline'])
+        self.assertFalse(Task.objects.exists())
+
+
+class BulkModerationTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'password123', is_staff=True)
+        self.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password123') for i in range(12)]
+        # As after registration: waiting for approval
+        UserProfile.objects.filter(user__in=self.users).update(is_approved=False)
+        self.client = APIClient()
+
+    def bulk(self, endpoint, data):
+        return self.client.patch(f'/api/v1/auth/users/bulk/{endpoint}/', data, format='json', **auth_header(self.staff))
+
+    def test_approval_by_ids_is_set_based_and_reports_each_id(self):
+        UserProfile.objects.filter(user=self.users[0]).update(is_approved=True)
+        ids = [user.id for user in self.users[:3]] + [self.staff.id, 999999]
+        with CaptureQueriesContext(connection) as small:
+            response = self.bulk('approval', {'user_ids': ids, 'is_approved': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], {
+            str(self.users[0].id): 'unchanged', str(self.users[1].id): 'updated', str(self.users[2].id): 'updated',
+            str(self.staff.id): 'skipped', '999999': 'not_found',
+        })
+        self.assertEqual(response.data['counts'], {'unchanged': 1, 'updated': 2, 'skipped': 1, 'not_found': 1})
+        self.assertEqual(sorted(EmailOutbox.objects.values_list('to', flat=True)), [['user1@example.com'], ['user2@example.com']])
+
+        # The query count doesn't grow with the number of users
+        with CaptureQueriesContext(connection) as large:
+            response = self.bulk('approval', {'user_ids': [user.id for user in self.users[3:]], 'is_approved': True})
+        self.assertEqual(response.data['counts'], {'updated': 9})
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        self.assertEqual(EmailOutbox.objects.count(), 11)
+
+    def test_boolean_filters_are_parsed_not_truth_tested(self):
+        UserProfile.objects.filter(user=self.users[0]).update(is_approved=True)
+        response = self.bulk('approval', {'filter': {'is_approved': 'true'}, 'is_approved': False})
+        self.assertEqual(response.data['results'], {str(self.staff.id): 'skipped', str(self.users[0].id): 'updated'})
+        for value in ('0', 'no', 1, None):
+            response = self.bulk('approval', {'filter': {'is_approved': value}, 'is_approved': True})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserProfile.objects.filter(user__in=self.users, is_approved=True).exists())
+
+    def test_approval_rebuilds_published_snapshots(self):
+        user = self.users[0]
+        UserProfile.objects.filter(user=user).update(username_slug='alice', portfolio_published=True)
+        rebuild_snapshot(user.id)
+        self.assertFalse(PortfolioSnapshot.objects.get(user=user).data['profile']['is_approved'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk('approval', {'user_ids': [user.id], 'is_approved': True})
+        self.assertEqual(response.data['counts'], {'updated': 1})
+        self.assertTrue(PortfolioSnapshot.objects.get(user=user).data['profile']['is_approved'])
+
+    @override_settings(BULK_USER_CHUNK_SIZE=5)
+    def test_filter_and_publish(self):
+        response = self.bulk('approval', {'filter': {'is_approved': False, 'joined_after': '2000-01-01'}, 'is_approved': True})
+        self.assertEqual(response.data['counts'], {'updated': 12})
+        response = self.bulk('approval', {'filter': {'bogus': 1}, 'is_approved': True})
+        self.assertEqual(response.status_code, 400)
+
+        UserProfile.objects.filter(user=self.users[0]).update(username_slug='alice')
+        UserProfile.objects.filter(user=self.users[1]).update(username_slug=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk('publish', {'user_ids': [self.users[0].id, self.users[1].id], 'portfolio_published': True})
+        self.assertEqual(response.data['results'], {str(self.users[0].id): 'updated', str(self.users[1].id): 'skipped'})
+        self.assertTrue(PortfolioSnapshot.objects.filter(user=self.users[0], username_slug='alice').exists())
+        self.assertEqual(APIClient().get('/api/v1/portfolio/alice/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bulk('publish', {'user_ids': [self.users[0].id], 'portfolio_published': False})
+        self.assertFalse(PortfolioSnapshot.objects.filter(user=self.users[0]).exists())
+        self.assertEqual(APIClient().get('/api/v1/portfolio/alice/').status_code, 403)
+        self.assertEqual(EmailOutbox.objects.filter(subject__contains='Unpublished').count(), 1)
+
+        response = self.bulk('status', {'user_ids': [self.staff.id, self.users[2].id], 'is_active': False})
+        self.assertEqual(response.data['results'], {str(self.staff.id): 'skipped', str(self.users[2].id): 'updated'})
+
+
+class AsyncPublicViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        profile = cls.owner.profile
+        profile.portfolio_published = True
+        profile.save()
+        AboutMe.objects.create(user=cls.owner, name='Owner', title='Developer', bio='Bio')
+        for i in range(5):
+            Project.objects.create(user=cls.owner, title=f'Project {i}', description='Description')
+        cls.hidden = User.objects.create_user('hidden', 'hidden@example.com', 'password123')
+
+    def setUp(self):
+        cache.clear()
+        slug_resolver.clear_local()
+        self.factory = AsyncRequestFactory()
+
+    async def test_portfolio_matches_sync_view(self):
+        from core.async_views import portfolio_by_username
+        # Not built yet: the async view builds the snapshot itself
+        response = await portfolio_by_username(self.factory.get('/api/v1/portfolio/owner/'), 'owner')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['projects']), 5)
+
+        sync_response = await sync_to_async(APIClient().get)('/api/v1/portfolio/owner/')
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+        self.assertEqual(response.content, sync_response.content)
+
+        request = self.factory.get('/api/v1/portfolio/owner/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual((await portfolio_by_username(request, 'owner')).status_code, 304)
+        request = self.factory.get('/api/v1/portfolio/owner/?sections=projects',
+                                    headers={'Accept-Encoding': 'gzip'})
+        response = await portfolio_by_username(request, 'owner')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(list(json.loads(gzip.decompress(response.content))), ['projects'])
+
+        self.assertEqual((await portfolio_by_username(self.factory.get('/'), 'missing')).status_code, 404)
+        self.assertEqual((await portfolio_by_username(self.factory.get('/'), 'hidden')).status_code, 403)
+        self.assertEqual((await portfolio_by_username(self.factory.post('/'), 'owner')).status_code, 405)
+
+    async def test_create_message(self):
+        from core.async_views import create_message_for_user
+        request = self.factory.post('/api/v1/auth/portfolio/owner/message/',
+                                    {'name': 'Visitor', 'email': 'v@example.com', 'message': 'Hello'},
+                                    content_type='application/json')
+        response = await create_message_for_user(request, 'owner')
+        self.assertEqual(response.status_code, 201)
+        message = await ContactMessage.objects.aget(user=self.owner)
+        self.assertEqual((message.name, message.status), ('Visitor', 'new'))
+
+        request = self.factory.post('/', {'name': 'Visitor', 'email': 'not-an-email', 'message': 'Hello'})
+        response = await create_message_for_user(request, 'owner')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', json.loads(response.content))
+        request = self.factory.post('/', {'name': 'Visitor', 'email': 'v@example.com', 'message': 'Hello'})
+        self.assertEqual((await create_message_for_user(request, 'hidden')).status_code, 403)
+
+
+class VerificationTokenTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def queued_body(self):
+        return EmailOutbox.objects.latest('pk').body
+
+    def test_register_and_verify_otp(self):
+        response = self.client.post('/api/v1/auth/register/', {
+            'username': 'newbie', 'email': 'newbie@example.com',
+            'password': 'password123', 'password_confirm': 'password123',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        otp = re.search(r'\b(\d{6})\b', self.queued_body()).group(1)
+        token = VerificationToken.objects.get()
+        # Only a hash is stored
+        self.assertEqual((token.purpose, len(token.token_hash)), ('email_otp', 64))
+        self.assertNotIn(otp, token.token_hash)
+
+        wrong = '000000' if otp != '000000' else '111111'
+        response = self.client.post('/api/v1/auth/verify-email-otp/', {'email': 'newbie@example.com', 'otp': wrong}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/auth/verify-email-otp/', {'email': 'newbie@example.com', 'otp': otp}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(UserProfile.objects.get(user__username='newbie').email_verified)
+        self.assertFalse(VerificationToken.objects.exists())
+
+    @override_settings(EMAIL_OTP_LIFETIME_MINUTES=30, PASSWORD_RESET_TOKEN_LIFETIME=2 * 60 * 60)
+    def test_emails_state_the_configured_lifetimes(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.client.post('/api/v1/auth/resend-verification-otp/', {'email': 'owner@example.com'}, format='json')
+        outbox = EmailOutbox.objects.latest('pk')
+        self.assertIn('expire in 30 minutes', outbox.body)
+        self.assertIn('expire in 30 minutes', outbox.html_body)
+
+        self.client.post('/api/v1/auth/password-reset/', {'email': 'owner@example.com'}, format='json')
+        self.assertIn('expire in 2 hours', EmailOutbox.objects.latest('pk').body)
+        token = VerificationToken.objects.get(user=user, purpose='password_reset')
+        self.assertAlmostEqual((token.expires_at - timezone.now()).total_seconds(), 2 * 60 * 60, delta=60)
+
+    def test_expired_otp(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        otp = issue_email_otp(user)
+        VerificationToken.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(check_email_otp(user, otp), 'expired')
+
+    @override_settings(EMAIL_OTP_MAX_ATTEMPTS=3)
+    def test_otp_is_deleted_after_too_many_wrong_codes(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        otp = issue_email_otp(user)
+        wrong = '000000' if otp != '000000' else '111111'
+        self.assertEqual([check_email_otp(user, wrong) for _ in range(3)], ['invalid', 'invalid', 'locked'])
+        self.assertFalse(VerificationToken.objects.exists())
+        # Even the right code no longer works
+        self.assertEqual(check_email_otp(user, otp), 'invalid')
+
+    def test_password_reset_token_is_indexed_and_single_use(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.client.post('/api/v1/auth/password-reset/', {'email': 'owner@example.com'}, format='json')
+        first = re.search(r'/reset-password/(\S+)', self.queued_body()).group(1)
+        # A second request replaces the first token
+        self.client.post('/api/v1/auth/password-reset/', {'email': 'owner@example.com'}, format='json')
+        token = re.search(r'/reset-password/(\S+)', self.queued_body()).group(1)
+        self.assertEqual(VerificationToken.objects.filter(user=user, purpose='password_reset').count(), 1)
+
+        data = {'new_password': 'new-password-1', 'new_password_confirm': 'new-password-1'}
+        with self.assertLogs('core.views', 'INFO') as logs:
+            self.assertEqual(self.client.post(f'/api/v1/auth/password-reset/{first}/', data, format='json').status_code, 400)
+        # Secrets never reach the logs, not even a prefix
+        self.assertFalse(any(first[:8] in line for line in logs.output))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/v1/auth/password-reset/{token}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        lookup = next(query['sql'] for query in queries if 'token_hash' in query['sql'])
+        self.assertIn('"token_hash" =', lookup)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('new-password-1'))
+        # Used up
+        self.assertEqual(self.client.post(f'/api/v1/auth/password-reset/{token}/', data, format='json').status_code, 400)
+
+        issue_password_reset_token(user)
+        VerificationToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(consume_password_reset_token(token))
+
+    def test_purge_expired_tokens_in_batches(self):
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password123') for i in range(5)]
+        for user in users:
+            issue_email_otp(user)
+            issue_password_reset_token(user)
+        VerificationToken.objects.filter(purpose='email_otp').update(expires_at=timezone.now() - timedelta(minutes=1))
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_expired_tokens', batch_size=2, stdout=out)
+        self.assertIn('Purged 5', out.getvalue())
+        self.assertEqual(VerificationToken.objects.count(), 5)
+        self.assertFalse(VerificationToken.objects.filter(purpose='email_otp').exists())
+        # 3 batches (2 + 2 + 1), each a SELECT and a DELETE, plus the final empty SELECT
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 3)
@@ -0,0 +1,143 @@
+"""
+One-time verification secrets: email OTPs and password reset tokens.
+
+They used to share UserProfile.email_verification_token, an unindexed plain
+text column, so every reset confirmation scanned the profile table and a
+database dump exposed working codes. Each secret is now a VerificationToken
+row holding only an HMAC of it (keyed with SECRET_KEY):
+
+- Password reset tokens are random and looked up by their hash, through the
+  unique index, in one query whatever the number of users. They expire after
+  PASSWORD_RESET_TOKEN_LIFETIME seconds (24 hours) and are consumed by a
+  conditional DELETE, so a link works exactly once.
+- Email OTPs are 6 digits, so their hash also covers the user id (equal codes
+  of different users stay distinct) and they are checked against the user's
+  row with a constant-time comparison. They expire after
+  EMAIL_OTP_LIFETIME_MINUTES (15), and after EMAIL_OTP_MAX_ATTEMPTS (5) wrong
+  codes, so a code can't be guessed within its lifetime.
+
+The emails state the configured lifetimes (lifetime_display()).
+
+Issuing a secret replaces the user's earlier ones of the same purpose. Expired
+rows are deleted in batches by purge_expired_tokens(), hourly under runworker
+or with `python manage.py purge_expired_tokens`.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from datetime import timedelta
+import secrets
+
+from .models import VerificationToken
+
+EMAIL_OTP = 'email_otp'
+PASSWORD_RESET = 'password_reset'
+
+DEFAULT_OTP_LIFETIME_MINUTES = 15
+DEFAULT_RESET_TOKEN_LIFETIME = 24 * 60 * 60
+DEFAULT_OTP_MAX_ATTEMPTS = 5
+DEFAULT_PURGE_BATCH_SIZE = 1000
+
+
+def hash_token(purpose, token, user_id=None):
+    value = f'{user_id}:{token}' if user_id is not None else token
+    return salted_hmac(f'core.tokens.{purpose}', value, algorithm='sha256').hexdigest()
+
+
+def token_lifetime(purpose):
+    if purpose == EMAIL_OTP:
+        return timedelta(minutes=getattr(settings, 'EMAIL_OTP_LIFETIME_MINUTES', DEFAULT_OTP_LIFETIME_MINUTES))
+    return timedelta(seconds=getattr(settings, 'PASSWORD_RESET_TOKEN_LIFETIME', DEFAULT_RESET_TOKEN_LIFETIME))
+
+
+def lifetime_display(purpose):
+    """How long a `purpose` token lasts, in words for emails: '15 minutes', '24 hours'"""
+    minutes = int(token_lifetime(purpose).total_seconds() // 60)
+    if minutes % 60:
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+    hours = minutes // 60
+    return f"{hours} hour{'s' if hours != 1 else ''}"
+
+
+def store_token(user, purpose, token, expires_at=None):
+    """Replace the user's `purpose` tokens with this one"""
+    user_id = user.pk if purpose == EMAIL_OTP else None
+    with transaction.atomic():
+        VerificationToken.objects.filter(user=user, purpose=purpose).delete()
+        VerificationToken.objects.create(
+            user=user,
+            purpose=purpose,
+            token_hash=hash_token(purpose, token, user_id),
+            expires_at=expires_at or timezone.now() + token_lifetime(purpose),
+        )
+    return token
+
+
+def issue_email_otp(user):
+    """A new 6-digit email verification code for the user"""
+    return store_token(user, EMAIL_OTP, f'{secrets.randbelow(10 ** 6):06d}')
+
+
+def issue_password_reset_token(user):
+    """A new password reset token for the user, for use in the reset link"""
+    return store_token(user, PASSWORD_RESET, secrets.token_urlsafe(32))
+
+
+def reset_token_id(token):
+    """Short id of a reset token for logs: a prefix of its stored hash, never of the token"""
+    return hash_token(PASSWORD_RESET, token)[:12]
+
+
+def check_email_otp(user, otp):
+    """
+    'valid', 'invalid', 'expired' or 'locked' for a code entered by the user.
+
+    A valid code is consumed. Wrong codes are counted, and the code that gets
+    the EMAIL_OTP_MAX_ATTEMPTS-th one is deleted ('locked'): a new one must be
+    requested.
+    """
+    row = (VerificationToken.objects
+           .filter(user=user, purpose=EMAIL_OTP)
+           .order_by('-created_at')
+           .values_list('pk', 'token_hash', 'expires_at')
+           .first())
+    if row is None:
+        return 'invalid'
+    pk, token_hash, expires_at = row
+    if not constant_time_compare(token_hash, hash_token(EMAIL_OTP, str(otp).strip(), user.pk)):
+        # Counted in the database, so concurrent guesses can't share an attempt
+        max_attempts = getattr(settings, 'EMAIL_OTP_MAX_ATTEMPTS', DEFAULT_OTP_MAX_ATTEMPTS)
+        VerificationToken.objects.filter(pk=pk).update(failed_attempts=F('failed_attempts') + 1)
+        deleted, _ = VerificationToken.objects.filter(pk=pk, failed_attempts__gte=max_attempts).delete()
+        return 'locked' if deleted else 'invalid'
+    if expires_at < timezone.now():
+        return 'expired'
+    VerificationToken.objects.filter(pk=pk).delete()
+    return 'valid'
+
+
+def consume_password_reset_token(token):
+    """The user a valid reset token belongs to (consuming the token), or None"""
+    row = (VerificationToken.objects
+           .filter(token_hash=hash_token(PASSWORD_RESET, token), purpose=PASSWORD_RESET)
+           .select_related('user')
+           .first())
+    if row is None or row.expires_at < timezone.now():
+        return None
+    # Only the request whose DELETE removes the row may use it
+    deleted, _ = VerificationToken.objects.filter(pk=row.pk).delete()
+    return row.user if deleted else None
+
+
+def purge_expired_tokens(batch_size=None):
+    """Delete expired tokens in batches of `batch_size` rows; returns how many were deleted"""
+    batch_size = batch_size or getattr(settings, 'VERIFICATION_TOKEN_PURGE_BATCH_SIZE', DEFAULT_PURGE_BATCH_SIZE)
+    now = timezone.now()
+    purged = 0
+    while True:
+        batch = list(VerificationToken.objects.filter(expires_at__lt=now).values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return purged
+        purged += VerificationToken.objects.filter(pk__in=batch).delete()[0]
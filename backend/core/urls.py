@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RegisterView,
@@ -10,11 +11,18 @@ from .views import (
     list_users,
     update_user_approval,
     update_user_status,
+    bulk_update_user_approval,
+    bulk_update_user_status,
+    bulk_update_portfolio_published,
     user_profile_detail,
     system_overview,
     create_message_for_user,
 )
 
+if getattr(settings, 'ASYNC_PUBLIC_VIEWS', False):
+    # Event-loop version of the public contact endpoint, for ASGI deployments
+    from .async_views import create_message_for_user
+
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('verify-email-otp/', verify_email_otp, name='verify-email-otp'),
@@ -24,6 +32,9 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('me/', current_user, name='current-user'),
     path('users/', list_users, name='list-users'),
+    path('users/bulk/approval/', bulk_update_user_approval, name='bulk-update-user-approval'),
+    path('users/bulk/status/', bulk_update_user_status, name='bulk-update-user-status'),
+    path('users/bulk/publish/', bulk_update_portfolio_published, name='bulk-update-portfolio-published'),
     path('users/<int:user_id>/approval/', update_user_approval, name='update-user-approval'),
     path('users/<int:user_id>/status/', update_user_status, name='update-user-status'),
     path('users/<int:user_id>/profile/', user_profile_detail, name='user-profile-detail'),
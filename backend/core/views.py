@@ -3,7 +3,6 @@ from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail, EmailMultiAlternatives
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
@@ -18,7 +17,12 @@ from .serializers import (
     PasswordResetConfirmSerializer
 )
 from portfolio.models import UserProfile
-import secrets
+from .query_budget import query_budget
+from .mail import queue_mail
+from .tokens import (
+    EMAIL_OTP, PASSWORD_RESET, issue_email_otp, check_email_otp, issue_password_reset_token,
+    consume_password_reset_token, reset_token_id, lifetime_display,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,45 +30,58 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+def approval_email_content(user, is_approved):
+    """(subject, template, context) of the account approved/rejected email"""
+    # Use frontend URL for login link
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+    context = {
+        'user': user,
+        'login_url': f"{frontend_url}/login",
+        'current_year': datetime.now().year,
+    }
+    if is_approved:
+        return 'Your Portfy Account Has Been Approved!', 'email/account_approved.html', context
+    return 'Portfy Account Review Update', 'email/account_rejected.html', context
+
+
+def portfolio_status_email_content(user, is_published, unpublished_by_admin=False, username_slug=None):
+    """(subject, template, context) of the portfolio published/unpublished email"""
+    # Use frontend URL for links
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+    dashboard_url = f"{frontend_url}/dashboard"
+    current_year = datetime.now().year
+    if is_published:
+        portfolio_url = f"{frontend_url}/{username_slug}" if username_slug else None
+        return 'Your Portfolio is Now Live! - Portfy', 'email/portfolio_published.html', {
+            'user': user,
+            'portfolio_url': portfolio_url or dashboard_url,
+            'current_year': current_year,
+        }
+    return 'Your Portfolio Has Been Unpublished - Portfy', 'email/portfolio_unpublished.html', {
+        'user': user,
+        'dashboard_url': dashboard_url,
+        'unpublished_by_admin': unpublished_by_admin,
+        'current_year': current_year,
+    }
+
+
 def send_approval_email(user, is_approved):
     """Send email notification when user account is approved or rejected"""
-    # print(f"\n{'='*70}")
-    # print(f"SEND_APPROVAL_EMAIL CALLED")
-    # print(f"User: {user.username} (ID: {user.id})")
-    # print(f"Email: {user.email}")
-    # print(f"Is Approved: {is_approved}")
-    # print(f"{'='*70}\n")
-    
     try:
         logger.info(f"send_approval_email called for user: {user.username} (ID: {user.id}), email: {user.email}, is_approved: {is_approved}")
         
         # Validate user email exists
         if not user.email:
-            # print(f"ERROR: User {user.username} has no email address\n")
             logger.error(f"Cannot send approval email: User {user.username} (ID: {user.id}) has no email address")
             return False
         
-        # Use frontend URL for login link
-        frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
-        login_url = f"{frontend_url}/login"
-        current_year = datetime.now().year
-        
-        if is_approved:
-            subject = 'Your Portfy Account Has Been Approved!'
-            template = 'email/account_approved.html'
-        else:
-            subject = 'Portfy Account Review Update'
-            template = 'email/account_rejected.html'
+        subject, template, context = approval_email_content(user, is_approved)
         
         logger.info(f"Rendering email template: {template} for user: {user.email}")
         
         # Render the email template
         try:
-            html_message = render_to_string(template, {
-                'user': user,
-                'login_url': login_url,
-                'current_year': current_year,
-            })
+            html_message = render_to_string(template, context)
             logger.debug(f"Email template rendered successfully")
         except Exception as e:
             logger.error(f"Failed to render email template {template}: {str(e)}", exc_info=True)
@@ -75,39 +92,24 @@ def send_approval_email(user, is_approved):
         plain_message = strip_tags(html_message)
         logger.info(f"Email settings - From: {from_email}, To: {user.email}, Subject: {subject}")
         
-        # Use send_mail (same as working verification emails) instead of EmailMultiAlternatives
-        # print(f"Sending email...")
-        # print(f"From: {from_email}")
-        # print(f"To: {user.email}")
-        # print(f"Subject: {subject}\n")
-        
-        logger.info(f"Attempting to send email to {user.email} using send_mail...")
+        # Queued for the send_queued_mail worker so the request doesn't wait on SMTP
+        logger.info(f"Queueing email to {user.email}...")
         try:
-            send_mail(
+            queue_mail(
                 subject=subject,
                 message=plain_message,
                 from_email=from_email,
                 recipient_list=[user.email],
                 html_message=html_message,
-                fail_silently=False,  # Raise exception if email fails
             )
-            # print(f"✓✓✓ EMAIL SENT SUCCESSFULLY TO {user.email} ✓✓✓\n")
-            logger.info(f"✓ Approval email sent successfully to {user.email} - Approved: {is_approved}, Subject: {subject}")
+            logger.info(f"✓ Approval email queued for {user.email} - Approved: {is_approved}, Subject: {subject}")
             return True
         except Exception as send_error:
-            # print(f"✗✗✗ ERROR IN send_mail: {str(send_error)} ✗✗✗\n")
-            import traceback
-            # print(traceback.format_exc())
-            logger.error(f"✗ send_mail raised exception: {str(send_error)}", exc_info=True)
+            logger.error(f"✗ queue_mail raised exception: {str(send_error)}", exc_info=True)
             raise  # Re-raise to be caught by outer try-except
         
     except Exception as e:
-        # print(f"\n✗✗✗ EXCEPTION IN send_approval_email ✗✗✗")
-        # print(f"Error: {str(e)}")
         import traceback
-        # print(traceback.format_exc())
-        # print(f"✗✗✗ END EXCEPTION ✗✗✗\n")
-        
         logger.error(f"✗ Error sending approval email to {user.email}: {str(e)}", exc_info=True)
         logger.error(f"Full traceback: {traceback.format_exc()}")
         return False
@@ -115,52 +117,21 @@ def send_approval_email(user, is_approved):
 
 def send_portfolio_status_email(user, is_published, unpublished_by_admin=False):
     """Send email notification when portfolio is published or unpublished"""
-    # print(f"\n{'='*70}")
-    # print(f"SEND_PORTFOLIO_STATUS_EMAIL CALLED")
-    # print(f"User: {user.username} (ID: {user.id})")
-    # print(f"Email: {user.email}")
-    # print(f"Is Published: {is_published}")
-    # print(f"Unpublished by Admin: {unpublished_by_admin}")
-    # print(f"{'='*70}\n")
-    
     try:
         logger.info(f"send_portfolio_status_email called for user: {user.username} (ID: {user.id}), email: {user.email}, is_published: {is_published}")
         
         # Validate user email exists
         if not user.email:
-            # print(f"ERROR: User {user.username} has no email address\n")
             logger.error(f"Cannot send portfolio status email: User {user.username} (ID: {user.id}) has no email address")
             return False
         
-        # Use frontend URL for links
-        frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
-        dashboard_url = f"{frontend_url}/dashboard"
-        current_year = datetime.now().year
-        
         # Get profile to get username_slug
         try:
-            profile = UserProfile.objects.get(user=user)
-            portfolio_url = f"{frontend_url}/{profile.username_slug}" if profile.username_slug else None
+            username_slug = UserProfile.objects.get(user=user).username_slug
         except UserProfile.DoesNotExist:
-            portfolio_url = None
+            username_slug = None
         
-        if is_published:
-            subject = 'Your Portfolio is Now Live! - Portfy'
-            template = 'email/portfolio_published.html'
-            context = {
-                'user': user,
-                'portfolio_url': portfolio_url or dashboard_url,
-                'current_year': current_year,
-            }
-        else:
-            subject = 'Your Portfolio Has Been Unpublished - Portfy'
-            template = 'email/portfolio_unpublished.html'
-            context = {
-                'user': user,
-                'dashboard_url': dashboard_url,
-                'unpublished_by_admin': unpublished_by_admin,
-                'current_year': current_year,
-            }
+        subject, template, context = portfolio_status_email_content(user, is_published, unpublished_by_admin, username_slug)
         
         logger.info(f"Rendering email template: {template} for user: {user.email}")
         
@@ -177,39 +148,24 @@ def send_portfolio_status_email(user, is_published, unpublished_by_admin=False):
         plain_message = strip_tags(html_message)
         logger.info(f"Email settings - From: {from_email}, To: {user.email}, Subject: {subject}")
         
-        # Use send_mail (same as working verification emails)
-        # print(f"Sending email...")
-        # print(f"From: {from_email}")
-        # print(f"To: {user.email}")
-        # print(f"Subject: {subject}\n")
-        
-        logger.info(f"Attempting to send email to {user.email} using send_mail...")
+        # Queued for the send_queued_mail worker so the request doesn't wait on SMTP
+        logger.info(f"Queueing email to {user.email}...")
         try:
-            send_mail(
+            queue_mail(
                 subject=subject,
                 message=plain_message,
                 from_email=from_email,
                 recipient_list=[user.email],
                 html_message=html_message,
-                fail_silently=False,  # Raise exception if email fails
             )
-            # print(f"✓✓✓ EMAIL SENT SUCCESSFULLY TO {user.email} ✓✓✓\n")
-            logger.info(f"✓ Portfolio status email sent successfully to {user.email} - Published: {is_published}, Subject: {subject}")
+            logger.info(f"✓ Portfolio status email queued for {user.email} - Published: {is_published}, Subject: {subject}")
             return True
         except Exception as send_error:
-            # print(f"✗✗✗ ERROR IN send_mail: {str(send_error)} ✗✗✗\n")
-            import traceback
-            # print(traceback.format_exc())
-            logger.error(f"✗ send_mail raised exception: {str(send_error)}", exc_info=True)
+            logger.error(f"✗ queue_mail raised exception: {str(send_error)}", exc_info=True)
             raise  # Re-raise to be caught by outer try-except
         
     except Exception as e:
-        # print(f"\n✗✗✗ EXCEPTION IN send_portfolio_status_email ✗✗✗")
-        # print(f"Error: {str(e)}")
         import traceback
-        # print(traceback.format_exc())
-        # print(f"✗✗✗ END EXCEPTION ✗✗✗\n")
-        
         logger.error(f"✗ Error sending portfolio status email to {user.email}: {str(e)}", exc_info=True)
         logger.error(f"Full traceback: {traceback.format_exc()}")
         return False
@@ -232,45 +188,27 @@ class RegisterView(generics.CreateAPIView):
         
         # Send verification OTP email
         try:
-            # Refresh profile from database to ensure we have the latest OTP
-            profile = UserProfile.objects.get(user=user)
-            
-            # Ensure OTP exists (should be set by serializer, but double-check)
-            # If token exists but is not a 6-digit OTP, regenerate it
-            if not profile.email_verification_token or len(profile.email_verification_token) != 6 or not profile.email_verification_token.isdigit():
-                import random
-                from django.utils import timezone
-                from datetime import timedelta
-                otp = str(random.randint(100000, 999999))
-                profile.email_verification_token = otp
-                profile.email_verification_otp_expires = timezone.now() + timedelta(minutes=15)
-                profile.save()
-                logger.info(f"Generated new OTP for user {user.username}: {otp}")
-            
-            # Verify OTP is 6 digits
-            if len(profile.email_verification_token) != 6 or not profile.email_verification_token.isdigit():
-                logger.error(f"Invalid OTP format for user {user.username}: {profile.email_verification_token}")
-                raise ValueError("OTP must be a 6-digit number")
+            otp = issue_email_otp(user)
             
             # Send OTP via email
             frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
             
             html_message = render_to_string('email/verification.html', {
                 'user': user,
-                'otp': profile.email_verification_token,
+                'otp': otp,
+                'otp_lifetime': lifetime_display(EMAIL_OTP),
                 'frontend_url': frontend_url,
             })
-            plain_message = f"Your email verification code is: {profile.email_verification_token}\n\nThis code will expire in 15 minutes.\n\nIf you didn't request this, please ignore this email."
+            plain_message = f"Your email verification code is: {otp}\n\nThis code will expire in {lifetime_display(EMAIL_OTP)}.\n\nIf you didn't request this, please ignore this email."
             
-            logger.info(f"Sending OTP email to {user.email} with OTP: {profile.email_verification_token}")
+            logger.info(f"Sending OTP email to {user.email}")
                 
-            send_mail(
+            queue_mail(
                 subject='Verify Your Email - Portfy',
                 message=plain_message,
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[user.email],
                 html_message=html_message,
-                fail_silently=False,
             )
         except Exception as e:
             # Log error but don't fail registration
@@ -305,24 +243,25 @@ def verify_email_otp(request):
                 'already_verified': True
             }, status=status.HTTP_200_OK)
         
-        # Check if OTP matches
-        if profile.email_verification_token != otp:
+        # Check the OTP (consumed when valid)
+        result = check_email_otp(user, otp)
+        if result == 'invalid':
             return Response({
                 'error': 'Invalid OTP. Please check the code and try again.'
             }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check if OTP has expired
-        from django.utils import timezone
-        if profile.email_verification_otp_expires and profile.email_verification_otp_expires < timezone.now():
+        if result == 'expired':
             return Response({
                 'error': 'OTP has expired. Please request a new one.'
             }, status=status.HTTP_400_BAD_REQUEST)
+        if result == 'locked':
+            logger.warning(f"Email OTP for user ID {user.id} deleted after too many incorrect attempts")
+            return Response({
+                'error': 'Too many incorrect attempts. Please request a new OTP.'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Verify email
         profile.email_verified = True
-        profile.email_verification_token = None  # Clear OTP after verification
-        profile.email_verification_otp_expires = None
-        profile.save(update_fields=['email_verified', 'email_verification_token', 'email_verification_otp_expires'])
+        profile.save(update_fields=['email_verified'])
         
         logger.info(f"Email verified successfully for user: {user.username}")
         
@@ -362,15 +301,8 @@ def resend_verification_otp(request):
                 'message': 'Your email is already verified. You can proceed to login.'
             }, status=status.HTTP_200_OK)
         
-        # Generate new OTP
-        import random
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        otp = str(random.randint(100000, 999999))
-        profile.email_verification_token = otp
-        profile.email_verification_otp_expires = timezone.now() + timedelta(minutes=15)
-        profile.save(update_fields=['email_verification_token', 'email_verification_otp_expires'])
+        # Generate new OTP (replaces the previous one)
+        otp = issue_email_otp(user)
         
         # Send OTP via email
         frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
@@ -378,17 +310,17 @@ def resend_verification_otp(request):
         html_message = render_to_string('email/verification.html', {
             'user': user,
             'otp': otp,
+            'otp_lifetime': lifetime_display(EMAIL_OTP),
             'frontend_url': frontend_url,
         })
-        plain_message = f"Your email verification code is: {otp}\n\nThis code will expire in 15 minutes.\n\nIf you didn't request this, please ignore this email."
+        plain_message = f"Your email verification code is: {otp}\n\nThis code will expire in {lifetime_display(EMAIL_OTP)}.\n\nIf you didn't request this, please ignore this email."
         
-        send_mail(
+        queue_mail(
             subject='Verify Your Email - Portfy',
             message=plain_message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[user.email],
             html_message=html_message,
-            fail_silently=False,
         )
         
         return Response({
@@ -417,12 +349,9 @@ def password_reset_request(request):
     
     try:
         user = User.objects.get(email=email)
-        profile = user.profile
         
-        # Generate reset token
-        reset_token = secrets.token_urlsafe(32)
-        profile.email_verification_token = reset_token  # Reuse this field for reset token
-        profile.save()
+        # Generate reset token (replaces any earlier one)
+        reset_token = issue_password_reset_token(user)
         
         # Send reset email - use frontend URL
         frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
@@ -431,17 +360,17 @@ def password_reset_request(request):
         html_message = render_to_string('email/password_reset.html', {
             'user': user,
             'reset_url': reset_url,
+            'reset_lifetime': lifetime_display(PASSWORD_RESET),
             'frontend_url': frontend_url,
         })
         plain_message = strip_tags(html_message)
         
-        send_mail(
+        queue_mail(
             subject='Password Reset - Portfy',
             message=plain_message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[user.email],
             html_message=html_message,
-            fail_silently=False,
         )
         
         return Response({
@@ -463,7 +392,7 @@ def password_reset_confirm(request, token):
     # URL decode the token in case it was encoded
     token = unquote(token)
     
-    logger.info(f"Password reset confirm attempt - Token: {token[:20] if token else 'None'}...")
+    logger.info(f"Password reset confirm attempt")
     
     # Check if token is None or empty
     if not token or token == 'None' or token.lower() == 'none':
@@ -475,28 +404,23 @@ def password_reset_confirm(request, token):
     serializer = PasswordResetConfirmSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
     
-    try:
-        profile = UserProfile.objects.get(email_verification_token=token)
-        user = profile.user
-        
-        # Set new password
-        user.set_password(serializer.validated_data['new_password'])
-        user.save()
-        
-        # Clear reset token
-        profile.email_verification_token = None
-        profile.save()
-        
-        logger.info(f"Password reset successful for user: {user.username} (ID: {user.id})")
-        
-        return Response({
-            'message': 'Password reset successfully! You can now login with your new password.',
-        }, status=status.HTTP_200_OK)
-    except UserProfile.DoesNotExist:
-        logger.warning(f"Password reset token not found: {token[:20]}...")
+    # Indexed lookup by the token's hash; the token is consumed here
+    user = consume_password_reset_token(token)
+    if user is None:
+        logger.warning(f"Password reset token not found or expired (token ID {reset_token_id(token)})")
         return Response({
             'error': 'Invalid or expired reset token.',
         }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Set new password
+    user.set_password(serializer.validated_data['new_password'])
+    user.save()
+    
+    logger.info(f"Password reset successful for user: {user.username} (ID: {user.id})")
+    
+    return Response({
+        'message': 'Password reset successfully! You can now login with your new password.',
+    }, status=status.HTTP_200_OK)
 
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
@@ -529,6 +453,7 @@ def current_user(request):
     return Response(data)
 
 
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def list_users(request):
@@ -566,8 +491,8 @@ def list_users(request):
     except (ValueError, TypeError):
         page_size = 30
     
-    # Get all users
-    users_queryset = User.objects.all().order_by('-date_joined')
+    # Get all users (profiles joined in, so the page costs one query instead of 1 + N)
+    users_queryset = User.objects.select_related('profile').order_by('-date_joined')
     total_users = users_queryset.count()
     
     # Calculate pagination
@@ -687,7 +612,7 @@ def update_user_approval(request, user_id):
                 email_sent = send_approval_email(user, new_status)
                 if email_sent:
                     # print(f"✓ Email function returned True\n")
-                    logger.info(f"✓ Approval email sent successfully to {user.email} - Status: {new_status} (was: {old_status})")
+                    logger.info(f"✓ Approval email queued for {user.email} - Status: {new_status} (was: {old_status})")
                 else:
                     # print(f"✗ Email function returned False\n")
                     logger.error(f"✗ Approval email function returned False for {user.email} - Status: {new_status}. Check logs above for details.")
@@ -802,6 +727,59 @@ def update_user_status(request, user_id):
         )
 
 
+def run_bulk_update(request, field, apply):
+    """Shared body of the bulk moderation endpoints (see core/bulk.py)"""
+    from .bulk import BulkRequestError, resolve_user_ids, summarize
+    
+    if not (request.user.is_staff or request.user.is_superuser):
+        return Response(
+            {'error': 'You do not have permission to update users.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    value = request.data.get(field, None)
+    if value is None:
+        return Response(
+            {'error': f'{field} field is required.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        user_ids = resolve_user_ids(request.data)
+    except BulkRequestError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = apply(user_ids, bool(value))
+    data = summarize(results)
+    logger.info(f"Bulk {field}={bool(value)} by {request.user.username}: {data['counts']}")
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_user_approval(request):
+    """Approve or revoke many users: {"user_ids": [...]} or {"filter": {...}}, plus "is_approved" (staff/superuser only)"""
+    from .bulk import bulk_update_approval
+    return run_bulk_update(request, 'is_approved', bulk_update_approval)
+
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_user_status(request):
+    """Activate or deactivate many users, plus "is_active" (staff/superuser only)"""
+    from .bulk import bulk_update_active
+    return run_bulk_update(
+        request, 'is_active', lambda user_ids, is_active: bulk_update_active(user_ids, is_active, request.user)
+    )
+
+
+@api_view(['PATCH'])
+@permission_classes([permissions.IsAuthenticated])
+def bulk_update_portfolio_published(request):
+    """Publish or unpublish many portfolios, plus "portfolio_published" (staff/superuser only)"""
+    from .bulk import bulk_update_published
+    return run_bulk_update(request, 'portfolio_published', bulk_update_published)
+
+
+@query_budget(11)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def user_profile_detail(request, user_id):
@@ -873,7 +851,7 @@ def user_profile_detail(request, user_id):
         user_data['social_media'] = SocialMediaSerializer(social_media, many=True, context={'request': request}).data
         
         # Get Messages sent to this user
-        messages = ContactMessage.objects.filter(user=user).order_by('-created_at')
+        messages = ContactMessage.objects.filter(user=user).select_related('user').order_by('-created_at')
         user_data['messages'] = ContactMessageSerializer(messages, many=True, context={'request': request}).data
         
         return Response(user_data)
@@ -884,6 +862,7 @@ def user_profile_detail(request, user_id):
         )
 
 
+@query_budget(10)
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def system_overview(request):
@@ -897,55 +876,72 @@ def system_overview(request):
     from django.contrib.auth import get_user_model
     User = get_user_model()
     from portfolio.models import AboutMe, Project, Experience, Education, Skill, ContactMessage
+    from django.db.models import Count, Q
+    from .mail import mail_stats
+    from .models import EmailOutbox
+    
+    # One aggregate per table instead of one COUNT per statistic
+    user_stats = User.objects.aggregate(
+        total_users=Count('id'),
+        active_users=Count('id', filter=Q(is_active=True)),
+        staff_users=Count('id', filter=Q(is_staff=True)),
+        superusers=Count('id', filter=Q(is_superuser=True)),
+    )
+    profile_stats = UserProfile.objects.aggregate(
+        approved_users=Count('id', filter=Q(is_approved=True)),
+        pending_users=Count('id', filter=Q(is_approved=False)),
+    )
+    message_stats = ContactMessage.objects.aggregate(
+        total_messages=Count('id'),
+        new_messages=Count('id', filter=Q(status='new')),
+        read_messages=Count('id', filter=Q(status='read')),
+        replied_messages=Count('id', filter=Q(status='replied')),
+    )
     
     stats = {
-        'total_users': User.objects.count(),
-        'active_users': User.objects.filter(is_active=True).count(),
-        'approved_users': UserProfile.objects.filter(is_approved=True).count(),
-        'pending_users': UserProfile.objects.filter(is_approved=False).count(),
-        'staff_users': User.objects.filter(is_staff=True).count(),
-        'superusers': User.objects.filter(is_superuser=True).count(),
+        'total_users': user_stats['total_users'],
+        'active_users': user_stats['active_users'],
+        'approved_users': profile_stats['approved_users'],
+        'pending_users': profile_stats['pending_users'],
+        'staff_users': user_stats['staff_users'],
+        'superusers': user_stats['superusers'],
         'total_projects': Project.objects.count(),
         'total_experiences': Experience.objects.count(),
         'total_educations': Education.objects.count(),
         'total_skills': Skill.objects.count(),
         'total_about_me': AboutMe.objects.count(),
-        'total_messages': ContactMessage.objects.count(),
-        'new_messages': ContactMessage.objects.filter(status='new').count(),
-        'read_messages': ContactMessage.objects.filter(status='read').count(),
-        'replied_messages': ContactMessage.objects.filter(status='replied').count(),
+        'total_messages': message_stats['total_messages'],
+        'new_messages': message_stats['new_messages'],
+        'read_messages': message_stats['read_messages'],
+        'replied_messages': message_stats['replied_messages'],
+        # Delivery counters and circuit breaker state of the email outbox worker
+        'email': {**mail_stats(), **EmailOutbox.objects.aggregate(
+            pending_emails=Count('id', filter=Q(status='pending')),
+            failed_emails=Count('id', filter=Q(status='failed')),
+        )},
     }
     
     return Response(stats)
 
 
+@query_budget(3)
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def create_message_for_user(request, username_slug):
     """Create a contact message for a specific user's portfolio"""
-    from portfolio.models import ContactMessage
     from portfolio.serializers import ContactMessageCreateSerializer
-    from portfolio.models import UserProfile
-    from django.contrib.auth import get_user_model
-    User = get_user_model()
+    from portfolio.resolver import resolve_portfolio_slug
     
     try:
-        # Find the user by username_slug
-        try:
-            profile = UserProfile.objects.get(username_slug=username_slug)
-            user = profile.user
-        except UserProfile.DoesNotExist:
-            # Try to find by username as fallback
-            try:
-                user = User.objects.get(username=username_slug)
-            except User.DoesNotExist:
-                return Response({
-                    'error': f'Portfolio not found for username: {username_slug}',
-                }, status=status.HTTP_404_NOT_FOUND)
+        # Find the user by username_slug (falls back to the username)
+        resolved = resolve_portfolio_slug(username_slug)
+        if resolved is None:
+            return Response({
+                'error': f'Portfolio not found for username: {username_slug}',
+            }, status=status.HTTP_404_NOT_FOUND)
         
         # Check if portfolio is published
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        if not profile.portfolio_published:
+        if not resolved.published:
             return Response({
                 'error': 'Portfolio is not published.',
             }, status=status.HTTP_403_FORBIDDEN)
@@ -953,7 +949,7 @@ def create_message_for_user(request, username_slug):
         # Create the message with the user assigned
         serializer = ContactMessageCreateSerializer(data=request.data)
         if serializer.is_valid():
-            message = serializer.save(user=user, status='new')
+            message = serializer.save(user_id=resolved.user_id, status='new')
             return Response(ContactMessageCreateSerializer(message).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
@@ -965,99 +961,163 @@ def create_message_for_user(request, username_slug):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def portfolio_by_username(request, username_slug):
     """Get portfolio data by username slug"""
     import logging
+    from portfolio.models import PortfolioSnapshot
+    from portfolio.snapshots import build_snapshot, absolutize_media_urls, response_etag
+    from portfolio.resolver import resolve_portfolio_slug
+    from portfolio.fieldsets import parse_sections, parse_fields, apply_sparse_fieldsets
+    from portfolio.compression import precompressed_response, matching_etag
+    from portfolio.media_urls import absolute_url_builder
+    from rest_framework.renderers import JSONRenderer
     logger = logging.getLogger(__name__)
     
     logger.info(f"Fetching portfolio for username_slug: {username_slug}")
     
+    def snapshot_response(snapshot):
+        # Answer 304 when the client already holds this exact representation
+        etag = response_etag(snapshot, request, sections, fields)
+        client_etag = matching_etag(request, etag)
+        if client_etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = client_etag
+            return response
+        def render():
+            data = apply_sparse_fieldsets(snapshot.data, sections, fields)
+            return JSONRenderer().render(absolutize_media_urls(data, absolute_url_builder(request)))
+        
+        # The ETag covers content, host and fieldsets, so it can key the body cache
+        return precompressed_response(request, f'portfolio:{snapshot.user_id}:{etag}', render, etag=etag)
+    
+    # Optional section selection and sparse fieldsets (?sections=..., ?fields[projects]=...)
     try:
-        # First check if profile exists (even if not published)
-        try:
-            profile = UserProfile.objects.get(username_slug=username_slug)
-            logger.info(f"Profile found: {profile.user.username}, published: {profile.portfolio_published}")
-        except UserProfile.DoesNotExist:
+        sections = parse_sections(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    fields = parse_fields(request.query_params)
+    
+    try:
+        # Resolve the slug without touching the database for known (or known-missing) slugs
+        resolved = resolve_portfolio_slug(username_slug)
+        if resolved is None:
             logger.warning(f"Profile not found for username_slug: {username_slug}")
-            # Try to find by username as fallback
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            try:
-                user = User.objects.get(username=username_slug)
-                profile, created = UserProfile.objects.get_or_create(user=user)
-                logger.info(f"Found user by username, created profile: {created}")
-            except User.DoesNotExist:
-                return Response({
-                    'error': f'Portfolio not found for username: {username_slug}',
-                }, status=status.HTTP_404_NOT_FOUND)
+            return Response({
+                'error': f'Portfolio not found for username: {username_slug}',
+            }, status=status.HTTP_404_NOT_FOUND)
         
         # Check if portfolio is published
-        if not profile.portfolio_published:
-            logger.warning(f"Portfolio not published for user: {profile.user.username}")
+        if not resolved.published:
+            logger.warning(f"Portfolio not published for user ID: {resolved.user_id}")
             return Response({
                 'error': 'Portfolio is not published. Please publish it from your dashboard.',
-                'username_slug': profile.username_slug,
+                'username_slug': resolved.username_slug,
                 'portfolio_published': False,
             }, status=status.HTTP_403_FORBIDDEN)
         
-        user = profile.user
-        logger.info(f"Fetching portfolio data for user: {user.username} (ID: {user.id})")
-        
-        # Get all portfolio data for this user
-        from portfolio.serializers import (
-            AboutMeSerializer, ProjectSerializer, ExperienceSerializer,
-            EducationSerializer, SkillSerializer, SocialMediaSerializer
-        )
-        from portfolio.models import AboutMe, Project, Experience, Education, Skill, SocialMedia
-        
-        portfolio_data = {
-            'profile': UserProfileSerializer(profile, context={'request': request}).data,
-            'about_me': None,
-            'projects': [],
-            'experiences': [],
-            'educations': [],
-            'skills': [],
-            'social_media': [],
-        }
-        
-        # Get About Me
-        about_me = AboutMe.objects.filter(user=user).first()
-        logger.info(f"About Me found: {about_me is not None}")
-        if about_me:
-            portfolio_data['about_me'] = AboutMeSerializer(about_me, context={'request': request}).data
-            logger.info(f"About Me data: name={about_me.name}, title={about_me.title}")
-        
-        # Get Projects
-        projects = Project.objects.filter(user=user)
-        logger.info(f"Projects found: {projects.count()}")
-        portfolio_data['projects'] = ProjectSerializer(projects, many=True, context={'request': request}).data
-        
-        # Get Experiences
-        experiences = Experience.objects.filter(user=user)
-        logger.info(f"Experiences found: {experiences.count()}")
-        portfolio_data['experiences'] = ExperienceSerializer(experiences, many=True, context={'request': request}).data
-        
-        # Get Educations
-        educations = Education.objects.filter(user=user)
-        logger.info(f"Educations found: {educations.count()}")
-        portfolio_data['educations'] = EducationSerializer(educations, many=True, context={'request': request}).data
-        
-        # Get Skills
-        skills = Skill.objects.filter(user=user)
-        logger.info(f"Skills found: {skills.count()}")
-        portfolio_data['skills'] = SkillSerializer(skills, many=True, context={'request': request}).data
-        
-        # Get Social Media
-        social_media = SocialMedia.objects.filter(user=user)
-        logger.info(f"Social Media found: {social_media.count()}")
-        portfolio_data['social_media'] = SocialMediaSerializer(social_media, many=True, context={'request': request}).data
-        
-        logger.info(f"Returning portfolio data for {user.username}")
-        return Response(portfolio_data, status=status.HTTP_200_OK)
+        # Published portfolios are served from their precomputed snapshot.
+        # The document itself is only loaded when the client's copy is stale.
+        snapshot = PortfolioSnapshot.objects.filter(user_id=resolved.user_id).defer('data').first()
+        if snapshot:
+            return snapshot_response(snapshot)
+        
+        # Published but no snapshot yet (e.g. published before snapshots existed and not backfilled):
+        # build the document for this response only, since a GET doesn't write
+        logger.info(f"Building unsaved portfolio snapshot for user ID: {resolved.user_id}")
+        snapshot = build_snapshot(resolved.user_id)
+        if snapshot is None:
+            # The cached resolution was stale and the portfolio has since been unpublished
+            return Response({
+                'error': 'Portfolio is not published. Please publish it from your dashboard.',
+                'username_slug': resolved.username_slug,
+                'portfolio_published': False,
+            }, status=status.HTTP_403_FORBIDDEN)
+        return snapshot_response(snapshot)
     except Exception as e:
         logger.error(f"Error fetching portfolio: {str(e)}", exc_info=True)
         return Response({
             'error': f'An error occurred while fetching portfolio: {str(e)}',
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@query_budget(10)
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def portfolios_by_slugs(request):
+    """Get many published portfolios in one response (?slugs=a,b,c)"""
+    import hashlib
+    from portfolio.models import PortfolioSnapshot
+    from portfolio.snapshots import build_snapshots_bulk, absolutize_media_urls
+    from portfolio.compression import precompressed_response, matching_etag
+    from portfolio.media_urls import absolute_url_builder
+    from rest_framework.renderers import JSONRenderer
+    
+    MAX_SLUGS = 50
+    
+    slugs = []
+    for slug in request.GET.get('slugs', '').split(','):
+        slug = slug.strip()
+        if slug and slug not in slugs:
+            slugs.append(slug)
+    
+    if not slugs:
+        return Response({
+            'error': 'The slugs query parameter is required (e.g. ?slugs=alice,bob).',
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(slugs) > MAX_SLUGS:
+        return Response({
+            'error': f'At most {MAX_SLUGS} slugs can be requested at once.',
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Resolve slugs to published profiles, falling back to usernames like the single-portfolio endpoint
+    profiles_by_slug = {}
+    for profile in UserProfile.objects.filter(username_slug__in=slugs, portfolio_published=True).select_related('user'):
+        profiles_by_slug[profile.username_slug] = profile
+    missing = [slug for slug in slugs if slug not in profiles_by_slug]
+    if missing:
+        for profile in UserProfile.objects.filter(user__username__in=missing, portfolio_published=True).select_related('user'):
+            profiles_by_slug.setdefault(profile.user.username, profile)
+    
+    profiles = {profile.user_id: profile for profile in profiles_by_slug.values()}
+    snapshots = {
+        snapshot.user_id: snapshot
+        for snapshot in PortfolioSnapshot.objects.filter(user_id__in=profiles.keys())
+    }
+    
+    # Portfolios published before snapshots existed are built together, section by section, and not saved
+    unbuilt = [profile for user_id, profile in profiles.items() if user_id not in snapshots]
+    if unbuilt:
+        logger.info(f"Building {len(unbuilt)} unsaved portfolio snapshots in bulk")
+        snapshots.update(build_snapshots_bulk(unbuilt))
+    
+    results = []
+    not_found = []
+    etag_parts = [f"{request.scheme}://{request.get_host()}"]
+    for slug in slugs:
+        profile = profiles_by_slug.get(slug)
+        snapshot = snapshots.get(profile.user_id) if profile else None
+        if snapshot is None:
+            not_found.append(slug)
+            etag_parts.append(f'{slug}:-')
+            continue
+        results.append(snapshot)
+        etag_parts.append(f'{slug}:{snapshot.etag}')
+    
+    etag = '"%s"' % hashlib.sha256('|'.join(etag_parts).encode('utf-8')).hexdigest()[:40]
+    client_etag = matching_etag(request, etag)
+    if client_etag:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = client_etag
+        return response
+    
+    def render():
+        build_url = absolute_url_builder(request)
+        return JSONRenderer().render({
+            'results': [absolutize_media_urls(snapshot.data, build_url) for snapshot in results],
+            'not_found': not_found,
+        })
+    
+    return precompressed_response(request, f'portfolios:{etag}', render, etag=etag)
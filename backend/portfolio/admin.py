@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     UserProfile, AboutMe, Project, Experience, Education, 
-    Skill, SocialMedia, ContactInfo, ContactMessage
+    Skill, SocialMedia, ContactInfo, ContactMessage, PortfolioSnapshot, MediaBlob
 )
 
 
@@ -10,7 +10,7 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'username_slug', 'is_approved', 'email_verified', 'portfolio_published', 'created_at')
     list_filter = ('is_approved', 'email_verified', 'portfolio_published', 'created_at')
     search_fields = ('user__username', 'user__email', 'username_slug')
-    readonly_fields = ('created_at', 'updated_at', 'email_verification_token')
+    readonly_fields = ('created_at', 'updated_at')
     fieldsets = (
         ('User Information', {
             'fields': ('user', 'username_slug')
@@ -92,3 +92,21 @@ class ContactMessageAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at', 'replied_at', 'user')
     search_fields = ('name', 'email', 'message', 'user__username', 'user__email')
     readonly_fields = ('created_at', 'updated_at', 'replied_at')
+
+
+@admin.register(PortfolioSnapshot)
+class PortfolioSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('username_slug', 'user', 'updated_at')
+    search_fields = ('username_slug', 'user__username')
+    readonly_fields = ('user', 'username_slug', 'data', 'created_at', 'updated_at')
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'ref_count', 'updated_at')
+    list_filter = ('ref_count',)
+    search_fields = ('name', 'sha256')
+    readonly_fields = ('name', 'sha256', 'ref_count', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,168 @@
+"""
+Precompressed encodings of response bodies.
+
+compress_variants() produces the gzip/brotli encodings of a body once.
+precompressed_response() keeps the identity body and those encodings together
+in the Django cache, keyed by a content-addressed key such as the response
+ETag, and picks one from the request's Accept-Encoding on every hit, so hot
+public responses are never compressed again per request.
+
+Each encoding is a different representation, so it gets a strong ETag of its
+own (encoding_etag(): "<etag>-gzip", "<etag>-br"); matching_etag() accepts any
+of them in If-None-Match.
+
+Brotli is optional: install the `brotli` package to get .br / `br` variants,
+otherwise only gzip is produced.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Preferred encoding first, used to break q-value ties
+ENCODING_PREFERENCE = ('br', 'gzip')
+
+# File suffix for each Content-Encoding
+ENCODING_SUFFIXES = {
+    'gzip': '.gz',
+    'br': '.br',
+}
+
+
+# Bodies are compressed on cache misses inside the request, where quality 11 costs
+# far more CPU than it saves bytes; 5 compresses about as well as gzip -9, faster
+DEFAULT_BROTLI_QUALITY = 5
+
+
+def compress_variants(body):
+    """Return {content_encoding: compressed bytes} for every encoding available"""
+    variants = {
+        # mtime=0 keeps the output byte-identical for identical input
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        quality = getattr(settings, 'PRECOMPRESSED_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+        variants['br'] = brotli.compress(body, quality=quality)
+    return variants
+
+
+def encoding_etag(etag, encoding=None):
+    """The strong ETag of the `encoding` representation of a body whose identity ETag is `etag`"""
+    if not encoding or encoding == 'identity':
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def matching_etag(request, etag):
+    """
+    The validator from If-None-Match that matches `etag` in any encoding, or None.
+
+    A 304 sends it back, so the client keeps the representation it already has.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return None
+    client_etags = parse_etags(if_none_match)
+    if '*' in client_etags:
+        return etag
+    for encoding in ('identity',) + ENCODING_PREFERENCE:
+        candidate = encoding_etag(etag, encoding)
+        if candidate in client_etags:
+            return candidate
+    return None
+
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+def choose_encoding(accept_encoding, available):
+    """Pick the best of `available` encodings allowed by an Accept-Encoding header, or None"""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    wildcard = qualities.get('*', 0.0)
+
+    best, best_quality = None, 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in available:
+            continue
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def precompressed_response(request, cache_key, render, status=200, content_type='application/json', timeout=None, etag=None):
+    """
+    Build a response from cached identity/gzip/brotli bodies.
+
+    `render` returns the identity body as bytes and is only called on a cache
+    miss. `cache_key` must change whenever the body does (e.g. include the ETag).
+    With `etag` (the identity body's), the response carries the ETag of the
+    encoding it was sent in.
+    """
+    key = f'precompressed:{cache_key}'
+    bodies = cache.get(key)
+    if bodies is None:
+        bodies = build_bodies(render())
+        cache.set(key, bodies, body_cache_timeout(timeout))
+    return encoded_response(request, bodies, status, content_type, etag)
+
+
+async def aprecompressed_response(request, cache_key, arender, status=200, content_type='application/json', timeout=None, etag=None):
+    """precompressed_response() for async views; `arender` is a coroutine function"""
+    key = f'precompressed:{cache_key}'
+    bodies = await cache.aget(key)
+    if bodies is None:
+        bodies = build_bodies(await arender())
+        await cache.aset(key, bodies, body_cache_timeout(timeout))
+    return encoded_response(request, bodies, status, content_type, etag)
+
+
+def build_bodies(body):
+    """{encoding: body} for an identity body: itself plus its compressed variants when it's big enough"""
+    bodies = {'identity': body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        bodies.update(compress_variants(body))
+    return bodies
+
+
+def body_cache_timeout(timeout=None):
+    if timeout is None:
+        timeout = getattr(settings, 'PRECOMPRESSED_CACHE_TIMEOUT', 60 * 60 * 24)
+    return timeout
+
+
+def encoded_response(request, bodies, status=200, content_type='application/json', etag=None):
+    """The response for the best of `bodies` allowed by the request's Accept-Encoding"""
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), bodies)
+    response = HttpResponse(bodies[encoding or 'identity'], status=status, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if etag:
+        response['ETag'] = encoding_etag(etag, encoding)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Length'] = str(len(response.content))
+    return response
@@ -0,0 +1,113 @@
+"""
+Contact message digests.
+
+Owners who enable UserProfile.message_digest get one email per period
+(MESSAGE_DIGEST_INTERVAL_HOURS, default 24) listing the messages received
+since the previous digest, instead of having to check the dashboard.
+message_digest_sent_at is the end of the period the last digest covered, so
+every message is reported exactly once.
+
+send_message_digests() runs hourly as a periodic task (or from cron through
+the send_message_digests command) and works in chunks of owners: per chunk,
+one query finds each owner's newest messages in their own (user, created_at)
+window, one counts them, one INSERT queues all emails and one UPDATE moves the
+windows forward, in the same transaction as the INSERT.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+from datetime import timedelta
+import logging
+
+from core.mail import queue_mass_mail
+from .models import UserProfile, ContactMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_HOURS = 24
+# Messages shown in full per digest; the rest are only counted
+DIGEST_MESSAGE_LIMIT = 20
+CHUNK_SIZE = 200
+
+
+def get_digest_interval():
+    return timedelta(hours=getattr(settings, 'MESSAGE_DIGEST_INTERVAL_HOURS', DEFAULT_INTERVAL_HOURS))
+
+
+def send_message_digests(now=None):
+    """Queue the digests of every owner whose period is over; returns how many emails were queued"""
+    now = now or timezone.now()
+    interval = get_digest_interval()
+    due = (UserProfile.objects
+           .filter(message_digest=True)
+           .filter(Q(message_digest_sent_at__isnull=True) | Q(message_digest_sent_at__lte=now - interval))
+           .order_by('user_id'))
+    queued = 0
+    last_user_id = 0
+    while True:
+        # Keyset pagination: the UPDATE below takes finished owners out of `due`
+        chunk = list(due.filter(user_id__gt=last_user_id).values_list('user_id', 'message_digest_sent_at')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_user_id = chunk[-1][0]
+        queued += send_digest_chunk({user_id: sent_at or now - interval for user_id, sent_at in chunk}, now)
+    return queued
+
+
+def send_digest_chunk(windows, now):
+    """Digests for {user_id: window start}; returns how many emails were queued"""
+    in_window = Q()
+    for user_id, since in windows.items():
+        in_window |= Q(user_id=user_id, created_at__gt=since)
+    in_window &= Q(created_at__lte=now)
+
+    counts = dict(
+        ContactMessage.objects.filter(in_window).order_by().values('user_id')
+        .annotate(total=Count('id')).values_list('user_id', 'total')
+    )
+    latest = {}
+    if counts:
+        rows = (ContactMessage.objects.filter(in_window)
+                .annotate(position=Window(RowNumber(), partition_by=[F('user_id')], order_by=F('created_at').desc()))
+                .filter(position__lte=DIGEST_MESSAGE_LIMIT)
+                .values('user_id', 'name', 'email', 'message', 'created_at')
+                .order_by('user_id', '-created_at'))
+        for row in rows:
+            latest.setdefault(row['user_id'], []).append(row)
+
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+    messages = []
+    for user in User.objects.filter(pk__in=counts).only('id', 'username', 'email', 'first_name'):
+        if not user.email:
+            continue
+        total = counts[user.id]
+        try:
+            html_message = render_to_string('email/message_digest.html', {
+                'user': user,
+                'messages': latest.get(user.id, []),
+                'total': total,
+                'remaining': max(0, total - DIGEST_MESSAGE_LIMIT),
+                'messages_url': f'{frontend_url}/dashboard/messages',
+            })
+        except Exception as e:
+            logger.error(f"Failed to render message digest for user ID {user.id}: {str(e)}", exc_info=True)
+            continue
+        messages.append({
+            'subject': f"You have {total} new message{'s' if total != 1 else ''} - Portfy",
+            'message': strip_tags(html_message),
+            'from_email': settings.DEFAULT_FROM_EMAIL,
+            'recipient_list': [user.email],
+            'html_message': html_message,
+        })
+
+    with transaction.atomic():
+        if messages:
+            queue_mass_mail(messages)
+        # Owners without new messages move on too, so quiet periods aren't re-read
+        UserProfile.objects.filter(user_id__in=windows).update(message_digest_sent_at=now)
+    return len(messages)
@@ -0,0 +1,240 @@
+"""
+Direct-to-storage uploads.
+
+Multipart uploads through the ModelViewSets keep a Django worker busy for the
+whole (often slow, mobile) transfer. Instead the client can:
+
+1. POST /api/v1/uploads/ {"target": "projects.project_image", "filename": "shot.jpg",
+   "content_type": "image/jpeg", "size": 3145728}
+   -> {"id", "upload_url", "method": "PUT", "headers": {...}, "expires_at"}
+2. PUT the bytes to upload_url, which goes straight to the object store
+3. POST /api/v1/uploads/<id>/confirm/ {"object_id": 12}
+   -> the updated record, as the section endpoint returns it
+
+Confirming copies the staged object into the field (through the same image
+checks as regular uploads) and deletes it from staging.
+
+Backends (DIRECT_UPLOAD_BACKEND):
+    'local' (default) - an S3-style stand-in for development and tests: signed,
+                        expiring PUT URLs served by Django, staged under
+                        DIRECT_UPLOAD_STAGING_ROOT (default MEDIA_ROOT/.uploads,
+                        which the media view never serves). The PUT still goes
+                        through a Django worker, so it doesn't take any load
+                        off the workers; use 's3' in production.
+    's3'              - presigned PUT URLs from S3 or any S3-compatible service
+                        (needs boto3; DIRECT_UPLOAD_S3_BUCKET and optionally
+                        DIRECT_UPLOAD_S3_ENDPOINT_URL).
+"""
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import os
+import tempfile
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - depends on the environment
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+SIGNING_SALT = 'portfolio.direct_uploads'
+
+DEFAULT_EXPIRY = 15 * 60
+DEFAULT_MAX_BYTES = 25 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_upload_targets():
+    """
+    {target: (model, field name, serializer class)}.
+
+    Targets are '<endpoint>.<field>', named after the section endpoints.
+    'profile.*' always targets the requester's own profile.
+    """
+    from core.serializers import UserProfileSerializer
+    from .models import UserProfile, AboutMe, Project, Skill, SocialMedia
+    from .serializers import AboutMeSerializer, ProjectSerializer, SkillSerializer, SocialMediaSerializer
+    return {
+        'profile.banner_image': (UserProfile, 'banner_image', UserProfileSerializer),
+        'about.profile_image': (AboutMe, 'profile_image', AboutMeSerializer),
+        'about.logo_image': (AboutMe, 'logo_image', AboutMeSerializer),
+        'about.cv_file': (AboutMe, 'cv_file', AboutMeSerializer),
+        'projects.project_image': (Project, 'project_image', ProjectSerializer),
+        'skills.icon_image': (Skill, 'icon_image', SkillSerializer),
+        'social-media.icon_image': (SocialMedia, 'icon_image', SocialMediaSerializer),
+    }
+
+
+def get_expiry():
+    return getattr(settings, 'DIRECT_UPLOAD_EXPIRY', DEFAULT_EXPIRY)
+
+
+def get_max_bytes(target):
+    model, field, _ = get_upload_targets()[target]
+    if isinstance(model._meta.get_field(field), models.ImageField):
+        from .uploads import get_upload_limits
+        return get_upload_limits()['max_bytes']
+    return getattr(settings, 'DIRECT_UPLOAD_MAX_BYTES', DEFAULT_MAX_BYTES)
+
+
+def staging_key(upload):
+    return f'pending/{upload.pk}'
+
+
+class LocalUploadBackend:
+    """Filesystem stand-in for an object store, with signed PUT URLs handled by direct_upload_store"""
+
+    def __init__(self):
+        root = getattr(settings, 'DIRECT_UPLOAD_STAGING_ROOT', None) or os.path.join(settings.MEDIA_ROOT, '.uploads')
+        self.storage = FileSystemStorage(location=root)
+
+    def presign(self, upload, request):
+        token = signing.dumps(str(upload.pk), salt=SIGNING_SALT)
+        url = request.build_absolute_uri(reverse('direct-upload-store', args=[token]))
+        return url, {'Content-Type': upload.content_type}
+
+    def receive(self, upload, stream, length):
+        """Store a PUT body; returns the number of bytes written (nothing is kept unless it's `length`)"""
+        key = staging_key(upload)
+        if self.storage.exists(key):
+            # PUT replaces the object, as on S3
+            self.storage.delete(key)
+        path = self.storage.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        written = 0
+        with open(path, 'wb') as f:
+            while written < length:
+                chunk = stream.read(min(CHUNK_SIZE, length - written))
+                if not chunk:
+                    break
+                f.write(chunk)
+                written += len(chunk)
+        if written != length:
+            # A truncated body must never be confirmed
+            self.storage.delete(key)
+        return written
+
+    def size(self, upload):
+        key = staging_key(upload)
+        return self.storage.size(key) if self.storage.exists(key) else None
+
+    def open(self, upload):
+        return self.storage.open(staging_key(upload), 'rb')
+
+    def delete(self, upload):
+        self.storage.delete(staging_key(upload))
+
+
+class S3UploadBackend:
+    """Presigned PUT URLs on S3 or an S3-compatible service"""
+
+    def __init__(self):
+        if boto3 is None:
+            raise RuntimeError("DIRECT_UPLOAD_BACKEND = 's3' needs the boto3 package")
+        self.bucket = settings.DIRECT_UPLOAD_S3_BUCKET
+        self.client = boto3.client('s3', endpoint_url=getattr(settings, 'DIRECT_UPLOAD_S3_ENDPOINT_URL', None))
+
+    def presign(self, upload, request):
+        url = self.client.generate_presigned_url(
+            'put_object',
+            # Signing the length makes S3 reject any other body size, like the local backend
+            Params={'Bucket': self.bucket, 'Key': staging_key(upload), 'ContentType': upload.content_type,
+                    'ContentLength': upload.size},
+            ExpiresIn=get_expiry(),
+        )
+        return url, {'Content-Type': upload.content_type}
+
+    def size(self, upload):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=staging_key(upload))['ContentLength']
+        except ClientError:
+            return None
+
+    def open(self, upload):
+        # Spool to a temporary file so large objects never sit in memory
+        spool = tempfile.TemporaryFile()
+        self.client.download_fileobj(self.bucket, staging_key(upload), spool)
+        spool.seek(0)
+        return spool
+
+    def delete(self, upload):
+        self.client.delete_object(Bucket=self.bucket, Key=staging_key(upload))
+
+
+UPLOAD_BACKENDS = {
+    'local': LocalUploadBackend,
+    's3': S3UploadBackend,
+}
+
+
+def get_upload_backend():
+    return UPLOAD_BACKENDS[getattr(settings, 'DIRECT_UPLOAD_BACKEND', 'local')]()
+
+
+def attach_upload(upload, instance):
+    """
+    Move a staged upload into its field on `instance` and save it.
+
+    Raises ValueError (with a user-facing message) when the upload is missing
+    or isn't acceptable; DRF ValidationErrors from the image checks pass through.
+    """
+    from .uploads import process_uploaded_image
+
+    _, field_name, _ = get_upload_targets()[upload.target]
+    field = instance._meta.get_field(field_name)
+    backend = get_upload_backend()
+
+    size = backend.size(upload)
+    if size is None:
+        raise ValueError('The file has not been uploaded yet')
+    if size != upload.size:
+        # Larger, or a truncated transfer
+        raise ValueError(f'The uploaded file is {size} bytes, not the {upload.size} bytes that were declared')
+
+    with backend.open(upload) as staged:
+        content = File(staged, name=upload.filename)
+        if isinstance(field, models.ImageField):
+            content = process_uploaded_image(content)
+        for validator in field.validators:
+            try:
+                validator(content)
+            except Exception as e:
+                raise ValueError('; '.join(getattr(e, 'messages', [str(e)])))
+        # Saving the row fires the usual signals: blob counting, image variants, snapshot rebuild
+        getattr(instance, field_name).save(content.name, content, save=True)
+
+    try:
+        backend.delete(upload)
+    except Exception as e:
+        logger.warning(f"Could not delete staged upload {upload.pk}: {str(e)}")
+    upload.status = 'confirmed'
+    upload.save(update_fields=['status'])
+    return instance
+
+
+def purge_expired_uploads():
+    """Delete unconfirmed uploads past their expiry and their staged objects; returns how many"""
+    from .models import PendingUpload
+
+    # Keep a margin so a PUT that started just before expiry can finish
+    cutoff = timezone.now() - timedelta(seconds=get_expiry())
+    expired = list(PendingUpload.objects.filter(status='pending', expires_at__lt=cutoff))
+    if not expired:
+        return 0
+    backend = get_upload_backend()
+    for upload in expired:
+        try:
+            backend.delete(upload)
+        except Exception as e:
+            logger.warning(f"Could not delete staged upload {upload.pk}: {str(e)}")
+    PendingUpload.objects.filter(pk__in=[upload.pk for upload in expired]).delete()
+    return len(expired)
@@ -0,0 +1,92 @@
+"""
+Static export of published portfolios.
+
+Each published portfolio is written to PORTFOLIO_EXPORT_ROOT as <slug>.json
+(the same document portfolio_by_username returns) together with precompressed
+<slug>.json.gz and, when brotli is installed, <slug>.json.br, so nginx
+(gzip_static / brotli_static) or a CDN can serve them without Django.
+
+`manage.py export_portfolios` writes everything; with PORTFOLIO_EXPORT_ROOT
+set, rebuild_snapshot() also keeps the files in sync as portfolios change and
+deletes them when a portfolio is unpublished.
+
+Media URLs are made absolute with PORTFOLIO_EXPORT_MEDIA_BASE_URL
+(e.g. https://portfy.example.com); when unset they stay site-relative.
+"""
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+import logging
+import os
+import tempfile
+
+from .compression import compress_variants, ENCODING_SUFFIXES
+from .snapshots import absolutize_media_urls
+
+logger = logging.getLogger(__name__)
+
+
+def get_export_root():
+    return getattr(settings, 'PORTFOLIO_EXPORT_ROOT', None)
+
+
+def export_paths(root, slug):
+    """All files that may exist for a slug: the JSON document and its compressed variants"""
+    base = os.path.join(root, f'{slug}.json')
+    return [base] + [base + suffix for suffix in ENCODING_SUFFIXES.values()]
+
+
+def render_export(snapshot):
+    base_url = getattr(settings, 'PORTFOLIO_EXPORT_MEDIA_BASE_URL', '').rstrip('/')
+    data = snapshot.data
+    if base_url:
+        data = absolutize_media_urls(data, lambda path: f'{base_url}{path}')
+    return JSONRenderer().render(data)
+
+
+def _write_atomic(path, content):
+    # Write to a temporary file first so readers never see a half-written document
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_portfolio_export(snapshot, root=None):
+    """Write <slug>.json and its compressed variants; returns the paths written"""
+    root = root or get_export_root()
+    if not root:
+        return []
+    os.makedirs(root, exist_ok=True)
+
+    body = render_export(snapshot)
+    path = os.path.join(root, f'{snapshot.username_slug}.json')
+    written = [path]
+    _write_atomic(path, body)
+    for encoding, content in compress_variants(body).items():
+        _write_atomic(path + ENCODING_SUFFIXES[encoding], content)
+        written.append(path + ENCODING_SUFFIXES[encoding])
+    return written
+
+
+def delete_portfolio_export(slug, root=None):
+    """Remove every exported file for a slug; returns the paths removed"""
+    root = root or get_export_root()
+    if not root or not slug:
+        return []
+    removed = []
+    for path in export_paths(root, slug):
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info(f"Removed static portfolio export for {slug}")
+    return removed
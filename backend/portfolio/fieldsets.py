@@ -0,0 +1,139 @@
+"""
+Sparse fieldsets and section selection.
+
+Clients can ask for less data:
+
+    GET /api/v1/portfolio/alice/?sections=about_me,projects&fields[projects]=title,project_image
+    GET /api/v1/projects/?fields=title,project_image        (or fields[projects]=...)
+
+On the public portfolio the snapshot document is trimmed before it is sent.
+On the owner ViewSets, unrequested columns are deferred in SQL with .only()
+and dropped from the serializer.
+"""
+from django.db import models
+
+# Top-level sections of the public portfolio document
+PORTFOLIO_SECTIONS = ('profile', 'about_me', 'projects', 'experiences', 'educations', 'skills', 'social_media')
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_sections(query_params, allowed=PORTFOLIO_SECTIONS):
+    """Sections listed in ?sections=, or None when every section is wanted (ValueError if unknown)"""
+    value = query_params.get('sections')
+    if value is None:
+        return None
+    sections = _split(value)
+    unknown = [section for section in sections if section not in allowed]
+    if unknown:
+        raise ValueError(f'Unknown sections: {", ".join(unknown)}. Valid sections are: {", ".join(allowed)}')
+    return sections
+
+
+def parse_fields(query_params, section=None):
+    """
+    Requested fields per section from ?fields[<section>]=a,b.
+
+    With `section`, also accepts a bare ?fields=a,b and returns that section's
+    list (or None). Without it, returns {section: [fields]}.
+    """
+    requested = {}
+    for key in query_params.keys():
+        if key.startswith('fields[') and key.endswith(']'):
+            requested[key[len('fields['):-1]] = _split(query_params.get(key))
+    if section is None:
+        return requested
+    if section in requested:
+        return requested[section]
+    if 'fields' in query_params:
+        return _split(query_params.get('fields'))
+    return None
+
+
+def fieldsets_key(sections=None, fields=None, allowed=PORTFOLIO_SECTIONS):
+    """
+    Canonical string for a parse_sections()/parse_fields() selection.
+
+    Equal selections give equal keys whatever the parameter order, and nothing
+    else in the query string (utm_*, cache busters) is part of it.
+    """
+    parts = ['sections=' + ('*' if sections is None else ','.join(sorted(set(sections))))]
+    for section in sorted(fields or {}):
+        if section not in allowed or (sections is not None and section not in sections):
+            continue
+        parts.append(f'fields[{section}]=' + ','.join(sorted(set(fields[section]))))
+    return '&'.join(parts)
+
+
+def apply_sparse_fieldsets(data, sections=None, fields=None):
+    """Trim a portfolio document to the requested sections and per-section fields"""
+    if sections is None and not fields:
+        return data
+    result = {}
+    for section, value in data.items():
+        if sections is not None and section not in sections:
+            continue
+        wanted = (fields or {}).get(section)
+        if wanted is not None and value is not None:
+            # Document order, not request order, so equal selections render equal bodies
+            if isinstance(value, list):
+                value = [{key: item_value for key, item_value in item.items() if key in wanted} for item in value]
+            else:
+                value = {key: field_value for key, field_value in value.items() if key in wanted}
+        result[section] = value
+    return result
+
+
+class SparseFieldsSerializerMixin:
+    """Serializer mixin that only exposes the fields listed in context['sparse_fields']"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('sparse_fields')
+        if requested:
+            for name in list(fields):
+                if name not in requested:
+                    fields.pop(name)
+        return fields
+
+
+class SparseFieldsetMixin:
+    """
+    ViewSet mixin for ?fields= on list/retrieve.
+
+    sparse_section names the section for ?fields[<section>]=; it matches the
+    key used in the public portfolio document.
+    """
+    sparse_section = None
+    # Columns always loaded, for ownership checks
+    sparse_required_columns = ('id', 'user')
+
+    def get_sparse_fields(self):
+        if getattr(self, 'action', None) not in ('list', 'retrieve'):
+            return None
+        return parse_fields(self.request.query_params, self.sparse_section)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        requested = self.get_sparse_fields()
+        if requested:
+            model = queryset.model
+            concrete = {field.name for field in model._meta.concrete_fields}
+            columns = [name for name in requested if name in concrete]
+            columns += [name for name in self.sparse_required_columns if name in concrete and name not in columns]
+            if 'image_variants' in concrete and any(
+                isinstance(model._meta.get_field(name), models.FileField) for name in columns
+            ):
+                # Serializers read the variants to build <field>_srcset
+                columns.append('image_variants')
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        requested = self.get_sparse_fields()
+        if requested:
+            context['sparse_fields'] = requested
+        return context
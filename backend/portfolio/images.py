@@ -0,0 +1,306 @@
+"""
+Responsive image variants.
+
+Uploaded images are often multi-megabyte phone photos. After an upload
+commits, each image field listed in get_image_variant_fields() gets resized copies
+at fixed widths (IMAGE_VARIANT_WIDTHS) in WebP and JPEG, written next to the
+original under variants/. Their storage names are recorded in the row's
+`image_variants` JSON field:
+
+    {'project_image': {'source': 'projects/x.jpg',
+                       'webp': {'320': 'variants/projects/x-320w.webp', ...},
+                       'jpeg': {'320': 'variants/projects/x-320w.jpg', ...}}}
+
+The entry also holds `placeholder`, a tiny blurred copy as a data: URI (a few
+hundred bytes) that the page can paint while the real image loads.
+
+Serializers expose them as `<field>_srcset`, e.g.
+{'webp': '/media/variants/projects/x-320w.webp 320w, ...', 'jpeg': '...'},
+ready for <picture><source srcset>, and `<field>_placeholder`.
+
+Variants are derived from the source's storage name, which is a content hash
+when content-addressed storage is on (portfolio/storage.py), so rows sharing a
+blob share its variants; they are removed only once no row references the blob.
+
+Generation runs after the transaction commits, so the upload request doesn't
+wait for Pillow: as a generate_image_variants task when the task queue is
+enabled (TASK_QUEUE_ENABLED, recommended in production: it's out of the web
+process and survives restarts), otherwise on a small thread pool of
+IMAGE_VARIANTS_MAX_WORKERS threads (default 2) per process, which bounds how
+many images are decoded at once but loses queued work on shutdown.
+IMAGE_VARIANTS_BACKGROUND = False runs it inline instead.
+`manage.py generate_image_variants` backfills existing images.
+"""
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections, transaction
+from PIL import Image, ImageFilter, ImageOps, features
+import base64
+import io
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANT_WIDTHS = (320, 640, 1280)
+
+# (key in image_variants, Pillow format, file extension, save options)
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+# Width of the inline placeholder; the browser scales it up behind a blur
+PLACEHOLDER_WIDTH = 16
+
+DEFAULT_MAX_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide pool that generates variants when the task queue is off"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANTS_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def get_image_variant_fields():
+    """{model: (image field names)} for every model that gets variants"""
+    from .models import UserProfile, AboutMe, Project, Skill, SocialMedia
+    return {
+        UserProfile: ('banner_image',),
+        AboutMe: ('profile_image',),
+        Project: ('project_image',),
+        Skill: ('icon_image',),
+        SocialMedia: ('icon_image',),
+    }
+
+
+def get_variant_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_VARIANT_WIDTHS)))
+
+
+def variant_name(source_name, width, extension):
+    """Storage name of a variant, e.g. projects/x.jpg -> variants/projects/x-320w.webp"""
+    stem, _ = os.path.splitext(source_name)
+    return f'variants/{stem}-{width}w.{extension}'
+
+
+def build_placeholder(image):
+    """Tiny blurred copy of an image as a data: URI"""
+    width = min(PLACEHOLDER_WIDTH, image.width)
+    height = max(1, round(image.height * width / image.width))
+    thumbnail = image.resize((width, height), Image.BILINEAR).filter(ImageFilter.GaussianBlur(1))
+    if thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    buffer = io.BytesIO()
+    if features.check('webp'):
+        thumbnail.save(buffer, 'WEBP', quality=40)
+        mime_type = 'image/webp'
+    else:
+        thumbnail.save(buffer, 'JPEG', quality=40)
+        mime_type = 'image/jpeg'
+    return f"data:{mime_type};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+def generate_variants(fieldfile):
+    """Write resized WebP/JPEG copies of an image; returns its image_variants entry"""
+    from .storage import is_blob
+
+    entry = {'source': fieldfile.name}
+    # Variants get plain names; content-addressing them would lose the source-derived name
+    storage = default_storage
+    with fieldfile.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    # Phone photos are usually rotated through EXIF; bake the orientation in
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+
+    entry['placeholder'] = build_placeholder(image)
+
+    original_width = image.width
+    widths = [width for width in get_variant_widths() if width < original_width]
+    if not widths or widths[-1] < min(original_width, get_variant_widths()[-1]):
+        # Never upscale, but always offer the largest size we're allowed to serve
+        widths.append(min(original_width, get_variant_widths()[-1]))
+
+    for key, image_format, extension, options in VARIANT_FORMATS:
+        if image_format == 'WEBP' and not features.check('webp'):
+            continue
+        entry[key] = {}
+        for width in widths:
+            name = variant_name(fieldfile.name, width, extension)
+            exists = storage.exists(name)
+            if exists and is_blob(fieldfile.name):
+                # Blobs never change, so existing variants of a shared blob are still valid
+                entry[key][str(width)] = name
+                continue
+            height = max(1, round(image.height * width / original_width))
+            resized = image.resize((width, height), Image.LANCZOS) if width != original_width else image
+            if image_format == 'JPEG' and resized.mode != 'RGB':
+                # JPEG has no alpha channel; flatten onto white
+                background = Image.new('RGB', resized.size, (255, 255, 255))
+                background.paste(resized, mask=resized.getchannel('A') if resized.mode == 'RGBA' else None)
+                resized = background
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            if exists:
+                storage.delete(name)
+            entry[key][str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+    return entry
+
+
+def delete_variants(entry, storage=None):
+    """Remove the files of an image_variants entry, unless another row still uses its source blob"""
+    from .storage import is_shared
+
+    if not entry or is_shared(entry.get('source')):
+        return
+    storage = storage or default_storage
+    for key, _, _, _ in VARIANT_FORMATS:
+        for name in (entry or {}).get(key, {}).values():
+            try:
+                storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Could not delete image variant {name}: {str(e)}")
+
+
+def is_current(entry, fieldfile):
+    """Whether an image_variants entry was generated from the field's current file"""
+    if not fieldfile:
+        return not entry
+    if not entry or entry.get('source') != fieldfile.name:
+        return False
+    # Entries from before placeholders existed are regenerated; failed ones are not retried
+    return entry.get('failed', False) or 'placeholder' in entry
+
+
+def needs_variants(instance):
+    """Whether any image field changed since its variants were generated"""
+    recorded = instance.image_variants or {}
+    return any(
+        not is_current(recorded.get(field), getattr(instance, field))
+        for field in get_image_variant_fields().get(type(instance), ())
+    )
+
+
+def process_image_variants(model, pk):
+    """Bring a row's image_variants in line with its current images"""
+    from .snapshots import schedule_snapshot_rebuild
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    variants = dict(instance.image_variants or {})
+    changed = False
+    for field in get_image_variant_fields()[model]:
+        fieldfile = getattr(instance, field)
+        current = variants.get(field)
+        if not fieldfile:
+            if current:
+                delete_variants(current)
+                variants.pop(field)
+                changed = True
+            continue
+        if is_current(current, fieldfile):
+            continue
+        if current:
+            delete_variants(current)
+        try:
+            variants[field] = generate_variants(fieldfile)
+        except Exception as e:
+            # Record the source anyway so a broken upload isn't retried on every save
+            logger.error(f"Error generating image variants for {model.__name__} {pk}.{field}: {str(e)}", exc_info=True)
+            variants[field] = {'source': fieldfile.name, 'failed': True}
+        changed = True
+
+    if changed:
+        # update() skips the post_save signals, so this doesn't schedule itself again
+        model.objects.filter(pk=pk).update(image_variants=variants)
+        instance.image_variants = variants
+        schedule_snapshot_rebuild(instance.user_id)
+        logger.info(f"Generated image variants for {model.__name__} {pk}")
+    return instance
+
+
+def schedule_image_variants(instance):
+    """Generate variants for a row once the current transaction commits"""
+    model, pk = type(instance), instance.pk
+
+    from core.taskqueue import queue_enabled
+    if queue_enabled():
+        from .tasks import generate_image_variants
+        generate_image_variants.schedule(args=[model._meta.label, pk], key=f'image-variants:{model._meta.label}:{pk}')
+        return
+
+    def safe_process():
+        try:
+            process_image_variants(model, pk)
+        except Exception as e:
+            logger.error(f"Error processing image variants for {model.__name__} {pk}: {str(e)}", exc_info=True)
+
+    def run_in_background():
+        try:
+            safe_process()
+        finally:
+            # The pool thread opened its own connections
+            connections.close_all()
+
+    if getattr(settings, 'IMAGE_VARIANTS_BACKGROUND', True):
+        transaction.on_commit(lambda: get_executor().submit(run_in_background))
+    else:
+        transaction.on_commit(safe_process)
+
+
+def image_srcsets(instance, field, request=None):
+    """
+    srcset strings per format for an image field, or None when there are no variants.
+
+    URLs come from build_media_url(): absolute with a request or MEDIA_PUBLIC_BASE_URL, site-relative otherwise.
+    """
+    from .media_urls import build_media_url
+
+    entry = (getattr(instance, 'image_variants', None) or {}).get(field)
+    if not entry or entry.get('source') != getattr(instance, field).name:
+        # Missing or stale (a newer upload is still being processed)
+        return None
+    srcsets = {}
+    for key, _, _, _ in VARIANT_FORMATS:
+        sizes = entry.get(key)
+        if not sizes:
+            continue
+        srcsets[key] = ', '.join(
+            f'{build_media_url(name, request)} {width}w'
+            for width, name in sorted(sizes.items(), key=lambda item: int(item[0]))
+        )
+    return srcsets or None
+
+
+def image_placeholder(instance, field):
+    """Inline placeholder data: URI for an image field, or None"""
+    entry = (getattr(instance, 'image_variants', None) or {}).get(field)
+    if not entry or entry.get('source') != getattr(instance, field).name:
+        return None
+    return entry.get('placeholder')
+
+
+def add_image_derivatives(representation, instance, request=None):
+    """Add `<field>_srcset` and `<field>_placeholder` next to every image field in a serializer representation"""
+    for field in get_image_variant_fields().get(type(instance), ()):
+        if field in representation:
+            has_image = bool(representation[field])
+            representation[f'{field}_srcset'] = image_srcsets(instance, field, request) if has_image else None
+            representation[f'{field}_placeholder'] = image_placeholder(instance, field) if has_image else None
+    return representation
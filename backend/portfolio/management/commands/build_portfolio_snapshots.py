@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.snapshots import backfill_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Store the snapshots of published portfolios that have none, e.g. those published before snapshots '
+        'existed. Run once after upgrading; until then their public reads build the document per request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Profiles processed per batch (default: 200)')
+
+    def handle(self, *args, **options):
+        built = backfill_snapshots(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Built {built} missing snapshots'))
@@ -0,0 +1,204 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+import os
+
+from portfolio.direct_uploads import purge_expired_uploads
+from portfolio.images import VARIANT_FORMATS
+from portfolio.models import MediaBlob
+from portfolio.storage import BLOB_PREFIX, get_media_models, file_field_names, is_blob
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete media files that no row references any more (replaced or deleted uploads, '
+        'unreferenced blobs and their variants) once they are older than a grace period.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+        parser.add_argument('--grace-hours', type=float,
+                            default=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24),
+                            help='Keep unreferenced files younger than this (default: MEDIA_GC_GRACE_HOURS or 24)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Files checked and deleted per batch (default: 500)')
+        parser.add_argument('--checkpoint', help='File recording progress; an interrupted run resumes from it')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        checkpoint = options['checkpoint']
+        resume_after = None
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                resume_after = f.read().strip() or None
+            if resume_after:
+                self.stdout.write(f'Resuming after {resume_after}')
+
+        referenced = self.referenced_names()
+        scanned = deleted = freed = 0
+        batch = []
+
+        def flush():
+            nonlocal deleted, freed
+            for name, size in self.delete_batch(batch, dry_run):
+                deleted += 1
+                freed += size
+                self.stdout.write(f"{'Would delete' if dry_run else 'Deleted'} {name}")
+            if checkpoint and not dry_run:
+                with open(checkpoint, 'w') as f:
+                    f.write(batch[-1])
+            batch.clear()
+
+        for name in self.walk(resume_after):
+            scanned += 1
+            if name in referenced:
+                continue
+            batch.append(name)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        if checkpoint and not dry_run and os.path.exists(checkpoint):
+            # Finished; the next run starts from the beginning
+            os.remove(checkpoint)
+
+        if not dry_run:
+            # Direct uploads that were never confirmed live outside MEDIA_ROOT's managed prefixes
+            purged = purge_expired_uploads()
+            if purged:
+                self.stdout.write(f'Purged {purged} expired direct uploads')
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} files. {verb} {deleted} orphaned files ({freed / (1024 * 1024):.1f} MB).'
+        ))
+
+    def managed_prefixes(self):
+        """Only directories our models upload into are collected"""
+        prefixes = {BLOB_PREFIX, 'variants/'}
+        for model in get_media_models():
+            for name in file_field_names(model):
+                upload_to = model._meta.get_field(name).upload_to
+                if isinstance(upload_to, str) and upload_to:
+                    prefixes.add(upload_to.rstrip('/') + '/')
+        return sorted(prefixes)
+
+    def walk(self, resume_after=None):
+        """
+        Yield every file under the managed prefixes in lexicographic order, one
+        directory listing at a time. With `resume_after`, skips everything up to
+        that name, pruning directories that lie entirely before it.
+        """
+        def walk_dir(path):
+            directories, files = default_storage.listdir(path)
+            # Sort as full paths would sort, so resuming by name comparison is exact
+            entries = [(f'{name}/', True) for name in directories] + [(name, False) for name in files]
+            for entry, is_directory in sorted(entries):
+                full = f'{path}{entry}'
+                if is_directory:
+                    if resume_after is None or full > resume_after or resume_after.startswith(full):
+                        yield from walk_dir(full)
+                elif not entry.startswith('.') and (resume_after is None or full > resume_after):
+                    yield full
+
+        for prefix in self.managed_prefixes():
+            if default_storage.exists(prefix.rstrip('/')):
+                yield from walk_dir(prefix)
+
+    def referenced_names(self):
+        """Every stored name a row points at: file fields, their image variants and counted blobs"""
+        referenced = set()
+        for model in get_media_models():
+            fields = file_field_names(model)
+            for row in model.objects.values_list('image_variants', *fields).iterator(chunk_size=2000):
+                variants, names = row[0], row[1:]
+                referenced.update(name for name in names if name)
+                referenced.update(self.variant_names(variants))
+        referenced.update(MediaBlob.objects.filter(ref_count__gt=0).values_list('name', flat=True).iterator(chunk_size=2000))
+        return referenced
+
+    @staticmethod
+    def variant_names(image_variants):
+        for entry in (image_variants or {}).values():
+            for key, _, _, _ in VARIANT_FORMATS:
+                yield from (entry.get(key) or {}).values()
+
+    def still_referenced(self, names):
+        """Re-check a batch against the database right before deleting, in case rows changed during the scan"""
+        names = list(names)
+        found = set()
+        for model in get_media_models():
+            fields = file_field_names(model)
+            query = Q()
+            for field in fields:
+                query |= Q(**{f'{field}__in': names})
+            for row in model.objects.filter(query).values_list(*fields):
+                found.update(row)
+        # Blobs that were counted again, or released too recently
+        active = MediaBlob.objects.filter(Q(ref_count__gt=0) | Q(updated_at__gt=self.cutoff))
+        blobs = [name for name in names if is_blob(name)]
+        found.update(active.filter(name__in=blobs).values_list('name', flat=True))
+        # Variants of such a blob may be reused before the row records them
+        variants = [name for name in names if name.startswith(f'variants/{BLOB_PREFIX}')]
+        if variants:
+            hashes = {self.variant_source_hash(name) for name in variants}
+            active_hashes = set(active.filter(sha256__in=hashes).values_list('sha256', flat=True))
+            found.update(name for name in variants if self.variant_source_hash(name) in active_hashes)
+        return found
+
+    @staticmethod
+    def variant_source_hash(name):
+        """variants/blobs/aa/bb/<sha256>-320w.webp -> <sha256>"""
+        return os.path.basename(name).rsplit('-', 1)[0]
+
+    def delete_batch(self, names, dry_run):
+        """Delete the unreferenced, old-enough files of a batch; yields (name, size)"""
+        keep = self.still_referenced(names)
+        for name in names:
+            if name in keep:
+                continue
+            try:
+                if default_storage.get_modified_time(name) > self.cutoff:
+                    continue
+                size = default_storage.size(name)
+            except FileNotFoundError:
+                continue
+            if not dry_run:
+                if is_blob(name):
+                    if not self.delete_blob(name):
+                        continue
+                else:
+                    default_storage.delete(name)
+            yield name, size
+
+    def delete_blob(self, name):
+        """
+        Delete an unreferenced blob, unless an upload reused it since the batch was checked.
+
+        The file only goes once its row is gone, deleted only while still
+        unreferenced and released before the cutoff; the row lock is held until
+        the file is removed, so a concurrent upload waits and then writes it again.
+        """
+        with transaction.atomic():
+            deleted, _ = MediaBlob.objects.filter(name=name, ref_count=0, updated_at__lt=self.cutoff).delete()
+            if deleted == 1:
+                default_storage.delete(name)
+                return True
+        if not MediaBlob.objects.filter(name=name).exists():
+            # A blob whose upload never got counted: give it a row, and it is collected
+            # after a grace period like any other unreferenced blob
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(name=name, sha256=os.path.basename(name).split('.')[0])
+            except IntegrityError:
+                pass
+        return False
@@ -0,0 +1,67 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from portfolio.images import get_image_variant_fields, process_image_variants
+from portfolio.snapshots import rebuild_snapshot
+from portfolio.storage import (
+    content_addressed_storage, get_media_models, file_field_names, is_blob, acquire_blob
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Move media uploaded under plain upload_to names into content-addressed blobs, '
+        'pointing rows at the shared copy. The old files are left in place, unreferenced.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would move without changing anything')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows read per batch (default: 200)')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = missing = 0
+        blobs = set()
+        user_ids = set()
+        image_fields = get_image_variant_fields()
+
+        for model in get_media_models():
+            fields = file_field_names(model)
+            rows = model.objects.only('pk', 'user', *fields)
+            for instance in rows.iterator(chunk_size=options['batch_size']):
+                updates = {}
+                for name in fields:
+                    fieldfile = getattr(instance, name)
+                    if not fieldfile or is_blob(fieldfile.name):
+                        continue
+                    if not fieldfile.storage.exists(fieldfile.name):
+                        self.stderr.write(f'Missing file for {model.__name__} {instance.pk}.{name}: {fieldfile.name}')
+                        missing += 1
+                        continue
+                    if dry_run:
+                        updates[name] = None
+                        continue
+                    with fieldfile.storage.open(fieldfile.name) as source:
+                        updates[name] = content_addressed_storage.save(fieldfile.name, File(source, fieldfile.name))
+                if not updates:
+                    continue
+                moved += len(updates)
+                if dry_run:
+                    continue
+                # update() skips the signals, so count the references here
+                model.objects.filter(pk=instance.pk).update(**updates)
+                for name in updates.values():
+                    acquire_blob(name)
+                    blobs.add(name)
+                if model in image_fields:
+                    process_image_variants(model, instance.pk)
+                if instance.user_id:
+                    user_ids.add(instance.user_id)
+
+        for user_id in user_ids:
+            rebuild_snapshot(user_id)
+
+        if dry_run:
+            self.stdout.write(f'Would move {moved} files ({missing} missing)')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Moved {moved} files into {len(blobs)} blobs ({missing} missing)'))
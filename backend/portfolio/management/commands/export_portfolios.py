@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+import os
+
+from portfolio.models import PortfolioSnapshot
+from portfolio.export import get_export_root, write_portfolio_export, delete_portfolio_export
+from portfolio.snapshots import backfill_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Write every published portfolio as <slug>.json plus precompressed .gz/.br '
+        'variants so a web server or CDN can serve them directly.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Export directory (default: PORTFOLIO_EXPORT_ROOT)')
+        parser.add_argument('--since', help='Only export portfolios whose snapshot changed after this ISO datetime')
+        parser.add_argument('--prune', action='store_true', help='Delete exported files of portfolios that are no longer published')
+        parser.add_argument('--batch-size', type=int, default=200, help='Profiles processed per batch (default: 200)')
+
+    def handle(self, *args, **options):
+        root = options['output'] or get_export_root()
+        if not root:
+            raise CommandError('Set PORTFOLIO_EXPORT_ROOT or pass --output.')
+        os.makedirs(root, exist_ok=True)
+
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+
+        batch_size = options['batch_size']
+
+        # Make sure every published portfolio has a snapshot, building missing ones in bulk
+        built = backfill_snapshots(batch_size)
+        if built:
+            self.stdout.write(f'Built {built} missing snapshots')
+
+        snapshots = PortfolioSnapshot.objects.all()
+        if since:
+            snapshots = snapshots.filter(updated_at__gt=since)
+
+        exported = 0
+        for snapshot in snapshots.iterator(chunk_size=batch_size):
+            write_portfolio_export(snapshot, root)
+            exported += 1
+        self.stdout.write(self.style.SUCCESS(f'Exported {exported} portfolios to {root}'))
+
+        if options['prune']:
+            published = set(PortfolioSnapshot.objects.values_list('username_slug', flat=True))
+            pruned = 0
+            for filename in os.listdir(root):
+                if not filename.endswith('.json'):
+                    continue
+                slug = filename[:-len('.json')]
+                if slug not in published:
+                    delete_portfolio_export(slug, root)
+                    pruned += 1
+            self.stdout.write(f'Pruned {pruned} unpublished portfolios')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.images import get_image_variant_fields, needs_variants, process_image_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive WebP/JPEG variants for images uploaded before variants existed (or whose variants are stale).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows read per batch (default: 200)')
+
+    def handle(self, *args, **options):
+        processed = 0
+        for model, fields in get_image_variant_fields().items():
+            rows = model.objects.only('pk', 'image_variants', *fields)
+            for instance in rows.iterator(chunk_size=options['batch_size']):
+                if needs_variants(instance):
+                    process_image_variants(model, instance.pk)
+                    processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed image variants for {processed} rows'))
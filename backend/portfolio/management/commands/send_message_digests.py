@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.digests import send_message_digests
+
+
+class Command(BaseCommand):
+    help = 'Queue the contact message digests that are due. runworker does this hourly; use this command to run it from cron instead.'
+
+    def handle(self, *args, **options):
+        queued = send_message_digests()
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} message digests'))
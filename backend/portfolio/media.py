@@ -0,0 +1,276 @@
+"""
+Media delivery.
+
+serve_media() replaces Django's DEBUG-only static() view for MEDIA_URL. It
+checks access, then either hands the transfer to the front proxy or streams
+the file itself:
+
+    MEDIA_SENDFILE_BACKEND = 'nginx'    -> X-Accel-Redirect: MEDIA_ACCEL_REDIRECT_PREFIX + path
+                                           (an `internal` nginx location aliased to MEDIA_ROOT)
+    MEDIA_SENDFILE_BACKEND = 'xsendfile' -> X-Sendfile: absolute path (Apache mod_xsendfile, lighttpd)
+    unset                               -> chunked streaming from Python with Range/206,
+                                           Last-Modified and If-Modified-Since support
+
+Access: CVs (AboutMe.cv_file) carry personal details, so they are served
+only for published (or system) portfolios, or to their owner and staff.
+Everything else under MEDIA_ROOT that the portfolio uses is public.
+
+Owners and staff are recognised by a session, a JWT Authorization header or
+an ?access= token: plain <a href> links can't carry the header, so the CV URLs
+the owner endpoints return include a token signed for that file and user,
+valid for MEDIA_ACCESS_TOKEN_LIFETIME seconds (default 1 hour).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from core.query_budget import query_budget
+from .storage import is_blob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Seconds a "who may read this file" decision is cached
+ACCESS_CACHE_TIMEOUT = 60
+
+ACCESS_TOKEN_SALT = 'portfolio.media.access'
+DEFAULT_ACCESS_TOKEN_LIFETIME = 60 * 60
+
+
+def access_cache_key(name):
+    return f"media-access:{hashlib.sha1(name.encode('utf-8')).hexdigest()}"
+
+
+def invalidate_media_access(*names):
+    """Forget cached access decisions once the current transaction commits, like the slug cache"""
+    keys = [access_cache_key(name) for name in dict.fromkeys(names) if name]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_cv_access(*user_ids):
+    """Forget the access decisions of these users' CVs, e.g. after their portfolios were (un)published"""
+    from .models import AboutMe
+
+    names = AboutMe.objects.filter(user_id__in=user_ids).exclude(cv_file='').values_list('cv_file', flat=True)
+    invalidate_media_access(*names)
+
+
+def access_signer(name):
+    # Salted with the file name, so a token only opens the file it was issued for
+    return signing.TimestampSigner(salt=f'{ACCESS_TOKEN_SALT}:{name}')
+
+
+def media_access_token(name, user_id):
+    """?access= token letting `user_id` read the private file `name` for a while"""
+    return access_signer(name).sign(str(user_id))
+
+
+def get_token_user_id(request, name):
+    """The user id of a valid ?access= token for this file, if any"""
+    token = request.GET.get('access')
+    if not token:
+        return None
+    lifetime = getattr(settings, 'MEDIA_ACCESS_TOKEN_LIFETIME', DEFAULT_ACCESS_TOKEN_LIFETIME)
+    try:
+        return int(access_signer(name).unsign(token, max_age=lifetime))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def get_private_owners(name):
+    """
+    None when a file is public, otherwise the user ids allowed to read it.
+
+    Only CV files can be private: a CV is public while any portfolio using it
+    is published (or belongs to the system portfolio).
+    """
+    from .models import AboutMe
+
+    key = access_cache_key(name)
+    cached = cache.get(key)
+    if cached is not None:
+        return None if cached == 'public' else cached
+
+    rows = list(AboutMe.objects.filter(cv_file=name).values_list('user_id', 'user__profile__portfolio_published'))
+    if not rows or any(user_id is None or published for user_id, published in rows):
+        owners = None
+    else:
+        owners = sorted(user_id for user_id, _ in rows)
+    cache.set(key, 'public' if owners is None else owners, ACCESS_CACHE_TIMEOUT)
+    return owners
+
+
+def get_request_user(request):
+    """The user behind a session (admin) or a JWT Authorization header, if any"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (InvalidToken, TokenError):
+        return None
+    return result[0] if result else None
+
+
+def can_access(request, name):
+    owners = get_private_owners(name)
+    if owners is None:
+        return True
+    token_user_id = get_token_user_id(request, name)
+    if token_user_id is not None and (
+        token_user_id in owners or get_user_model().objects.filter(pk=token_user_id, is_staff=True).exists()
+    ):
+        return True
+    user = get_request_user(request)
+    return user is not None and (user.is_staff or user.id in owners)
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single-range `Range: bytes=` header.
+
+    Returns None to serve the whole file (no header, or a form we don't handle
+    such as multiple ranges) and raises ValueError when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def stream_file(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path, stat):
+    """Stream a file from Python, honouring Range and conditional requests"""
+    size = stat.st_size
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    # If-Range with a stale date means the client's partial copy is outdated: send everything
+    if not if_range or parse_http_date_safe(if_range) == int(stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        status = 206
+    else:
+        start, end = 0, size - 1
+        status = 200
+    length = max(0, end - start + 1)
+
+    content = [] if request.method == 'HEAD' else stream_file(path, start, length)
+    response = StreamingHttpResponse(content, status=status)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    return response
+
+
+def offloaded_response(path, name):
+    """Let the front proxy send the file; returns None when no backend is configured"""
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+    if not backend:
+        return None
+    response = HttpResponse()
+    if backend == 'nginx':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{name}"
+    elif backend == 'xsendfile':
+        response['X-Sendfile'] = path
+    else:
+        logger.error(f"Unknown MEDIA_SENDFILE_BACKEND {backend!r}, streaming from Python")
+        return None
+    return response
+
+
+@query_budget(2)
+@require_safe
+def serve_media(request, path):
+    """Serve a file from MEDIA_ROOT (see module docstring)"""
+    name = path.replace('\\', '/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    name = os.path.relpath(full_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    if any(part.startswith('.') for part in name.split('/')):
+        # Temporary and checkpoint files are never served
+        raise Http404('File not found')
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    if not can_access(request, name):
+        # Don't reveal that the file exists
+        raise Http404('File not found')
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), int(stat.st_mtime)):
+        response = HttpResponseNotModified()
+    else:
+        response = offloaded_response(full_path, name) or file_response(request, full_path, stat)
+        content_type, encoding = mimetypes.guess_type(full_path)
+        if response.status_code != 416:
+            response['Content-Type'] = content_type or 'application/octet-stream'
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if get_private_owners(name) is not None:
+        response['Cache-Control'] = 'private, no-cache'
+    elif is_blob(name):
+        # Content-addressed: the bytes behind this URL never change
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=3600'
+    return response
@@ -0,0 +1,125 @@
+"""
+Media URL building shared by every serializer.
+
+Serializers used to turn each file field into a URL by hand: check for
+'http', prefix /media/, then call request.build_absolute_uri() per field per
+row. build_media_url() does it in one place:
+
+- With MEDIA_PUBLIC_BASE_URL set (e.g. 'https://cdn.example.com/media/'),
+  URLs are that base plus the storage name, no request needed.
+- Otherwise MEDIA_URL is used, made absolute with the request's scheme and
+  host, which are parsed once per request and reused for every field.
+- Without a request (snapshots) URLs stay site-relative.
+
+With MEDIA_URL_VERSIONING = True, URLs of files whose name doesn't already
+change with their content get a ?v=<content hash> cache-busting query, so a
+CDN can cache them for long. Content-addressed blobs and their variants never
+need one. Hashes are computed once per file name and process.
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.encoding import filepath_to_uri
+from functools import lru_cache
+from urllib.parse import quote
+from rest_framework import serializers
+import hashlib
+import logging
+
+from .storage import BLOB_PREFIX, is_blob
+
+logger = logging.getLogger(__name__)
+
+# Length of the ?v= version hash
+VERSION_LENGTH = 12
+
+
+def request_origin(request):
+    """scheme://host of a request, computed once per request"""
+    origin = getattr(request, '_media_origin', None)
+    if origin is None:
+        origin = f'{request.scheme}://{request.get_host()}'
+        request._media_origin = origin
+    return origin
+
+
+def absolute_url_builder(request):
+    """Callable turning site-relative paths into absolute URLs for this request"""
+    origin = request_origin(request)
+    return lambda path: f'{origin}{path}'
+
+
+def media_prefix():
+    """Where storage names are published: MEDIA_PUBLIC_BASE_URL, or MEDIA_URL"""
+    base = getattr(settings, 'MEDIA_PUBLIC_BASE_URL', '') or settings.MEDIA_URL or '/media/'
+    if not base.startswith(('http://', 'https://', '/')):
+        base = f'/{base}'
+    return base if base.endswith('/') else f'{base}/'
+
+
+@lru_cache(maxsize=4096)
+def file_version(name):
+    """Short content hash of a stored file (names aren't reused, so this can be cached per name)"""
+    digest = hashlib.sha256()
+    try:
+        with default_storage.open(name, 'rb') as f:
+            for chunk in f.chunks():
+                digest.update(chunk)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not hash media file {name} for versioning: {str(e)}")
+        return None
+    return digest.hexdigest()[:VERSION_LENGTH]
+
+
+def media_version(name):
+    if not getattr(settings, 'MEDIA_URL_VERSIONING', False):
+        return None
+    if is_blob(name) or name.startswith(f'variants/{BLOB_PREFIX}'):
+        # The name already is the content hash
+        return None
+    return file_version(name)
+
+
+def build_media_url(name, request=None):
+    """Public URL of a stored file name (see module docstring); None for an empty name"""
+    if not name:
+        return None
+    if name.startswith(('http://', 'https://')):
+        return name
+    url = f'{media_prefix()}{filepath_to_uri(name)}'
+    if request is not None and url.startswith('/'):
+        url = f'{request_origin(request)}{url}'
+    version = media_version(name)
+    if version:
+        url = f'{url}?v={version}'
+    return url
+
+
+class MediaURLFieldMixin:
+    """Serializer file field mixin that renders its value with build_media_url()"""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return build_media_url(value.name, self.context.get('request'))
+
+
+class MediaFileField(MediaURLFieldMixin, serializers.FileField):
+    pass
+
+
+class PrivateMediaFileField(MediaFileField):
+    """
+    File field whose file may be private (see media.py). The row's owner and
+    staff get the URL with an ?access= token, so it also opens from a plain link.
+    """
+
+    def to_representation(self, value):
+        url = super().to_representation(value)
+        user = getattr(self.context.get('request'), 'user', None)
+        if url is None or user is None or not user.is_authenticated:
+            return url
+        if not (user.is_staff or user.id == getattr(value.instance, 'user_id', None)):
+            return url
+        from .media import media_access_token
+        token = quote(media_access_token(value.name, user.id))
+        return f"{url}{'&' if '?' in url else '?'}access={token}"
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0010_add_otp_expiration'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username_slug', models.SlugField(help_text='Copy of the profile slug so the public endpoint can read the snapshot in one lookup', max_length=100, unique=True)),
+                ('data', models.JSONField(help_text='Portfolio document in the shape returned by the public portfolio endpoint')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_snapshot', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Portfolio Snapshot',
+                'verbose_name_plural': 'Portfolio Snapshots',
+            },
+        ),
+    ]
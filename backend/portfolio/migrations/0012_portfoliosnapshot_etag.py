@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0011_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfoliosnapshot',
+            name='etag',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the serialized data, used as the HTTP validator', max_length=64),
+        ),
+    ]
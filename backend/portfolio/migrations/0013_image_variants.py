@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0012_portfoliosnapshot_etag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aboutme',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the images, see portfolio/images.py'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the images, see portfolio/images.py'),
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the images, see portfolio/images.py'),
+        ),
+        migrations.AddField(
+            model_name='socialmedia',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the images, see portfolio/images.py'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the images, see portfolio/images.py'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:13
+
+import django.core.validators
+import portfolio.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0013_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name, e.g. blobs/3f/a2/<sha256>.png', max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Media Blob',
+                'verbose_name_plural': 'Media Blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='aboutme',
+            name='cv_file',
+            field=models.FileField(blank=True, help_text='Upload your CV/Resume (PDF recommended)', null=True, storage=portfolio.storage.get_media_storage, upload_to='cv/'),
+        ),
+        migrations.AlterField(
+            model_name='aboutme',
+            name='logo_image',
+            field=models.FileField(blank=True, help_text='Upload a custom logo image (PNG, JPG, SVG, etc.). If not provided, a text logo will be used.', null=True, storage=portfolio.storage.get_media_storage, upload_to='logo/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'svgz'])]),
+        ),
+        migrations.AlterField(
+            model_name='aboutme',
+            name='profile_image',
+            field=models.ImageField(blank=True, null=True, storage=portfolio.storage.get_media_storage, upload_to='profile/'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='project_image',
+            field=models.ImageField(blank=True, null=True, storage=portfolio.storage.get_media_storage, upload_to='projects/'),
+        ),
+        migrations.AlterField(
+            model_name='skill',
+            name='icon_image',
+            field=models.ImageField(blank=True, null=True, storage=portfolio.storage.get_media_storage, upload_to='skills/'),
+        ),
+        migrations.AlterField(
+            model_name='socialmedia',
+            name='icon_image',
+            field=models.ImageField(blank=True, null=True, storage=portfolio.storage.get_media_storage, upload_to='social/'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='banner_image',
+            field=models.ImageField(blank=True, help_text='Portfolio banner/header image', null=True, storage=portfolio.storage.get_media_storage, upload_to='banners/'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0015_pendingupload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='message_digest',
+            field=models.BooleanField(default=False, help_text='Email a periodic digest of new contact messages'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='message_digest_sent_at',
+            field=models.DateTimeField(blank=True, help_text='End of the period covered by the last digest', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['user', 'created_at'], name='portfolio_message_user_time'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0016_message_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['user', 'status', '-created_at'], name='portfolio_message_user_status'),
+        ),
+        migrations.AddIndex(
+            model_name='education',
+            index=models.Index(fields=['user', '-start_year'], name='portfolio_edu_user_start'),
+        ),
+        migrations.AddIndex(
+            model_name='experience',
+            index=models.Index(fields=['user', '-start_date'], name='portfolio_exp_user_start'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['user', '-created_at'], name='portfolio_project_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='skill',
+            index=models.Index(fields=['user', 'name'], name='portfolio_skill_user_name'),
+        ),
+        migrations.AddIndex(
+            model_name='socialmedia',
+            index=models.Index(fields=['user', 'platform'], name='portfolio_social_user_platform'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0017_owner_scoped_indexes'),
+        # The tokens are copied into core.VerificationToken before the columns go
+        ('core', '0004_copy_profile_tokens'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='email_verification_otp_expires',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='email_verification_token',
+        ),
+    ]
@@ -4,6 +4,8 @@ from django.core.validators import FileExtensionValidator
 from django.utils.text import slugify
 import uuid
 
+from .storage import get_media_storage
+
 
 class UserProfile(models.Model):
     """Extended user profile with portfolio-specific settings"""
@@ -12,9 +14,10 @@ class UserProfile(models.Model):
     portfolio_published = models.BooleanField(default=False, help_text='Whether the portfolio is publicly accessible')
     is_approved = models.BooleanField(default=True, help_text='Admin approval required before user can access dashboard')
     email_verified = models.BooleanField(default=False, help_text='Email verification status')
-    email_verification_token = models.CharField(max_length=100, blank=True, null=True, help_text='OTP code for email verification')
-    email_verification_otp_expires = models.DateTimeField(blank=True, null=True, help_text='OTP expiration time')
-    banner_image = models.ImageField(upload_to='banners/', blank=True, null=True, help_text='Portfolio banner/header image')
+    message_digest = models.BooleanField(default=False, help_text='Email a periodic digest of new contact messages')
+    message_digest_sent_at = models.DateTimeField(blank=True, null=True, help_text='End of the period covered by the last digest')
+    banner_image = models.ImageField(upload_to='banners/', storage=get_media_storage, blank=True, null=True, help_text='Portfolio banner/header image')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies of the images, see portfolio/images.py')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -43,15 +46,17 @@ class AboutMe(models.Model):
     name = models.CharField(max_length=200)
     title = models.CharField(max_length=200)
     bio = models.TextField()
-    profile_image = models.ImageField(upload_to='profile/', blank=True, null=True)
+    profile_image = models.ImageField(upload_to='profile/', storage=get_media_storage, blank=True, null=True)
     logo_image = models.FileField(
         upload_to='logo/', 
+        storage=get_media_storage,
         blank=True, 
         null=True, 
         help_text='Upload a custom logo image (PNG, JPG, SVG, etc.). If not provided, a text logo will be used.',
         validators=[FileExtensionValidator(allowed_extensions=['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'svgz'])]
     )
-    cv_file = models.FileField(upload_to='cv/', blank=True, null=True, help_text='Upload your CV/Resume (PDF recommended)')
+    cv_file = models.FileField(upload_to='cv/', storage=get_media_storage, blank=True, null=True, help_text='Upload your CV/Resume (PDF recommended)')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies of the images, see portfolio/images.py')
     years_of_experience = models.IntegerField(default=0, help_text='Years of professional experience')
     clients = models.IntegerField(default=0, blank=True, null=True, help_text='Number of clients (leave blank to show N/A)')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -69,7 +74,8 @@ class Project(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='projects', null=True, blank=True, help_text='Leave blank for admin/system portfolio')
     title = models.CharField(max_length=200)
     description = models.TextField()
-    project_image = models.ImageField(upload_to='projects/', blank=True, null=True)
+    project_image = models.ImageField(upload_to='projects/', storage=get_media_storage, blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies of the images, see portfolio/images.py')
     github_link = models.URLField(blank=True, null=True)
     live_demo_link = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -77,6 +83,10 @@ class Project(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Owner-scoped lists, in Meta.ordering order
+            models.Index(fields=['user', '-created_at'], name='portfolio_project_user_created'),
+        ]
 
     def __str__(self):
         return self.title
@@ -94,6 +104,10 @@ class Experience(models.Model):
 
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Owner-scoped lists, in Meta.ordering order
+            models.Index(fields=['user', '-start_date'], name='portfolio_exp_user_start'),
+        ]
 
     def __str__(self):
         return f"{self.role} at {self.company}"
@@ -111,6 +125,10 @@ class Education(models.Model):
 
     class Meta:
         ordering = ['-start_year']
+        indexes = [
+            # Owner-scoped lists, in Meta.ordering order
+            models.Index(fields=['user', '-start_year'], name='portfolio_edu_user_start'),
+        ]
 
     def __str__(self):
         return f"{self.degree} from {self.institution}"
@@ -126,12 +144,17 @@ class Skill(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='skills', null=True, blank=True, help_text='Leave blank for admin/system portfolio')
     name = models.CharField(max_length=100)
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
-    icon_image = models.ImageField(upload_to='skills/', blank=True, null=True)
+    icon_image = models.ImageField(upload_to='skills/', storage=get_media_storage, blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies of the images, see portfolio/images.py')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Owner-scoped lists, in Meta.ordering order
+            models.Index(fields=['user', 'name'], name='portfolio_skill_user_name'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.level})"
@@ -165,12 +188,17 @@ class SocialMedia(models.Model):
     platform = models.CharField(max_length=50, choices=PLATFORM_CHOICES, default='other')
     platform_name = models.CharField(max_length=100, blank=True)  # Keep for backward compatibility
     url = models.URLField()
-    icon_image = models.ImageField(upload_to='social/', blank=True, null=True)
+    icon_image = models.ImageField(upload_to='social/', storage=get_media_storage, blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized copies of the images, see portfolio/images.py')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['platform']
+        indexes = [
+            # Owner-scoped lists, in Meta.ordering order
+            models.Index(fields=['user', 'platform'], name='portfolio_social_user_platform'),
+        ]
 
     def __str__(self):
         return self.get_platform_display() or self.platform_name
@@ -217,6 +245,71 @@ class ContactMessage(models.Model):
         verbose_name = "Contact Message"
         verbose_name_plural = "Contact Messages"
         ordering = ['-created_at']
+        indexes = [
+            # Digests read each owner's messages by time range; also serves the inbox order, read backwards
+            models.Index(fields=['user', 'created_at'], name='portfolio_message_user_time'),
+            # Inbox filtered by status (?status=new), newest first
+            models.Index(fields=['user', 'status', '-created_at'], name='portfolio_message_user_status'),
+        ]
 
     def __str__(self):
         return f"Message from {self.name} ({self.email})"
+
+
+class PortfolioSnapshot(models.Model):
+    """Pre-serialized public portfolio, rebuilt whenever the owner's content changes"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='portfolio_snapshot')
+    username_slug = models.SlugField(max_length=100, unique=True, help_text='Copy of the profile slug so the public endpoint can read the snapshot in one lookup')
+    data = models.JSONField(help_text='Portfolio document in the shape returned by the public portfolio endpoint')
+    etag = models.CharField(max_length=64, blank=True, default='', help_text='SHA-256 of the serialized data, used as the HTTP validator')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Portfolio Snapshot"
+        verbose_name_plural = "Portfolio Snapshots"
+
+    def __str__(self):
+        return f"Snapshot for {self.username_slug}"
+
+
+class MediaBlob(models.Model):
+    """A content-addressed media file and how many model fields reference it (see portfolio/storage.py)"""
+    name = models.CharField(max_length=255, unique=True, help_text='Storage name, e.g. blobs/3f/a2/<sha256>.png')
+    sha256 = models.CharField(max_length=64, db_index=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Media Blob"
+        verbose_name_plural = "Media Blobs"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class PendingUpload(models.Model):
+    """A direct-to-storage upload that has been issued but not yet attached (see portfolio/direct_uploads.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_uploads')
+    target = models.CharField(max_length=50, help_text='Field the file is for, e.g. projects.project_image')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField(help_text='Declared size in bytes; larger uploads are rejected')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Pending Upload"
+        verbose_name_plural = "Pending Uploads"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.target} upload by {self.user_id} ({self.status})"
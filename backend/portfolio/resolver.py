@@ -0,0 +1,169 @@
+"""
+Read-only resolution of public portfolio slugs.
+
+Public endpoints only need to know which user a slug belongs to and whether
+that user's portfolio is published. SlugResolver answers that from a small
+in-process LRU, then the shared Django cache, and only then the database.
+Unknown slugs are cached too, so bots probing random URLs stop costing
+queries. The read path never writes: a user without a profile simply resolves
+as unpublished.
+
+Entries are invalidated from the UserProfile/User signals. The in-process tier
+of *other* worker processes can't be reached from a signal, so it keeps
+entries only for a short TTL (PORTFOLIO_SLUG_LOCAL_TTL, 30s by default).
+
+aresolve() is the same lookup for async views, through the async cache and
+ORM APIs.
+"""
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+import threading
+import time
+
+from .models import UserProfile
+
+ResolvedSlug = namedtuple('ResolvedSlug', ['user_id', 'published', 'username_slug'])
+
+# Stored in the shared cache for slugs that don't match any user
+_NOT_FOUND = 'not-found'
+
+
+class SlugResolver:
+    """Maps a portfolio slug to a ResolvedSlug, or None when nothing matches"""
+
+    def __init__(self, max_size=None, local_ttl=None, shared_ttl=None, negative_ttl=None):
+        self.max_size = max_size or getattr(settings, 'PORTFOLIO_SLUG_CACHE_SIZE', 2048)
+        self.local_ttl = local_ttl or getattr(settings, 'PORTFOLIO_SLUG_LOCAL_TTL', 30)
+        self.shared_ttl = shared_ttl or getattr(settings, 'PORTFOLIO_SLUG_SHARED_TTL', 600)
+        self.negative_ttl = negative_ttl or getattr(settings, 'PORTFOLIO_SLUG_NEGATIVE_TTL', 60)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(slug):
+        return f'portfolio:slug:{slug}'
+
+    def resolve(self, slug):
+        if not slug:
+            return None
+
+        found, value = self._get_local(slug)
+        if found:
+            return value
+
+        cached = cache.get(self.cache_key(slug))
+        if cached is not None:
+            value = None if cached == _NOT_FOUND else ResolvedSlug(*cached)
+            self._set_local(slug, value)
+            return value
+
+        value = self._lookup(slug)
+        cache.set(self.cache_key(slug), *self._shared_entry(value))
+        self._set_local(slug, value)
+        return value
+
+    async def aresolve(self, slug):
+        if not slug:
+            return None
+
+        found, value = self._get_local(slug)
+        if found:
+            return value
+
+        cached = await cache.aget(self.cache_key(slug))
+        if cached is not None:
+            value = None if cached == _NOT_FOUND else ResolvedSlug(*cached)
+            self._set_local(slug, value)
+            return value
+
+        value = await self._alookup(slug)
+        await cache.aset(self.cache_key(slug), *self._shared_entry(value))
+        self._set_local(slug, value)
+        return value
+
+    def invalidate(self, *slugs):
+        """Forget cached answers for these slugs (in this process and the shared cache)"""
+        slugs = [slug for slug in slugs if slug]
+        if not slugs:
+            return
+        with self._lock:
+            for slug in slugs:
+                self._local.pop(slug, None)
+        cache.delete_many([self.cache_key(slug) for slug in slugs])
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _shared_entry(self, value):
+        """(value, timeout) to store in the shared cache for a lookup result"""
+        if value is None:
+            return _NOT_FOUND, self.negative_ttl
+        return tuple(value), self.shared_ttl
+
+    @staticmethod
+    def _by_slug(slug):
+        return UserProfile.objects.filter(username_slug=slug).values_list('user_id', 'portfolio_published', 'username_slug')
+
+    @staticmethod
+    def _by_username(slug):
+        # Fall back to the plain username, for users whose slug differs or who have no profile yet
+        return User.objects.filter(username=slug).values_list('id', 'profile__portfolio_published', 'profile__username_slug')
+
+    @staticmethod
+    def _to_resolved(row):
+        if row is None:
+            return None
+        user_id, published, username_slug = row
+        return ResolvedSlug(user_id, bool(published), username_slug)
+
+    def _lookup(self, slug):
+        row = self._by_slug(slug).first()
+        if row is None:
+            row = self._by_username(slug).first()
+        return self._to_resolved(row)
+
+    async def _alookup(self, slug):
+        row = await self._by_slug(slug).afirst()
+        if row is None:
+            row = await self._by_username(slug).afirst()
+        return self._to_resolved(row)
+
+    def _get_local(self, slug):
+        with self._lock:
+            entry = self._local.get(slug)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._local[slug]
+                return False, None
+            self._local.move_to_end(slug)
+            return True, value
+
+    def _set_local(self, slug, value):
+        ttl = self.local_ttl if value is not None else min(self.local_ttl, self.negative_ttl)
+        with self._lock:
+            self._local[slug] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(slug)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+
+slug_resolver = SlugResolver()
+
+
+def resolve_portfolio_slug(slug):
+    return slug_resolver.resolve(slug)
+
+
+async def aresolve_portfolio_slug(slug):
+    return await slug_resolver.aresolve(slug)
+
+
+def invalidate_portfolio_slugs(*slugs):
+    """Invalidate slugs once the current transaction commits, so readers can't re-cache stale rows"""
+    transaction.on_commit(lambda: slug_resolver.invalidate(*slugs))
@@ -1,16 +1,20 @@
 from rest_framework import serializers
-from .models import AboutMe, Project, Experience, Education, Skill, SocialMedia, ContactInfo, ContactMessage
+from .models import AboutMe, Project, Experience, Education, Skill, SocialMedia, ContactInfo, ContactMessage, PendingUpload
+from .fieldsets import SparseFieldsSerializerMixin
+from .images import add_image_derivatives
+from .uploads import BoundedImageField
+from .media_urls import MediaFileField, PrivateMediaFileField
 
 
-class AboutMeSerializer(serializers.ModelSerializer):
-    profile_image = serializers.ImageField(required=False, allow_null=True)
-    logo_image = serializers.FileField(required=False, allow_null=True)
-    cv_file = serializers.FileField(required=False, allow_null=True)
+class AboutMeSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    profile_image = BoundedImageField(required=False, allow_null=True)
+    logo_image = MediaFileField(required=False, allow_null=True)
+    cv_file = PrivateMediaFileField(required=False, allow_null=True)
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # User is read-only, set automatically
     
     class Meta:
         model = AboutMe
-        fields = '__all__'
+        exclude = ['image_variants']  # Exposed as <field>_srcset instead
         read_only_fields = ['user', 'created_at', 'updated_at']
     
     def to_internal_value(self, data):
@@ -69,42 +73,18 @@ class AboutMeSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def to_representation(self, instance):
+        # File fields render through build_media_url(); only the image derivatives are added here
         representation = super().to_representation(instance)
-        request = self.context.get('request')
-        if request:
-            # Handle profile image
-            if representation.get('profile_image'):
-                image_path = representation['profile_image']
-                if not image_path.startswith('http'):
-                    if not image_path.startswith('/'):
-                        image_path = f'/media/{image_path}'
-                    representation['profile_image'] = request.build_absolute_uri(image_path)
-            
-            # Handle logo image
-            if representation.get('logo_image'):
-                logo_path = representation['logo_image']
-                if not logo_path.startswith('http'):
-                    if not logo_path.startswith('/'):
-                        logo_path = f'/media/{logo_path}'
-                    representation['logo_image'] = request.build_absolute_uri(logo_path)
-            
-            # Handle CV file
-            if representation.get('cv_file'):
-                cv_path = representation['cv_file']
-                if not cv_path.startswith('http'):
-                    if not cv_path.startswith('/'):
-                        cv_path = f'/media/{cv_path}'
-                    representation['cv_file'] = request.build_absolute_uri(cv_path)
-        return representation
+        return add_image_derivatives(representation, instance, self.context.get('request'))
 
 
-class ProjectSerializer(serializers.ModelSerializer):
-    project_image = serializers.ImageField(required=False, allow_null=True)
+class ProjectSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    project_image = BoundedImageField(required=False, allow_null=True)
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # User is read-only
     
     class Meta:
         model = Project
-        fields = '__all__'
+        exclude = ['image_variants']  # Exposed as <field>_srcset instead
         read_only_fields = ['user', 'created_at', 'updated_at']
     
     def to_internal_value(self, data):
@@ -135,19 +115,12 @@ class ProjectSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def to_representation(self, instance):
+        # File fields render through build_media_url(); only the image derivatives are added here
         representation = super().to_representation(instance)
-        if representation.get('project_image'):
-            request = self.context.get('request')
-            if request:
-                image_path = representation['project_image']
-                if not image_path.startswith('http'):
-                    if not image_path.startswith('/'):
-                        image_path = f'/media/{image_path}'
-                    representation['project_image'] = request.build_absolute_uri(image_path)
-        return representation
+        return add_image_derivatives(representation, instance, self.context.get('request'))
 
 
-class ExperienceSerializer(serializers.ModelSerializer):
+class ExperienceSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # User is read-only
     
     class Meta:
@@ -183,7 +156,7 @@ class ExperienceSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class EducationSerializer(serializers.ModelSerializer):
+class EducationSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # User is read-only
     
     class Meta:
@@ -219,13 +192,13 @@ class EducationSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class SkillSerializer(serializers.ModelSerializer):
-    icon_image = serializers.ImageField(required=False, allow_null=True)
+class SkillSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    icon_image = BoundedImageField(required=False, allow_null=True)
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # User is read-only
     
     class Meta:
         model = Skill
-        fields = '__all__'
+        exclude = ['image_variants']  # Exposed as <field>_srcset instead
         read_only_fields = ['user', 'created_at', 'updated_at']
     
     def to_internal_value(self, data):
@@ -256,25 +229,18 @@ class SkillSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def to_representation(self, instance):
+        # File fields render through build_media_url(); only the image derivatives are added here
         representation = super().to_representation(instance)
-        if representation.get('icon_image'):
-            request = self.context.get('request')
-            if request:
-                image_path = representation['icon_image']
-                if not image_path.startswith('http'):
-                    if not image_path.startswith('/'):
-                        image_path = f'/media/{image_path}'
-                    representation['icon_image'] = request.build_absolute_uri(image_path)
-        return representation
+        return add_image_derivatives(representation, instance, self.context.get('request'))
 
 
-class SocialMediaSerializer(serializers.ModelSerializer):
-    icon_image = serializers.ImageField(required=False, allow_null=True)
+class SocialMediaSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    icon_image = BoundedImageField(required=False, allow_null=True)
     user = serializers.PrimaryKeyRelatedField(read_only=True)  # User is read-only
     
     class Meta:
         model = SocialMedia
-        fields = '__all__'
+        exclude = ['image_variants']  # Exposed as <field>_srcset instead
         read_only_fields = ['user', 'created_at', 'updated_at']
     
     def to_internal_value(self, data):
@@ -305,16 +271,9 @@ class SocialMediaSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def to_representation(self, instance):
+        # File fields render through build_media_url(); only the image derivatives are added here
         representation = super().to_representation(instance)
-        if representation.get('icon_image'):
-            request = self.context.get('request')
-            if request:
-                image_path = representation['icon_image']
-                if not image_path.startswith('http'):
-                    if not image_path.startswith('/'):
-                        image_path = f'/media/{image_path}'
-                    representation['icon_image'] = request.build_absolute_uri(image_path)
-        return representation
+        return add_image_derivatives(representation, instance, self.context.get('request'))
 
 
 class ContactInfoSerializer(serializers.ModelSerializer):
@@ -360,3 +319,30 @@ class ContactMessageCreateSerializer(serializers.ModelSerializer):
         validated_data['status'] = 'new'
         # User will be set in the view
         return ContactMessage.objects.create(**validated_data)
+
+
+class PendingUploadSerializer(serializers.ModelSerializer):
+    """Request for a direct-to-storage upload URL"""
+    class Meta:
+        model = PendingUpload
+        fields = ['id', 'target', 'filename', 'content_type', 'size', 'status', 'expires_at']
+        read_only_fields = ['id', 'status', 'expires_at']
+
+    def validate_target(self, value):
+        from .direct_uploads import get_upload_targets
+        targets = get_upload_targets()
+        if value not in targets:
+            raise serializers.ValidationError(f"Unknown upload target. Valid targets are: {', '.join(targets)}")
+        return value
+
+    def validate_filename(self, value):
+        from django.utils.text import get_valid_filename
+        import os
+        return get_valid_filename(os.path.basename(value))
+
+    def validate(self, attrs):
+        from .direct_uploads import get_max_bytes
+        max_bytes = get_max_bytes(attrs['target'])
+        if attrs['size'] > max_bytes:
+            raise serializers.ValidationError({'size': f'The maximum size for this field is {max_bytes} bytes'})
+        return attrs
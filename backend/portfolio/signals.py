@@ -1,7 +1,14 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete, post_init
 from django.dispatch import receiver
 from django.db import transaction
-from .models import UserProfile
+from django.contrib.auth.models import User
+from .models import UserProfile, AboutMe, Project, Experience, Education, Skill, SocialMedia
+from .snapshots import schedule_snapshot_rebuild
+from .resolver import invalidate_portfolio_slugs
+from .media import invalidate_media_access, invalidate_cv_access
+from .images import get_image_variant_fields, needs_variants, schedule_image_variants, delete_variants
+from .storage import get_media_models, file_field_names, acquire_blob, release_blob
+from .tasks import send_portfolio_status_email
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +22,7 @@ def capture_portfolio_status(sender, instance, **kwargs):
             try:
                 old_instance = UserProfile.objects.get(pk=instance.pk)
                 instance._old_portfolio_published = old_instance.portfolio_published
+                instance._old_username_slug = old_instance.username_slug
             except UserProfile.DoesNotExist:
                 instance._old_portfolio_published = None
         else:
@@ -44,18 +52,6 @@ def send_portfolio_status_email_signal(sender, instance, created, **kwargs):
         # Determine if unpublished by admin (if status changed from True to False)
         unpublished_by_admin = getattr(instance, '_unpublished_by_admin', False)
         
-        # Import here to avoid circular imports - use a safer approach
-        try:
-            from core.views import send_portfolio_status_email
-        except (ImportError, AttributeError) as e:
-            logger.error(f"Failed to import send_portfolio_status_email: {str(e)}")
-            return
-        
-        # Only proceed if the function exists and is callable
-        if not callable(send_portfolio_status_email):
-            logger.error("send_portfolio_status_email is not callable")
-            return
-        
         # Safely get user - check if user exists
         try:
             user = instance.user
@@ -66,20 +62,10 @@ def send_portfolio_status_email_signal(sender, instance, created, **kwargs):
             logger.error(f"Error accessing user in signal: {str(user_error)}")
             return
         
-        # Send email asynchronously using transaction.on_commit to avoid blocking
+        # Sent by a background task once the transaction commits (see core/taskqueue.py)
         # Wrap in another try-except to ensure it doesn't break anything
         try:
-            def safe_send_email():
-                try:
-                    send_portfolio_status_email(
-                        user=user,
-                        is_published=new_status,
-                        unpublished_by_admin=unpublished_by_admin
-                    )
-                except Exception as email_error:
-                    logger.error(f"Error in send_portfolio_status_email callback: {str(email_error)}", exc_info=True)
-            
-            transaction.on_commit(safe_send_email)
+            send_portfolio_status_email.delay(user.id, new_status, unpublished_by_admin)
             logger.info(f"Portfolio status email queued for user: {user.username} (ID: {user.id}), Published: {new_status}, Old Status: {old_status}")
         except Exception as commit_error:
             logger.error(f"Error queuing portfolio status email: {str(commit_error)}", exc_info=True)
@@ -91,3 +77,155 @@ def send_portfolio_status_email_signal(sender, instance, created, **kwargs):
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
 
+
+# Models whose rows are part of the public portfolio snapshot
+SNAPSHOT_SOURCE_MODELS = (UserProfile, AboutMe, Project, Experience, Education, Skill, SocialMedia)
+
+
+def refresh_portfolio_snapshot(sender, instance, **kwargs):
+    """Rebuild the owner's portfolio snapshot after any of its source rows change"""
+    try:
+        schedule_snapshot_rebuild(instance.user_id)
+    except Exception as e:
+        # Don't let signal errors break the save operation
+        logger.error(f"Error scheduling portfolio snapshot rebuild: {str(e)}", exc_info=True)
+
+
+for snapshot_model in SNAPSHOT_SOURCE_MODELS:
+    post_save.connect(refresh_portfolio_snapshot, sender=snapshot_model, dispatch_uid=f'snapshot_save_{snapshot_model.__name__}')
+    post_delete.connect(refresh_portfolio_snapshot, sender=snapshot_model, dispatch_uid=f'snapshot_delete_{snapshot_model.__name__}')
+
+
+# User fields that UserProfileSerializer puts into the snapshot
+SNAPSHOT_USER_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def refresh_portfolio_snapshot_for_user(sender, instance, created, **kwargs):
+    """The snapshot embeds the user's name and email, so refresh it when those change"""
+    update_fields = kwargs.get('update_fields')
+    if created or (update_fields is not None and not SNAPSHOT_USER_FIELDS & set(update_fields)):
+        # New users have nothing published yet; logins, passwords and flags aren't portfolio data
+        return
+    try:
+        schedule_snapshot_rebuild(instance.pk)
+    except Exception as e:
+        logger.error(f"Error scheduling portfolio snapshot rebuild: {str(e)}", exc_info=True)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_slug(sender, instance, **kwargs):
+    """Drop cached slug resolutions for a profile whose slug or publish state may have changed"""
+    try:
+        slugs = [instance.username_slug, getattr(instance, '_old_username_slug', None)]
+        if kwargs.get('signal') is post_save:
+            # The username is also a fallback slug (profile deletes are covered by the User signal)
+            slugs.append(instance.user.username)
+        invalidate_portfolio_slugs(*slugs)
+    except Exception as e:
+        logger.error(f"Error invalidating portfolio slug cache: {str(e)}", exc_info=True)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_cv_access(sender, instance, **kwargs):
+    """A CV is public exactly while its portfolio is published, so drop the cached decision when that changes"""
+    try:
+        if kwargs.get('signal') is post_save and getattr(instance, '_old_portfolio_published', None) == instance.portfolio_published:
+            return
+        invalidate_cv_access(instance.user_id)
+    except Exception as e:
+        logger.error(f"Error invalidating media access cache: {str(e)}", exc_info=True)
+
+
+@receiver(post_save, sender=AboutMe)
+@receiver(post_delete, sender=AboutMe)
+def invalidate_about_cv_access(sender, instance, **kwargs):
+    """A new or removed CV row changes who may read that file"""
+    try:
+        # Read __dict__ directly: touching a deferred field would cost a query
+        cv_file = instance.__dict__.get('cv_file')
+        invalidate_media_access(getattr(cv_file, 'name', cv_file))
+    except Exception as e:
+        logger.error(f"Error invalidating media access cache: {str(e)}", exc_info=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_username_slug(sender, instance, **kwargs):
+    """Usernames double as fallback slugs, so a new or renamed user may answer a cached miss"""
+    try:
+        invalidate_portfolio_slugs(instance.username)
+    except Exception as e:
+        logger.error(f"Error invalidating portfolio slug cache: {str(e)}", exc_info=True)
+
+
+def generate_image_variants(sender, instance, **kwargs):
+    """Resize newly uploaded images in the background once the save commits"""
+    try:
+        if needs_variants(instance):
+            schedule_image_variants(instance)
+    except Exception as e:
+        # Don't let signal errors break the save operation
+        logger.error(f"Error scheduling image variants: {str(e)}", exc_info=True)
+
+
+def delete_image_variants(sender, instance, **kwargs):
+    """Remove the resized copies of a deleted row's images"""
+    try:
+        for entry in (instance.image_variants or {}).values():
+            transaction.on_commit(lambda entry=entry: delete_variants(entry))
+    except Exception as e:
+        logger.error(f"Error scheduling image variant cleanup: {str(e)}", exc_info=True)
+
+
+for variant_model in get_image_variant_fields():
+    post_save.connect(generate_image_variants, sender=variant_model, dispatch_uid=f'image_variants_save_{variant_model.__name__}')
+    post_delete.connect(delete_image_variants, sender=variant_model, dispatch_uid=f'image_variants_delete_{variant_model.__name__}')
+
+
+def remember_media_names(sender, instance, **kwargs):
+    """Remember the stored file names as loaded, so a save can tell which blobs it replaced"""
+    # Read __dict__ directly: touching a deferred field would cost a query
+    instance._loaded_media_names = {
+        name: getattr(instance.__dict__.get(name), 'name', instance.__dict__.get(name)) or None
+        for name in file_field_names(sender)
+    }
+
+
+def count_media_references(sender, instance, created=False, **kwargs):
+    """Move blob references from the replaced files to the new ones"""
+    try:
+        # A new row references its files for the first time, even if they were assigned by name
+        loaded = {} if created else getattr(instance, '_loaded_media_names', {})
+        for name in file_field_names(sender):
+            if name not in instance.__dict__:
+                continue
+            current = getattr(instance, name).name or None
+            previous = loaded.get(name)
+            if current != previous:
+                acquire_blob(current)
+                release_blob(previous)
+                loaded[name] = current
+        instance._loaded_media_names = loaded
+    except Exception as e:
+        # A lost reference would let the garbage collector delete a file in use
+        logger.error(f"Error updating media blob references: {str(e)}", exc_info=True)
+        raise
+
+
+def release_media_references(sender, instance, **kwargs):
+    try:
+        for name in file_field_names(sender):
+            if name in instance.__dict__:
+                release_blob(getattr(instance, name).name)
+    except Exception as e:
+        logger.error(f"Error releasing media blob references: {str(e)}", exc_info=True)
+        raise
+
+
+for media_model in get_media_models():
+    post_init.connect(remember_media_names, sender=media_model, dispatch_uid=f'media_init_{media_model.__name__}')
+    post_save.connect(count_media_references, sender=media_model, dispatch_uid=f'media_save_{media_model.__name__}')
+    post_delete.connect(release_media_references, sender=media_model, dispatch_uid=f'media_delete_{media_model.__name__}')
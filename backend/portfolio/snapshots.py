@@ -0,0 +1,287 @@
+"""
+Materialized public portfolios.
+
+The public portfolio endpoint used to run a profile lookup, six section
+queries and six serializers on every hit. Instead, each published user gets a
+PortfolioSnapshot row holding the already-serialized document, rebuilt by the
+signals in portfolio/signals.py whenever one of the source rows changes.
+
+Public reads never write: a published portfolio without a stored snapshot
+is built in memory for that response (build_snapshot()), and missing
+snapshots are stored by `manage.py build_portfolio_snapshots`, to be run once
+after upgrading.
+
+Snapshots are serialized without a request, so media fields hold site-relative
+URLs (e.g. /media/projects/x.png). absolutize_media_urls() turns them into
+absolute URLs when a response is built.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+import hashlib
+import json
+import logging
+
+from .fieldsets import fieldsets_key
+from .models import (
+    UserProfile, PortfolioSnapshot, AboutMe, Project, Experience, Education, Skill, SocialMedia
+)
+
+logger = logging.getLogger(__name__)
+
+# Media fields per section of the portfolio document
+MEDIA_FIELDS = {
+    'profile': ('banner_image',),
+    'about_me': ('profile_image', 'logo_image', 'cv_file'),
+    'projects': ('project_image',),
+    'skills': ('icon_image',),
+    'social_media': ('icon_image',),
+}
+
+
+def build_portfolio_data(profile):
+    """Serialize the full public portfolio for a profile (no request context)"""
+    return build_portfolio_data_bulk([profile])[profile.user_id]
+
+
+def build_portfolio_data_bulk(profiles):
+    """
+    Serialize the public portfolios of many profiles at once.
+
+    Each section is fetched with a single user_id__in query and grouped in
+    memory, so the query count doesn't depend on the number of profiles.
+    Profiles should come with select_related('user'). Returns {user_id: data}.
+    """
+    from core.serializers import UserProfileSerializer
+    from .serializers import (
+        AboutMeSerializer, ProjectSerializer, ExperienceSerializer,
+        EducationSerializer, SkillSerializer, SocialMediaSerializer
+    )
+
+    user_ids = [profile.user_id for profile in profiles]
+
+    def grouped(model):
+        rows = {user_id: [] for user_id in user_ids}
+        for row in model.objects.filter(user_id__in=user_ids):
+            rows[row.user_id].append(row)
+        return rows
+
+    # AboutMe has no ordering, so take the lowest id like .first() does
+    about_me = {}
+    for row in AboutMe.objects.filter(user_id__in=user_ids).order_by('-pk'):
+        about_me[row.user_id] = row
+    projects = grouped(Project)
+    experiences = grouped(Experience)
+    educations = grouped(Education)
+    skills = grouped(Skill)
+    social_media = grouped(SocialMedia)
+
+    result = {}
+    for profile in profiles:
+        user_id = profile.user_id
+        result[user_id] = {
+            'profile': UserProfileSerializer(profile).data,
+            'about_me': AboutMeSerializer(about_me[user_id]).data if user_id in about_me else None,
+            'projects': ProjectSerializer(projects[user_id], many=True).data,
+            'experiences': ExperienceSerializer(experiences[user_id], many=True).data,
+            'educations': EducationSerializer(educations[user_id], many=True).data,
+            'skills': SkillSerializer(skills[user_id], many=True).data,
+            'social_media': SocialMediaSerializer(social_media[user_id], many=True).data,
+        }
+    return result
+
+
+def build_snapshots_bulk(profiles):
+    """Build unsaved snapshots for the published profiles among `profiles`; returns {user_id: snapshot}"""
+    profiles = [profile for profile in profiles if profile.portfolio_published and profile.username_slug]
+    if not profiles:
+        return {}
+    documents = build_portfolio_data_bulk(profiles)
+    return {
+        profile.user_id: PortfolioSnapshot(
+            user_id=profile.user_id,
+            username_slug=profile.username_slug,
+            data=documents[profile.user_id],
+            etag=compute_etag(documents[profile.user_id]),
+        )
+        for profile in profiles
+    }
+
+
+def build_snapshot(user_id):
+    """
+    The snapshot of a user's published portfolio, built in memory and not saved.
+
+    Readers that find no stored snapshot serve this, so a GET never writes;
+    stored snapshots come from rebuild_snapshot() and backfill_snapshots().
+    Returns None when the user has no published portfolio.
+    """
+    profile = UserProfile.objects.select_related('user').filter(user_id=user_id).first()
+    if profile is None:
+        return None
+    return build_snapshots_bulk([profile]).get(user_id)
+
+
+def save_new_snapshots(snapshots):
+    """
+    Insert snapshots for users that have none; returns the number saved.
+
+    A concurrent rebuild_snapshot() may win the race for a user. Its row is at
+    least as fresh, so it is kept, and only snapshots whose data made it into
+    the table are exported.
+    """
+    from .export import get_export_root, write_portfolio_export
+
+    snapshots = list(snapshots)
+    PortfolioSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+    stored = dict(PortfolioSnapshot.objects.filter(user_id__in=[snapshot.user_id for snapshot in snapshots])
+                  .values_list('user_id', 'etag'))
+    saved = [snapshot for snapshot in snapshots if stored.get(snapshot.user_id) == snapshot.etag]
+    if get_export_root():
+        for snapshot in saved:
+            write_portfolio_export(snapshot)
+    return len(saved)
+
+
+def backfill_snapshots(batch_size=200):
+    """Create the missing snapshots of published portfolios (e.g. published before snapshots existed); returns how many"""
+    missing = (UserProfile.objects
+               .filter(portfolio_published=True, username_slug__isnull=False, user__portfolio_snapshot__isnull=True)
+               .exclude(username_slug='')
+               .select_related('user')
+               .order_by('user_id'))
+    saved = 0
+    last_user_id = 0
+    while True:
+        # Keyset pagination: saved profiles drop out of `missing`, skipped ones are stepped over
+        batch = list(missing.filter(user_id__gt=last_user_id)[:batch_size])
+        if not batch:
+            break
+        last_user_id = batch[-1].user_id
+        saved += save_new_snapshots(build_snapshots_bulk(batch).values())
+    return saved
+
+
+def compute_etag(data):
+    """Content hash of a portfolio document, stable across key order"""
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def response_etag(snapshot, request, sections=None, fields=None):
+    """
+    Strong ETag for a snapshot as served to this request.
+
+    Media URLs are made absolute against the request host, and `sections` /
+    `fields` (from parse_sections() / parse_fields()) select sparse fieldsets,
+    so both are folded into the validator. Other query parameters are not:
+    they don't change the body and would only split the body cache.
+    """
+    etag = snapshot.etag or compute_etag(snapshot.data)
+    host = f"{request.scheme}://{request.get_host()}"
+    variant = fieldsets_key(sections, fields)
+    return '"%s"' % hashlib.sha256(f"{etag}:{host}:{variant}".encode('utf-8')).hexdigest()[:40]
+
+
+def rebuild_snapshot(user_id):
+    """
+    Rebuild (or drop) the snapshot for a user.
+
+    Returns the PortfolioSnapshot, or None when the user has no published portfolio.
+    When static exports are enabled (PORTFOLIO_EXPORT_ROOT), the exported files
+    are rewritten or deleted to match.
+    """
+    from .export import get_export_root, write_portfolio_export, delete_portfolio_export
+
+    previous_slug = PortfolioSnapshot.objects.filter(user_id=user_id).values_list('username_slug', flat=True).first()
+
+    try:
+        profile = UserProfile.objects.select_related('user').get(user_id=user_id)
+    except UserProfile.DoesNotExist:
+        profile = None
+
+    if profile is None or not profile.portfolio_published or not profile.username_slug:
+        PortfolioSnapshot.objects.filter(user_id=user_id).delete()
+        if previous_slug and get_export_root():
+            delete_portfolio_export(previous_slug)
+        return None
+
+    data = build_portfolio_data(profile)
+    snapshot, _ = PortfolioSnapshot.objects.update_or_create(
+        user_id=user_id,
+        defaults={'username_slug': profile.username_slug, 'data': data, 'etag': compute_etag(data)},
+    )
+    logger.info(f"Rebuilt portfolio snapshot for user ID {user_id} ({profile.username_slug})")
+
+    if get_export_root():
+        if previous_slug and previous_slug != snapshot.username_slug:
+            delete_portfolio_export(previous_slug)
+        write_portfolio_export(snapshot)
+    return snapshot
+
+
+def schedule_snapshot_rebuild(user_id):
+    """Rebuild a user's snapshot once the current transaction commits"""
+    if not user_id:
+        # Rows without a user belong to the system portfolio, which has no snapshot
+        return
+
+    from core.taskqueue import queue_enabled
+    if queue_enabled():
+        # Coalesced: a burst of saves queues one rebuild
+        from .tasks import rebuild_portfolio_snapshot
+        rebuild_portfolio_snapshot.schedule(args=[user_id], key=f'snapshot:{user_id}')
+        return
+
+    def safe_rebuild():
+        try:
+            rebuild_snapshot(user_id)
+        except Exception as e:
+            logger.error(f"Error rebuilding portfolio snapshot for user ID {user_id}: {str(e)}", exc_info=True)
+
+    transaction.on_commit(safe_rebuild)
+
+
+def absolutize_media_urls(data, build_absolute_uri):
+    """
+    Return a copy of a portfolio document with site-relative media URLs made absolute.
+
+    For requests, pass media_urls.absolute_url_builder(request) rather than
+    request.build_absolute_uri, so the host is parsed once per response.
+    """
+    from .media_urls import media_prefix
+
+    def absolutize(item, fields):
+        if not item:
+            return item
+        item = dict(item)
+        for field in fields:
+            value = item.get(field)
+            if value and not value.startswith('http'):
+                if not value.startswith('/'):
+                    value = f'{media_prefix()}{value}'
+                item[field] = build_absolute_uri(value)
+            srcsets = item.get(f'{field}_srcset')
+            if srcsets:
+                # 'url 320w, url 640w' per format
+                item[f'{field}_srcset'] = {
+                    key: ', '.join(absolutize_candidate(candidate) for candidate in srcset.split(', '))
+                    for key, srcset in srcsets.items()
+                }
+        return item
+
+    def absolutize_candidate(candidate):
+        url, _, descriptor = candidate.partition(' ')
+        if not url.startswith('http'):
+            url = build_absolute_uri(url)
+        return f'{url} {descriptor}'.strip()
+
+    result = dict(data)
+    for section, fields in MEDIA_FIELDS.items():
+        if section not in result:
+            continue
+        value = result[section]
+        if isinstance(value, list):
+            result[section] = [absolutize(item, fields) for item in value]
+        else:
+            result[section] = absolutize(value, fields)
+    return result
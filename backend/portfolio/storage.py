@@ -0,0 +1,162 @@
+"""
+Content-addressed media storage.
+
+Uploads to the portfolio models are stored under the SHA-256 of their
+content, fanned out by hash prefix so no directory grows huge:
+
+    projects/photo.png  ->  blobs/3f/a2/3fa2...e9.png
+
+Identical files (the same GitHub icon uploaded by thousands of users) are
+written once and shared by every row that uploads them. Each blob has a
+MediaBlob row counting the model fields that point at it; the signals in
+portfolio/signals.py keep the count in sync on save and delete.
+
+Blobs are immutable and may be shared, so delete() never removes them
+directly. A blob whose count drops to zero stays on disk, with its MediaBlob
+row recording when that happened, and is reclaimed by
+`manage.py collect_orphaned_media` after a grace period. An upload that reuses
+an existing blob locks its row and refreshes updated_at, and the collector
+only removes a file after deleting its row with a conditional
+(ref_count=0, updated_at older than the grace period) DELETE, so the two can't
+interleave: the upload either keeps the row alive until its post_save counts
+the reference, or finds the row gone and writes the file again.
+
+`manage.py dedupe_media` moves files uploaded before this into blobs.
+
+Set MEDIA_CONTENT_ADDRESSED = False to go back to plain upload_to names;
+existing blob names keep working either way.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+import hashlib
+import os
+
+BLOB_PREFIX = 'blobs/'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+def blob_name(digest, original_name):
+    """blobs/<2 hex>/<2 hex>/<sha256><ext>"""
+    extension = os.path.splitext(original_name)[1].lower()
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def hash_content(content):
+    """SHA-256 of a Django File, read in chunks; the file is rewound afterwards"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names new files by content hash and never duplicates them"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            from django.core.files import File
+            content = File(content, name)
+        target = blob_name(hash_content(content), name)
+        if self.reuse_blob(target):
+            return target
+        saved = super().save(target, content, max_length=max_length)
+        if saved != target:
+            # Lost a race with an identical upload; keep the first copy
+            super().delete(saved)
+        return target
+
+    def reuse_blob(self, name):
+        """
+        Whether an existing blob can serve this upload.
+
+        Locks the blob's row and marks it as just used, so the garbage
+        collector's conditional delete can't match it before the uploading
+        row's post_save counts the reference. A blob file without a row gets
+        one, with no references yet, for the same reason.
+        """
+        from .models import MediaBlob
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                if not self.exists(name):
+                    return False
+                try:
+                    with transaction.atomic():
+                        MediaBlob.objects.create(name=name, sha256=os.path.basename(name).split('.')[0])
+                except IntegrityError:
+                    # Created concurrently by another upload of the same content
+                    MediaBlob.objects.filter(name=name).update(updated_at=timezone.now())
+                return True
+            MediaBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+            # The row exists but the collector may have removed the file before it was counted again
+            return self.exists(name)
+
+    def delete(self, name):
+        if is_blob(name):
+            # Shared blobs are only removed by the garbage collector once unreferenced
+            return
+        super().delete(name)
+
+
+def get_media_storage():
+    """Storage for the portfolio models' file fields"""
+    from django.core.files.storage import default_storage
+    if getattr(settings, 'MEDIA_CONTENT_ADDRESSED', True):
+        return content_addressed_storage
+    return default_storage
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_media_models():
+    """Models whose file fields are stored through get_media_storage()"""
+    from .models import UserProfile, AboutMe, Project, Skill, SocialMedia
+    return (UserProfile, AboutMe, Project, Skill, SocialMedia)
+
+
+def file_field_names(model):
+    return [field.attname for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+
+
+def acquire_blob(name):
+    """Count one more reference to a blob"""
+    if not is_blob(name):
+        return
+    from .models import MediaBlob
+    if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, sha256=os.path.basename(name).split('.')[0], ref_count=1)
+    except IntegrityError:
+        # Created concurrently
+        MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release_blob(name):
+    """Drop one reference to a blob; unreferenced blobs are left for the garbage collector"""
+    if not is_blob(name):
+        return
+    from .models import MediaBlob
+    MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def is_shared(name):
+    """Whether any row still references a blob"""
+    if not is_blob(name):
+        return False
+    from .models import MediaBlob
+    return MediaBlob.objects.filter(name=name, ref_count__gt=0).exists()
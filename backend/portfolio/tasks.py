@@ -0,0 +1,60 @@
+from django.apps import apps
+from datetime import timedelta
+import logging
+
+from core.taskqueue import task
+
+logger = logging.getLogger(__name__)
+
+
+@task(max_attempts=3, timeout=600)
+def generate_image_variants(model_label, pk):
+    """Resized variants and placeholder of a row's images (see images.py)"""
+    from .images import process_image_variants
+    process_image_variants(apps.get_model(model_label), pk)
+
+
+@task(max_attempts=5)
+def rebuild_portfolio_snapshot(user_id):
+    from .snapshots import rebuild_snapshot
+    rebuild_snapshot(user_id)
+
+
+@task(max_attempts=5, timeout=1800)
+def rebuild_portfolio_snapshots(user_ids):
+    """Rebuild many snapshots in one task, e.g. after a bulk publish"""
+    from .snapshots import rebuild_snapshot
+    for user_id in user_ids:
+        try:
+            rebuild_snapshot(user_id)
+        except Exception as e:
+            # One broken portfolio shouldn't hold back the rest; its next save rebuilds it
+            logger.error(f"Error rebuilding portfolio snapshot for user ID {user_id}: {str(e)}", exc_info=True)
+
+
+@task(max_attempts=5)
+def send_portfolio_status_email(user_id, is_published, unpublished_by_admin=False):
+    from django.contrib.auth.models import User
+    from core.views import send_portfolio_status_email as send_email
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        logger.warning(f"Skipping portfolio status email: user ID {user_id} no longer exists")
+        return
+    send_email(user=user, is_published=is_published, unpublished_by_admin=unpublished_by_admin)
+
+
+@task(every=timedelta(hours=1), max_attempts=1)
+def purge_expired_uploads():
+    from .direct_uploads import purge_expired_uploads as purge
+    purged = purge()
+    if purged:
+        logger.info(f"Purged {purged} expired direct uploads")
+
+
+@task(every=timedelta(hours=1), max_attempts=1, timeout=1800)
+def send_message_digests():
+    """Queue the contact message digests that are due (see digests.py)"""
+    from .digests import send_message_digests as send_digests
+    queued = send_digests()
+    if queued:
+        logger.info(f"Queued {queued} contact message digests")
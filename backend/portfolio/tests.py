@@ -1,3 +1,900 @@
-from django.test import TestCase
+from datetime import date
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from PIL import Image
+from core.query_budget import QueryBudgetTestMixin
+from .models import AboutMe, Project, Experience, Education, Skill, SocialMedia, ContactInfo, ContactMessage, MediaBlob, UserProfile, PortfolioSnapshot
+from .resolver import slug_resolver
+from .snapshots import rebuild_snapshot
+from .serializers import ProjectSerializer
+from .media_urls import build_media_url, file_version
+from rest_framework.test import APIRequestFactory
 
-# Create your tests here.
+User = get_user_model()
+
+
+def auth_header(user):
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+class ViewSetQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Every portfolio ViewSet action must stay within its declared query budget"""
+
+    # (url prefix, model, create kwargs, request payload)
+    SECTIONS = [
+        ('about', AboutMe, {'name': 'Owner', 'title': 'Developer', 'bio': 'Bio'},
+         {'name': 'Owner', 'title': 'Engineer', 'bio': 'Bio'}),
+        ('projects', Project, {'title': 'Project', 'description': 'Description'},
+         {'title': 'Project', 'description': 'Updated'}),
+        ('experience', Experience, {'role': 'Dev', 'company': 'Acme', 'start_date': date(2020, 1, 1), 'description': 'Work'},
+         {'role': 'Lead', 'company': 'Acme', 'start_date': '2020-01-01', 'description': 'Work'}),
+        ('education', Education, {'institution': 'Uni', 'degree': 'BSc', 'start_year': 2015},
+         {'institution': 'Uni', 'degree': 'MSc', 'start_year': 2019}),
+        ('skills', Skill, {'name': 'Python', 'level': 'Advanced'},
+         {'name': 'Django', 'level': 'Advanced'}),
+        ('social-media', SocialMedia, {'platform': 'github', 'url': 'https://github.com/owner'},
+         {'platform': 'github', 'url': 'https://github.com/owner2'}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password123', is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.auth = auth_header(self.owner)
+
+    def check_crud(self, prefix, model, create_kwargs, payload):
+        obj = model.objects.create(user=self.owner, **create_kwargs)
+        for i in range(5):
+            model.objects.create(user=self.owner, **create_kwargs)
+        response = self.assertWithinQueryBudget('GET', f'/api/v1/{prefix}/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('GET', f'/api/v1/{prefix}/{obj.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('POST', f'/api/v1/{prefix}/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        response = self.assertWithinQueryBudget('PUT', f'/api/v1/{prefix}/{obj.pk}/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('PATCH', f'/api/v1/{prefix}/{obj.pk}/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('DELETE', f'/api/v1/{prefix}/{obj.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 204)
+
+    def test_owner_section_viewsets(self):
+        for prefix, model, create_kwargs, payload in self.SECTIONS:
+            with self.subTest(prefix=prefix):
+                self.check_crud(prefix, model, create_kwargs, payload)
+
+    def test_contact_info_viewset(self):
+        obj = ContactInfo.objects.create(email='info@example.com')
+        for i in range(5):
+            ContactInfo.objects.create(email=f'info{i}@example.com')
+        payload = {'email': 'new@example.com'}
+        response = self.assertWithinQueryBudget('GET', '/api/v1/contact-info/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('GET', f'/api/v1/contact-info/{obj.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('POST', '/api/v1/contact-info/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        response = self.assertWithinQueryBudget('PUT', f'/api/v1/contact-info/{obj.pk}/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('PATCH', f'/api/v1/contact-info/{obj.pk}/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('DELETE', f'/api/v1/contact-info/{obj.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 204)
+
+    def test_contact_message_viewset(self):
+        messages = [
+            ContactMessage.objects.create(user=self.owner, name='Visitor', email='v@example.com', message='Hi')
+            for _ in range(5)
+        ]
+        message = messages[0]
+        payload = {'name': 'Visitor', 'email': 'v@example.com', 'message': 'Hello'}
+        for user in (self.owner, self.staff):
+            response = self.assertWithinQueryBudget('GET', '/api/v1/contact-messages/', **auth_header(user))
+            self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('GET', f'/api/v1/contact-messages/{message.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('POST', '/api/v1/contact-messages/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        response = self.assertWithinQueryBudget('PUT', f'/api/v1/contact-messages/{message.pk}/', data=payload, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget('PATCH', f'/api/v1/contact-messages/{message.pk}/', data={'status': 'read'}, format='json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        for action in ('mark_read', 'archive'):
+            response = self.assertWithinQueryBudget('POST', f'/api/v1/contact-messages/{message.pk}/{action}/', **self.auth)
+            self.assertEqual(response.status_code, 200)
+        response = self.assertWithinQueryBudget(
+            'POST', f'/api/v1/contact-messages/{message.pk}/reply/', data={'reply': 'Thanks'}, format='json', **self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        # Only added to the outbox so far
+        self.assertEqual(response.data['email_status'], 'queued')
+        response = self.assertWithinQueryBudget('DELETE', f'/api/v1/contact-messages/{message.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 204)
+
+
+class PortfolioSnapshotTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = self.owner.profile
+            profile.portfolio_published = True
+            profile.save()
+
+    def snapshot(self):
+        return PortfolioSnapshot.objects.filter(user=self.owner).first()
+
+    def test_rebuilt_on_section_change_and_dropped_on_unpublish(self):
+        self.assertEqual(self.snapshot().data['projects'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            project = Project.objects.create(user=self.owner, title='First', description='Description')
+        snapshot = self.snapshot()
+        self.assertEqual([item['title'] for item in snapshot.data['projects']], ['First'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            project.title = 'Renamed'
+            project.save()
+        rebuilt = self.snapshot()
+        self.assertEqual([item['title'] for item in rebuilt.data['projects']], ['Renamed'])
+        self.assertNotEqual(rebuilt.etag, snapshot.etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=self.owner)
+            profile.portfolio_published = False
+            profile.save()
+        self.assertIsNone(self.snapshot())
+
+    def test_missing_snapshot_is_served_without_writes_and_backfilled(self):
+        # As for portfolios published before snapshots existed
+        PortfolioSnapshot.objects.all().delete()
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            response = client.get('/api/v1/portfolio/owner/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['profile']['username'], 'owner')
+            response = client.get('/api/v1/portfolios/?slugs=owner')
+            self.assertEqual([item['profile']['username'] for item in response.json()['results']], ['owner'])
+        writes = [query['sql'] for query in queries.captured_queries
+                  if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(self.snapshot())
+
+        call_command('build_portfolio_snapshots', stdout=io.StringIO())
+        self.assertEqual(self.snapshot().data['profile']['username'], 'owner')
+
+    def test_user_saves_outside_the_document_skip_the_rebuild(self):
+        with mock.patch('portfolio.signals.schedule_snapshot_rebuild') as schedule:
+            self.owner.set_password('another-password')
+            self.owner.save(update_fields=['password'])
+            self.owner.is_active = False
+            self.owner.save(update_fields=['is_active'])
+            schedule.assert_not_called()
+            self.owner.first_name = 'Owner'
+            self.owner.save(update_fields=['first_name'])
+            schedule.assert_called_once_with(self.owner.pk)
+
+
+class SlugResolverTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        slug_resolver.clear_local()
+
+    def assertReadOnly(self, queries):
+        writes = [query['sql'] for query in queries.captured_queries
+                  if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+    def test_unknown_slugs_are_cached_without_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/v1/portfolio/nobody/').status_code, 404)
+        self.assertTrue(queries.captured_queries)
+        self.assertReadOnly(queries)
+
+        # Answered from the local tier, then from the shared cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/portfolio/nobody/').status_code, 404)
+        slug_resolver.clear_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/portfolio/nobody/').status_code, 404)
+
+        # Creating the user drops the cached miss once it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('nobody', 'nobody@example.com', 'password123')
+        self.assertEqual(self.client.get('/api/v1/portfolio/nobody/').status_code, 403)
+
+    def test_user_without_profile_resolves_as_unpublished(self):
+        user = User.objects.create_user('bare', 'bare@example.com', 'password123')
+        UserProfile.objects.filter(user=user).delete()
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/v1/portfolio/bare/').status_code, 403)
+        self.assertReadOnly(queries)
+        self.assertFalse(UserProfile.objects.filter(user=user).exists())
+
+
+class PortfolioExportTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        override = override_settings(PORTFOLIO_EXPORT_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+
+    def exported(self, slug):
+        return os.path.exists(os.path.join(self.root, f'{slug}.json'))
+
+    def update_profile(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=self.owner)
+            for name, value in fields.items():
+                setattr(profile, name, value)
+            profile.save()
+
+    def test_written_on_publish_and_removed_on_slug_change_and_unpublish(self):
+        self.assertFalse(self.exported('owner'))
+        self.update_profile(portfolio_published=True)
+        with open(os.path.join(self.root, 'owner.json'), 'rb') as f:
+            self.assertEqual(json.loads(f.read())['profile']['username_slug'], 'owner')
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'owner.json.gz')))
+
+        self.update_profile(username_slug='renamed')
+        self.assertFalse(self.exported('owner'))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'owner.json.gz')))
+        self.assertTrue(self.exported('renamed'))
+
+        self.update_profile(portfolio_published=False)
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_backfill_losing_a_race_keeps_the_newer_export(self):
+        from .snapshots import build_snapshots_bulk, save_new_snapshots
+
+        self.update_profile(portfolio_published=True)
+        PortfolioSnapshot.objects.all().delete()
+        stale = build_snapshots_bulk([UserProfile.objects.select_related('user').get(user=self.owner)])
+
+        # A rebuild for a newer edit lands between building and inserting the backfill
+        Project.objects.create(user=self.owner, title='Newer', description='Description')
+        rebuild_snapshot(self.owner.id)
+        self.assertEqual(save_new_snapshots(stale.values()), 0)
+        with open(os.path.join(self.root, 'owner.json'), 'rb') as f:
+            self.assertEqual([item['title'] for item in json.loads(f.read())['projects']], ['Newer'])
+
+
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        profile = cls.owner.profile
+        profile.portfolio_published = True
+        profile.save()
+        AboutMe.objects.create(user=cls.owner, name='Owner', title='Developer', bio='Long bio')
+        Project.objects.create(user=cls.owner, title='Project', description='Long description')
+        rebuild_snapshot(cls.owner.id)
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        slug_resolver.clear_local()
+
+    def test_public_portfolio_sections_and_fields(self):
+        response = self.client.get('/api/v1/portfolio/owner/?sections=about_me,projects&fields[projects]=title')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(set(data), {'about_me', 'projects'})
+        self.assertEqual(data['projects'], [{'title': 'Project'}])
+        self.assertEqual(self.client.get('/api/v1/portfolio/owner/?sections=unknown').status_code, 400)
+
+    def test_public_portfolio_etag_ignores_unrelated_query_parameters(self):
+        response = self.client.get('/api/v1/portfolio/owner/?sections=projects,about_me&fields[projects]=description,title')
+        # Same cache entry: the body isn't built again
+        with mock.patch('portfolio.compression.build_bodies') as build_bodies:
+            same = self.client.get('/api/v1/portfolio/owner/?utm_source=mail&fields[projects]=title,description&sections=about_me,projects&_=123')
+            build_bodies.assert_not_called()
+        self.assertEqual(same['ETag'], response['ETag'])
+        self.assertEqual(same.content, response.content)
+        other = self.client.get('/api/v1/portfolio/owner/?sections=projects')
+        self.assertNotEqual(other['ETag'], response['ETag'])
+
+    def test_viewset_defers_unrequested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/projects/?fields=title', **auth_header(self.owner))
+        self.assertEqual(response.data, [{'title': 'Project'}])
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+
+def image_upload(name, width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_VARIANTS_BACKGROUND=False, IMAGE_VARIANT_WIDTHS=(320, 640, 1280))
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+
+    def test_upload_generates_variants_srcset_and_placeholder(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            project = Project.objects.create(
+                user=self.owner, title='Project', description='Description', project_image=image_upload('photo.jpg', 900, 600)
+            )
+        project.refresh_from_db()
+        entry = project.image_variants['project_image']
+        self.assertEqual(entry['source'], project.project_image.name)
+        # Never upscaled: 900px wide source gives 320, 640 and 900
+        self.assertEqual(sorted(entry['jpeg'], key=int), ['320', '640', '900'])
+        with project.project_image.storage.open(entry['jpeg']['320']) as variant:
+            self.assertEqual(Image.open(variant).size, (320, 213))
+
+        data = ProjectSerializer(project).data
+        self.assertNotIn('image_variants', data)
+        self.assertTrue(data['project_image_srcset']['jpeg'].endswith('-900w.jpg 900w'))
+        # Small enough to inline in the portfolio JSON
+        self.assertTrue(data['project_image_placeholder'].startswith('data:image/'))
+        self.assertLess(len(data['project_image_placeholder']), 1000)
+
+        # Clearing the image drops the variants and their files
+        storage = project.project_image.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            project.project_image = None
+            project.save()
+        project.refresh_from_db()
+        self.assertEqual(project.image_variants, {})
+        self.assertFalse(storage.exists(entry['jpeg']['320']))
+        self.assertIsNone(ProjectSerializer(project).data['project_image_srcset'])
+        self.assertIsNone(ProjectSerializer(project).data['project_image_placeholder'])
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANTS_BACKGROUND=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'password123')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'password123')
+
+    def test_identical_uploads_share_one_counted_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = SocialMedia.objects.create(user=self.alice, platform='github', url='https://github.com/alice',
+                                               icon_image=image_upload('github.png', 64, 64))
+            second = SocialMedia.objects.create(user=self.bob, platform='github', url='https://github.com/bob',
+                                                icon_image=image_upload('github-icon.png', 64, 64))
+        name = first.icon_image.name
+        self.assertEqual(second.icon_image.name, name)
+        self.assertRegex(name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 2)
+
+        # Variants of a shared blob are reused without resizing or encoding anything
+        from .images import generate_variants
+        with mock.patch('portfolio.images.Image.Image.save') as encode:
+            entry = generate_variants(second.icon_image)
+        self.assertEqual(encode.call_count, 1)  # only the placeholder
+        self.assertEqual(entry['jpeg'], SocialMedia.objects.get(pk=first.pk).image_variants['icon_image']['jpeg'])
+
+        storage = first.icon_image.storage
+        variants = SocialMedia.objects.get(pk=second.pk).image_variants['icon_image']
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        # Still used by bob: neither the blob nor its variants go away
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(storage.exists(variants['jpeg']['64']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.icon_image = image_upload('other.png', 32, 32)
+            second.save()
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 0)
+        self.assertEqual(MediaBlob.objects.get(name=second.icon_image.name).ref_count, 1)
+
+
+class CollectOrphanedMediaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANTS_BACKGROUND=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+
+    def make_old(self, name):
+        old = (timezone.now() - timedelta(days=3)).timestamp()
+        os.utime(default_storage.path(name), (old, old))
+
+    def test_deletes_only_old_unreferenced_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            project = Project.objects.create(user=self.owner, title='Project', description='Description',
+                                             project_image=image_upload('kept.jpg', 400, 300))
+            replaced = Skill.objects.create(user=self.owner, name='Python', level='Advanced',
+                                            icon_image=image_upload('old-icon.png', 48, 48))
+        old_blob = replaced.icon_image.name
+        old_variants = list(Skill.objects.get(pk=replaced.pk).image_variants['icon_image']['jpeg'].values())
+        with self.captureOnCommitCallbacks(execute=True):
+            replaced.icon_image = image_upload('new-icon.png', 40, 40)
+            replaced.save()
+        MediaBlob.objects.filter(name=old_blob).update(updated_at=timezone.now() - timedelta(days=3))
+
+        legacy = default_storage.save('projects/legacy.jpg', ContentFile(b'orphan'))
+        fresh = default_storage.save('projects/fresh.jpg', ContentFile(b'just uploaded'))
+        for name in [legacy, old_blob, project.project_image.name] + old_variants:
+            self.make_old(name)
+
+        out = io.StringIO()
+        call_command('collect_orphaned_media', '--dry-run', stdout=out)
+        self.assertIn(f'Would delete {legacy}', out.getvalue())
+        self.assertTrue(default_storage.exists(legacy))
+
+        call_command('collect_orphaned_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertFalse(default_storage.exists(old_blob))
+        self.assertFalse(any(default_storage.exists(name) for name in old_variants))
+        self.assertFalse(MediaBlob.objects.filter(name=old_blob).exists())
+        # Referenced files and files inside the grace period stay
+        self.assertTrue(default_storage.exists(project.project_image.name))
+        self.assertTrue(default_storage.exists(replaced.icon_image.name))
+        self.assertTrue(default_storage.exists(fresh))
+
+    def test_reused_blob_survives_collection(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            skill = Skill.objects.create(user=self.owner, name='Python', level='Advanced',
+                                         icon_image=image_upload('icon.png', 48, 48))
+            blob = skill.icon_image.name
+            skill.delete()
+        MediaBlob.objects.filter(name=blob).update(updated_at=timezone.now() - timedelta(days=3))
+        self.make_old(blob)
+
+        # Uploaded again before the collector runs: the save marks the blob as used right away
+        name = skill.icon_image.storage.save('again.png', image_upload('again.png', 48, 48))
+        self.assertEqual(name, blob)
+        self.assertGreater(MediaBlob.objects.get(name=blob).updated_at, timezone.now() - timedelta(hours=1))
+
+        call_command('collect_orphaned_media', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(blob))
+        self.assertTrue(MediaBlob.objects.filter(name=blob).exists())
+
+
+class MediaDeliveryTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root, MEDIA_SENDFILE_BACKEND=None)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.body = bytes(range(256)) * 40
+        self.about = AboutMe.objects.create(user=self.owner, name='Owner', title='Developer', bio='Bio',
+                                            cv_file=SimpleUploadedFile('cv.pdf', self.body, content_type='application/pdf'))
+        self.url = f'/media/{self.about.cv_file.name}'
+
+    def publish(self, published=True):
+        profile = self.owner.profile
+        profile.portfolio_published = published
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+
+    def test_unpublished_cv_is_only_served_to_its_owner(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        response = self.client.get(self.url, **auth_header(self.owner))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.publish()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get('/media/../secrets.txt').status_code, 404)
+
+    def test_unpublishing_closes_the_cv_at_once(self):
+        self.publish()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.publish(False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_owner_links_carry_an_access_token(self):
+        from .media import media_access_token
+
+        response = self.client.get('/api/v1/about/', **auth_header(self.owner))
+        records = response.data['results'] if isinstance(response.data, dict) else response.data
+        link = records[0]['cv_file']
+        self.assertIn('?access=', link)
+        # Followed without the Authorization header, like an <a href>
+        self.assertEqual(self.client.get(link.replace('http://testserver', '')).status_code, 200)
+
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        self.assertEqual(self.client.get(f'{self.url}?access={media_access_token(self.about.cv_file.name, other.id)}').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}?access={media_access_token("cv/other.pdf", self.owner.id)}').status_code, 404)
+        with override_settings(MEDIA_ACCESS_TOKEN_LIFETIME=-1):
+            self.assertEqual(self.client.get(link.replace('http://testserver', '')).status_code, 404)
+
+    def test_range_and_conditional_requests(self):
+        self.publish()
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), self.body[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-10:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.body)}-').status_code, 416)
+
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # A stale If-Range gets the whole file
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='nginx', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_transfer_is_offloaded_to_the_proxy(self):
+        self.publish()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.about.cv_file.name}')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(IMAGE_UPLOAD_MAX_DIMENSION=200, IMAGE_UPLOAD_MAX_BYTES=2 * 1024 * 1024, IMAGE_VARIANTS_BACKGROUND=False)
+class BoundedImageUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.client = APIClient()
+
+    def photo(self, width, height, **save_options):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), (30, 90, 160)).save(buffer, 'JPEG', **save_options)
+        return SimpleUploadedFile('photo.jpeg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_downscaled_rotated_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees, as phones store portrait shots
+        exif[0x010F] = 'PhoneMaker'
+        response = self.client.post('/api/v1/projects/', {
+            'title': 'Project', 'description': 'Description', 'project_image': self.photo(1600, 1200, exif=exif.tobytes()),
+        }, format='multipart', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 201, response.data)
+        project = Project.objects.get(pk=response.data['id'])
+        with project.project_image.open('rb') as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (150, 200))
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertTrue(project.project_image.name.endswith('.jpg'))
+
+    def test_rejects_oversized_and_invalid_uploads(self):
+        with override_settings(IMAGE_UPLOAD_MAX_PIXELS=1_000_000):
+            response = self.client.post('/api/v1/projects/', {
+                'title': 'Project', 'description': 'Description', 'project_image': self.photo(1600, 1200),
+            }, format='multipart', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('megapixels', str(response.data['project_image']))
+
+        response = self.client.post('/api/v1/projects/', {
+            'title': 'Project', 'description': 'Description',
+            'project_image': SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg'),
+        }, format='multipart', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+
+
+class MediaURLTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root, MEDIA_URL='/media/', IMAGE_VARIANTS_BACKGROUND=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        file_version.cache_clear()
+        self.addCleanup(file_version.cache_clear)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+
+    def test_urls_use_request_origin_or_public_base(self):
+        request = APIRequestFactory().get('/', HTTP_HOST='portfy.test')
+        self.assertEqual(build_media_url('projects/a b.png', request), 'http://portfy.test/media/projects/a%20b.png')
+        self.assertEqual(build_media_url('projects/a.png'), '/media/projects/a.png')
+        self.assertIsNone(build_media_url(''))
+        with override_settings(MEDIA_PUBLIC_BASE_URL='https://cdn.example.com/m'):
+            self.assertEqual(build_media_url('projects/a.png', request), 'https://cdn.example.com/m/projects/a.png')
+
+    @override_settings(MEDIA_URL_VERSIONING=True)
+    def test_version_query_only_for_mutable_names(self):
+        name = default_storage.save('projects/legacy.png', ContentFile(b'legacy'))
+        url = build_media_url(name)
+        self.assertRegex(url, r'^/media/projects/legacy\.png\?v=[0-9a-f]{12}$')
+        blob = 'blobs/ab/cd/' + 'ab' * 32 + '.png'
+        self.assertEqual(build_media_url(blob), f'/media/{blob}')
+
+    def test_serializers_render_every_file_field_through_the_builder(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            project = Project.objects.create(user=self.owner, title='Project', description='Description',
+                                             project_image=image_upload('photo.jpg', 400, 300))
+        project.refresh_from_db()
+        request = APIRequestFactory().get('/', HTTP_HOST='portfy.test')
+        data = ProjectSerializer(project, context={'request': request}).data
+        self.assertEqual(data['project_image'], f'http://portfy.test/media/{project.project_image.name}')
+        self.assertTrue(all(
+            candidate.startswith('http://portfy.test/media/variants/')
+            for candidate in data['project_image_srcset']['jpeg'].split(', ')
+        ))
+
+
+@override_settings(IMAGE_VARIANTS_BACKGROUND=False, DIRECT_UPLOAD_BACKEND='local')
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.other = User.objects.create_user('other', 'other@example.com', 'password123')
+        self.project = Project.objects.create(user=self.owner, title='Project', description='Description')
+        self.client = APIClient()
+
+    def issue(self, content, **overrides):
+        data = {'target': 'projects.project_image', 'filename': '../shot.jpg',
+                'content_type': 'image/jpeg', 'size': len(content), **overrides}
+        response = self.client.post('/api/v1/uploads/', data, format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_issue_put_and_confirm(self):
+        content = image_upload('shot.jpg', 400, 300).read()
+        upload = self.issue(content)
+        self.assertEqual(upload['method'], 'PUT')
+        self.assertEqual(upload['filename'], 'shot.jpg')
+
+        # Confirming before the bytes arrived fails
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/confirm/", {'object_id': self.project.pk},
+                                    format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.put(upload['upload_url'], content, content_type='image/jpeg')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/confirm/", {'object_id': 'abc'},
+                                    format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+
+        # Only the owner of the record can attach to it
+        response = self.client.post(f"/api/v1/uploads/{upload['id']}/confirm/", {'object_id': self.project.pk},
+                                    format='json', **auth_header(self.other))
+        self.assertEqual(response.status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/api/v1/uploads/{upload['id']}/confirm/", {'object_id': self.project.pk},
+                                        format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.project.refresh_from_db()
+        self.assertTrue(self.project.project_image.name)
+        self.assertEqual(response.data['project_image'], f'http://testserver/media/{self.project.project_image.name}')
+        self.assertIn('project_image', self.project.image_variants)
+
+        # The URL is single-use once confirmed
+        response = self.client.put(upload['upload_url'], content, content_type='image/jpeg')
+        self.assertEqual(response.status_code, 404)
+
+    def test_store_enforces_signed_type_size_and_token(self):
+        upload = self.issue(b'x' * 10)
+        response = self.client.put(upload['upload_url'], b'x' * 10, content_type='image/png')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.put(upload['upload_url'], b'x' * 11, content_type='image/jpeg')
+        self.assertEqual(response.status_code, 413)
+        response = self.client.put(upload['upload_url'].replace('/upload-store/', '/upload-store/x'), b'x' * 10,
+                                   content_type='image/jpeg')
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.post('/api/v1/uploads/', {
+            'target': 'projects.project_image', 'filename': 'big.jpg', 'content_type': 'image/jpeg', 'size': 10 ** 9,
+        }, format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/uploads/', {
+            'target': 'projects.title', 'filename': 'a.jpg', 'content_type': 'image/jpeg', 'size': 10,
+        }, format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+
+    def test_truncated_upload_is_not_kept_or_confirmed(self):
+        from .direct_uploads import LocalUploadBackend
+        from .models import PendingUpload
+
+        upload = PendingUpload.objects.get(pk=self.issue(b'x' * 10)['id'])
+        backend = LocalUploadBackend()
+        self.assertEqual(backend.receive(upload, io.BytesIO(b'x' * 6), 10), 6)
+        self.assertIsNone(backend.size(upload))
+
+        # A smaller file staged some other way is rejected on confirm
+        self.assertEqual(backend.receive(upload, io.BytesIO(b'x' * 6), 6), 6)
+        response = self.client.post(f'/api/v1/uploads/{upload.pk}/confirm/', {'object_id': self.project.pk},
+                                    format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Project.objects.get(pk=self.project.pk).project_image)
+
+
+class StubS3Client:
+    """Just the S3 client calls S3UploadBackend makes, on an in-memory bucket"""
+
+    def __init__(self):
+        self.objects = {}
+        self.presigned = []
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        self.presigned.append((operation, Params, ExpiresIn))
+        return f"https://{Params['Bucket']}.s3.example.com/{Params['Key']}?X-Amz-Signature=stub"
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[(Bucket, Key)])}
+
+    def download_fileobj(self, Bucket, Key, fileobj):
+        fileobj.write(self.objects[(Bucket, Key)])
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@override_settings(IMAGE_VARIANTS_BACKGROUND=False, DIRECT_UPLOAD_BACKEND='s3', DIRECT_UPLOAD_S3_BUCKET='uploads')
+class S3DirectUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.s3 = StubS3Client()
+        boto3 = mock.patch('portfolio.direct_uploads.boto3')
+        boto3.start().client.return_value = self.s3
+        self.addCleanup(boto3.stop)
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.project = Project.objects.create(user=self.owner, title='Project', description='Description')
+        self.client = APIClient()
+
+    def test_presign_and_confirm(self):
+        content = image_upload('shot.jpg', 400, 300).read()
+        response = self.client.post('/api/v1/uploads/', {
+            'target': 'projects.project_image', 'filename': 'shot.jpg', 'content_type': 'image/jpeg', 'size': len(content),
+        }, format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 201, response.data)
+        upload = response.data
+        self.assertTrue(upload['upload_url'].startswith('https://uploads.s3.example.com/pending/'))
+        operation, params, _ = self.s3.presigned[-1]
+        self.assertEqual(operation, 'put_object')
+        self.assertEqual(params['ContentType'], 'image/jpeg')
+        self.assertEqual(params['ContentLength'], len(content))
+
+        # What the client's PUT would have stored, minus its last bytes
+        key = ('uploads', f"pending/{upload['id']}")
+        self.s3.objects[key] = content[:-10]
+        confirm = f"/api/v1/uploads/{upload['id']}/confirm/"
+        response = self.client.post(confirm, {'object_id': self.project.pk}, format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 400)
+
+        self.s3.objects[key] = content
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(confirm, {'object_id': self.project.pk}, format='json', **auth_header(self.owner))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertTrue(Project.objects.get(pk=self.project.pk).project_image.name)
+        self.assertNotIn(key, self.s3.objects)
+
+
+class MessageDigestTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        self.quiet = User.objects.create_user('quiet', 'quiet@example.com', 'password123')
+        self.opted_out = User.objects.create_user('optedout', 'optedout@example.com', 'password123')
+        for user in (self.owner, self.quiet):
+            user.profile.message_digest = True
+            user.profile.save()
+
+    def receive(self, user, count, age=timedelta(hours=1)):
+        for i in range(count):
+            ContactMessage.objects.create(user=user, name=f'Visitor {i}', email='v@example.com', message=f'Hi {i}')
+        ContactMessage.objects.filter(user=user).update(created_at=timezone.now() - age)
+
+    def test_one_digest_per_period(self):
+        from core.models import EmailOutbox
+        from .digests import DIGEST_MESSAGE_LIMIT, send_message_digests
+        self.receive(self.owner, DIGEST_MESSAGE_LIMIT + 3)
+        self.receive(self.opted_out, 2)
+
+        self.assertEqual(send_message_digests(), 1)
+        digest = EmailOutbox.objects.get()
+        self.assertEqual(digest.to, ['owner@example.com'])
+        self.assertIn(f'{DIGEST_MESSAGE_LIMIT + 3} new messages', digest.subject)
+        self.assertIn('and 3 more', digest.body)
+        # Quiet owners move on too, so nobody is due again until the period is over
+        self.assertEqual(UserProfile.objects.filter(message_digest_sent_at__isnull=False).count(), 2)
+        self.assertEqual(send_message_digests(), 0)
+
+        # Only messages received after the last digest are reported
+        later = timezone.now() + timedelta(hours=25)
+        ContactMessage.objects.create(user=self.owner, name='New', email='n@example.com', message='Again')
+        self.assertEqual(send_message_digests(now=later), 1)
+        self.assertIn('1 new message ', EmailOutbox.objects.latest('pk').subject)
+
+    def test_chunk_queries_do_not_grow_with_owners(self):
+        from .digests import send_message_digests
+        for i in range(10):
+            user = User.objects.create_user(f'owner{i}', f'owner{i}@example.com', 'password123')
+            user.profile.message_digest = True
+            user.profile.save()
+            self.receive(user, 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(send_message_digests(), 10)
+        # due owners, counts, messages, users, INSERT, UPDATE, empty next page (+ savepoint/transaction)
+        self.assertLessEqual(len(queries), 10)
+
+
+class OwnerScopedIndexTests(TestCase):
+    """Owner-scoped lists are read from a (user, ordering) index instead of being sorted in memory"""
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would otherwise always be scanned sequentially
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_list_queries_use_composite_indexes(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Query plan assertions are written for SQLite and PostgreSQL')
+        cases = [
+            (Project.objects.filter(user=owner), 'portfolio_project_user_created'),
+            (Experience.objects.filter(user=owner), 'portfolio_exp_user_start'),
+            (Education.objects.filter(user=owner), 'portfolio_edu_user_start'),
+            (Skill.objects.filter(user=owner), 'portfolio_skill_user_name'),
+            (SocialMedia.objects.filter(user=owner), 'portfolio_social_user_platform'),
+            (ContactMessage.objects.filter(user=owner, status='new'), 'portfolio_message_user_status'),
+        ]
+        for queryset, index in cases:
+            with self.subTest(model=queryset.model.__name__):
+                plan = self.explain(queryset)
+                self.assertIn(index, plan)
+                # The index already returns rows in Meta.ordering order
+                self.assertNotIn('TEMP B-TREE', plan.upper())
+                self.assertNotIn('Sort Key', plan)
+
+    def test_inbox_status_filter(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        ContactMessage.objects.create(user=owner, name='A', email='a@example.com', message='Hi', status='new')
+        ContactMessage.objects.create(user=owner, name='B', email='b@example.com', message='Hi', status='read')
+        client = APIClient()
+        response = client.get('/api/v1/contact-messages/?status=new', **auth_header(owner))
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([message['name'] for message in results], ['A'])
+        response = client.get('/api/v1/contact-messages/?status=bogus', **auth_header(owner))
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,138 @@
+"""
+Memory-bounded processing of uploaded images.
+
+Pillow keeps a fully decoded image in memory (width x height x 4 bytes), so a
+50-megapixel phone photo costs ~200 MB of RSS. Uploads through
+BoundedImageField are handled in stages instead:
+
+1. The byte size is checked against IMAGE_UPLOAD_MAX_BYTES.
+2. Only the header is read (Image.open is lazy) to get format and
+   dimensions, which are checked against the pixel limits before any decoding.
+3. JPEGs are decoded with Image.draft(), which lets libjpeg scale by 1/2, 1/4
+   or 1/8 while decoding; other formats are shrunk with Image.reduce().
+   Anything still larger than IMAGE_UPLOAD_MAX_DIMENSION is resized down.
+4. The image is re-encoded without EXIF (GPS position, camera serials), after
+   applying the EXIF orientation so it still displays upright.
+"""
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+from rest_framework import serializers
+import io
+import math
+import os
+
+from .media_urls import MediaURLFieldMixin
+
+DEFAULT_MAX_BYTES = 15 * 1024 * 1024
+# Formats libjpeg can downscale while decoding
+DEFAULT_MAX_PIXELS = 60_000_000
+# Formats that have to be decoded at full size first
+DEFAULT_MAX_DECODED_PIXELS = 16_000_000
+# Longest edge kept; 2x the largest responsive variant
+DEFAULT_MAX_DIMENSION = 2560
+
+# Pillow format -> (save options, file extension)
+ALLOWED_FORMATS = {
+    'JPEG': ({'quality': 90, 'optimize': True, 'progressive': True}, '.jpg'),
+    'PNG': ({'optimize': True}, '.png'),
+    'WEBP': ({'quality': 90}, '.webp'),
+    'GIF': ({}, '.gif'),
+}
+
+
+def get_upload_limits():
+    return {
+        'max_bytes': getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', DEFAULT_MAX_BYTES),
+        'max_pixels': getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', DEFAULT_MAX_PIXELS),
+        'max_decoded_pixels': getattr(settings, 'IMAGE_UPLOAD_MAX_DECODED_PIXELS', DEFAULT_MAX_DECODED_PIXELS),
+        'max_dimension': getattr(settings, 'IMAGE_UPLOAD_MAX_DIMENSION', DEFAULT_MAX_DIMENSION),
+    }
+
+
+def process_uploaded_image(upload):
+    """
+    Validate and shrink an uploaded image without decoding it at full size.
+
+    Returns a new in-memory upload with the processed image; raises
+    serializers.ValidationError when the file isn't an acceptable image.
+    """
+    limits = get_upload_limits()
+    if upload.size is not None and upload.size > limits['max_bytes']:
+        raise serializers.ValidationError(
+            f"Image is too large ({upload.size // (1024 * 1024)} MB). The maximum is {limits['max_bytes'] // (1024 * 1024)} MB."
+        )
+
+    upload.seek(0)
+    try:
+        # Lazy: reads the header only
+        image = Image.open(upload)
+    except Exception:
+        raise serializers.ValidationError('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+
+    if image.format not in ALLOWED_FORMATS:
+        raise serializers.ValidationError(
+            f"Unsupported image format {image.format}. Use one of: {', '.join(sorted(ALLOWED_FORMATS))}."
+        )
+    if getattr(image, 'n_frames', 1) > 1:
+        # Animated GIF/WebP: keep the animation, just enforce the limits
+        if image.width * image.height * image.n_frames > limits['max_decoded_pixels']:
+            raise serializers.ValidationError('Animated image is too large.')
+        upload.seek(0)
+        return upload
+
+    pixels = image.width * image.height
+    pixel_limit = limits['max_pixels'] if image.format == 'JPEG' else limits['max_decoded_pixels']
+    if pixels > pixel_limit:
+        raise serializers.ValidationError(
+            f'Image is {image.width}x{image.height} ({pixels / 1_000_000:.0f} megapixels); '
+            f'the maximum is {pixel_limit / 1_000_000:.0f} megapixels.'
+        )
+
+    image_format = image.format
+    max_dimension = limits['max_dimension']
+    try:
+        exif_orientation = image.getexif().get(0x0112)
+        if image_format == 'JPEG':
+            # Ask libjpeg for the smallest DCT scale that stays >= the target size
+            scale = min(1.0, max_dimension / max(image.size))
+            image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image.load()
+        longest = max(image.size)
+        if longest > max_dimension * 2:
+            # Cheap integer box reduction first, then an accurate resize below
+            image = image.reduce(longest // max_dimension)
+        if exif_orientation:
+            image.getexif()[0x0112] = exif_orientation
+            image = ImageOps.exif_transpose(image)
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Upload a valid image. The file you uploaded was either not an image or a corrupted image.')
+
+    options, extension = ALLOWED_FORMATS[image_format]
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    save_options = dict(options)
+    if image.info.get('icc_profile'):
+        # Colour profile is kept; all other metadata (EXIF, XMP, comments) is dropped
+        save_options['icc_profile'] = image.info['icc_profile']
+    if image_format == 'GIF' and 'transparency' in image.info:
+        save_options['transparency'] = image.info['transparency']
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **save_options)
+
+    stem = os.path.splitext(os.path.basename(upload.name or 'image'))[0]
+    return SimpleUploadedFile(f'{stem}{extension}', buffer.getvalue(), content_type=Image.MIME[image_format])
+
+
+class BoundedImageField(MediaURLFieldMixin, serializers.ImageField):
+    """
+    ImageField that validates and shrinks uploads with process_uploaded_image()
+    before Django's own checks, and renders with build_media_url()
+    """
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'read') and hasattr(data, 'size'):
+            data = process_uploaded_image(data)
+        return super().to_internal_value(data)
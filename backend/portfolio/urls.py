@@ -8,7 +8,9 @@ from .views import (
     SkillViewSet,
     SocialMediaViewSet,
     ContactInfoViewSet,
-    ContactMessageViewSet
+    ContactMessageViewSet,
+    DirectUploadViewSet,
+    direct_upload_store
 )
 
 router = DefaultRouter()
@@ -20,8 +22,11 @@ router.register(r'skills', SkillViewSet, basename='skill')
 router.register(r'social-media', SocialMediaViewSet, basename='social-media')
 router.register(r'contact-info', ContactInfoViewSet, basename='contact-info')
 router.register(r'contact-messages', ContactMessageViewSet, basename='contact-message')
+router.register(r'uploads', DirectUploadViewSet, basename='upload')
 
 urlpatterns = [
+    # Local stand-in for the object store that direct uploads PUT to
+    path('upload-store/<str:token>/', direct_upload_store, name='direct-upload-store'),
     path('', include(router.urls)),
 ]
 
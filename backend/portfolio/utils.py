@@ -1,7 +1,7 @@
-from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+from core.mail import queue_mail
 
 
 def send_contact_reply_email(message, reply_text):
@@ -57,21 +57,20 @@ Portfy Team
             """.strip()
             html_message = None
         
-        # Send email using send_mail for consistency with other emails
-        send_mail(
+        # Queued like the other emails; the send_queued_mail worker delivers it
+        queue_mail(
             subject=subject,
             message=text_message,
             from_email=from_email,
             recipient_list=[message.email],
             html_message=html_message if html_message else None,
-            fail_silently=False,
         )
         
-        return True, "Email sent successfully"
+        return True, "Email queued for delivery"
         
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
-        logger.error(f"Email sending error: {str(e)}")
-        return False, f"Failed to send email: {str(e)}"
+        logger.error(f"Email queueing error: {str(e)}")
+        return False, f"Failed to queue email: {str(e)}"
 
@@ -2,9 +2,12 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.views.decorators.csrf import csrf_exempt
 import logging
-from .models import AboutMe, Project, Experience, Education, Skill, SocialMedia, ContactInfo, ContactMessage
+from core.query_budget import QueryBudgetMixin
+from .fieldsets import SparseFieldsetMixin
+from .models import AboutMe, Project, Experience, Education, Skill, SocialMedia, ContactInfo, ContactMessage, PendingUpload
 from .serializers import (
     AboutMeSerializer,
     ProjectSerializer,
@@ -14,13 +17,17 @@ from .serializers import (
     SocialMediaSerializer,
     ContactInfoSerializer,
     ContactMessageSerializer,
-    ContactMessageCreateSerializer
+    ContactMessageCreateSerializer,
+    PendingUploadSerializer
 )
 
 
-class AboutMeViewSet(viewsets.ModelViewSet):
+class AboutMeViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = AboutMeSerializer
     permission_classes = [IsAuthenticated]
+    sparse_section = 'about_me'
+    # Queries per action, including the JWT user lookup (see core/query_budget.py)
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 3}
     
     def get_queryset(self):
         # Users can ONLY see their own data
@@ -42,9 +49,9 @@ class AboutMeViewSet(viewsets.ModelViewSet):
     
     def perform_update(self, serializer):
         # Ensure user can only update their own records
-        instance = self.get_object()
+        instance = serializer.instance
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update your own records")
         # Never allow user field to be changed via update - always keep original user
         serializer.save(user=instance.user)
@@ -52,7 +59,7 @@ class AboutMeViewSet(viewsets.ModelViewSet):
     def perform_destroy(self, instance):
         # Ensure user can only delete their own records
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete your own records")
         instance.delete()
     
@@ -62,9 +69,12 @@ class AboutMeViewSet(viewsets.ModelViewSet):
         return context
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated]
+    sparse_section = 'projects'
+    # Queries per action, including the JWT user lookup (see core/query_budget.py)
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 3}
     
     def get_queryset(self):
         # Users can ONLY see their own data
@@ -84,16 +94,16 @@ class ProjectViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
     
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update your own records")
         # Never allow user field to be changed via update - always keep original user
         serializer.save(user=instance.user)
     
     def perform_destroy(self, instance):
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete your own records")
         instance.delete()
     
@@ -103,9 +113,12 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return context
 
 
-class ExperienceViewSet(viewsets.ModelViewSet):
+class ExperienceViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = ExperienceSerializer
     permission_classes = [IsAuthenticated]
+    sparse_section = 'experiences'
+    # Queries per action, including the JWT user lookup (see core/query_budget.py)
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 3}
     
     def get_queryset(self):
         # Users can ONLY see their own data
@@ -124,23 +137,26 @@ class ExperienceViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
     
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update your own records")
         # Never allow user field to be changed via update - always keep original user
         serializer.save(user=instance.user)
     
     def perform_destroy(self, instance):
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete your own records")
         instance.delete()
 
 
-class EducationViewSet(viewsets.ModelViewSet):
+class EducationViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = EducationSerializer
     permission_classes = [IsAuthenticated]
+    sparse_section = 'educations'
+    # Queries per action, including the JWT user lookup (see core/query_budget.py)
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 3}
     
     def get_queryset(self):
         # Users can ONLY see their own data
@@ -159,23 +175,26 @@ class EducationViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
     
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update your own records")
         # Never allow user field to be changed via update - always keep original user
         serializer.save(user=instance.user)
     
     def perform_destroy(self, instance):
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete your own records")
         instance.delete()
 
 
-class SkillViewSet(viewsets.ModelViewSet):
+class SkillViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = SkillSerializer
     permission_classes = [IsAuthenticated]
+    sparse_section = 'skills'
+    # Queries per action, including the JWT user lookup (see core/query_budget.py)
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 3}
     
     def get_queryset(self):
         # Users can ONLY see their own data
@@ -194,16 +213,16 @@ class SkillViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
     
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update your own records")
         # Never allow user field to be changed via update - always keep original user
         serializer.save(user=instance.user)
     
     def perform_destroy(self, instance):
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete your own records")
         instance.delete()
     
@@ -213,9 +232,12 @@ class SkillViewSet(viewsets.ModelViewSet):
         return context
 
 
-class SocialMediaViewSet(viewsets.ModelViewSet):
+class SocialMediaViewSet(QueryBudgetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = SocialMediaSerializer
     permission_classes = [IsAuthenticated]
+    sparse_section = 'social_media'
+    # Queries per action, including the JWT user lookup (see core/query_budget.py)
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 4, 'partial_update': 4, 'destroy': 3}
     
     def get_queryset(self):
         # Users can ONLY see their own data
@@ -234,16 +256,16 @@ class SocialMediaViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
     
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update your own records")
         # Never allow user field to be changed via update - always keep original user
         serializer.save(user=instance.user)
     
     def perform_destroy(self, instance):
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete your own records")
         instance.delete()
     
@@ -253,10 +275,11 @@ class SocialMediaViewSet(viewsets.ModelViewSet):
         return context
 
 
-class ContactInfoViewSet(viewsets.ModelViewSet):
+class ContactInfoViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = ContactInfo.objects.all()
     serializer_class = ContactInfoSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    query_budgets = {'list': 2, 'retrieve': 2, 'create': 2, 'update': 3, 'partial_update': 3, 'destroy': 3}
     
     def get_queryset(self):
         # Public users can only see active contact info
@@ -265,9 +288,13 @@ class ContactInfoViewSet(viewsets.ModelViewSet):
         return ContactInfo.objects.filter(is_active=True)
 
 
-class ContactMessageViewSet(viewsets.ModelViewSet):
+class ContactMessageViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = ContactMessage.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
+    query_budgets = {
+        'list': 2, 'retrieve': 2, 'create': 2, 'update': 3, 'partial_update': 3, 'destroy': 3,
+        'reply': 4, 'mark_read': 3, 'archive': 3,
+    }
     
     def get_serializer_class(self):
         # Use different serializer for create (public) vs other actions (user/admin)
@@ -280,8 +307,16 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         if self.request.user.is_authenticated:
             # Admins can see all messages, regular users see only their own
             if self.request.user.is_superuser or self.request.user.is_staff:
-                return ContactMessage.objects.all()
-            return ContactMessage.objects.filter(user=self.request.user)
+                queryset = ContactMessage.objects.select_related('user')
+            else:
+                queryset = ContactMessage.objects.filter(user=self.request.user).select_related('user')
+            # Optional inbox filter (?status=new), served by the (user, status, -created_at) index
+            status_filter = self.request.query_params.get('status') if self.action == 'list' else None
+            if status_filter:
+                if status_filter not in dict(ContactMessage.STATUS_CHOICES):
+                    raise ValidationError({'status': f"Invalid status. Choose from: {', '.join(dict(ContactMessage.STATUS_CHOICES))}"})
+                queryset = queryset.filter(status=status_filter)
+            return queryset
         return ContactMessage.objects.none()
     
     def perform_create(self, serializer):
@@ -296,7 +331,7 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         
         # Ensure user can only reply to their own messages (unless admin)
         if not (request.user.is_superuser or request.user.is_staff):
-            if message.user != request.user:
+            if message.user_id != request.user.id:
                 raise PermissionDenied("You can only reply to messages sent to your portfolio")
         
         reply_text = request.data.get('reply', '')
@@ -321,9 +356,9 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(message)
         response_data = serializer.data
         
-        # Include email status in response
+        # Include email status in response (the email is delivered later by the outbox worker)
         if email_sent:
-            response_data['email_status'] = 'sent'
+            response_data['email_status'] = 'queued'
             response_data['email_message'] = email_message
         else:
             response_data['email_status'] = 'failed'
@@ -336,17 +371,17 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         return Response(response_data)
     
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         # Ensure user can only update their own messages (unless admin)
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only update messages sent to your portfolio")
         serializer.save()
     
     def perform_destroy(self, instance):
         # Ensure user can only delete their own messages (unless admin)
         if not (self.request.user.is_superuser or self.request.user.is_staff):
-            if instance.user != self.request.user:
+            if instance.user_id != self.request.user.id:
                 raise PermissionDenied("You can only delete messages sent to your portfolio")
         instance.delete()
     
@@ -356,7 +391,7 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         message = self.get_object()
         # Ensure user can only mark their own messages as read (unless admin)
         if not (request.user.is_superuser or request.user.is_staff):
-            if message.user != request.user:
+            if message.user_id != request.user.id:
                 raise PermissionDenied("You can only mark messages sent to your portfolio as read")
         message.status = 'read'
         message.save()
@@ -370,10 +405,117 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
         message = self.get_object()
         # Ensure user can only archive their own messages (unless admin)
         if not (request.user.is_superuser or request.user.is_staff):
-            if message.user != request.user:
+            if message.user_id != request.user.id:
                 raise PermissionDenied("You can only archive messages sent to your portfolio")
         message.status = 'archived'
         message.save()
         
         serializer = self.get_serializer(message)
         return Response(serializer.data)
+
+
+class DirectUploadViewSet(QueryBudgetMixin, viewsets.GenericViewSet):
+    """Issue direct-to-storage upload URLs and attach confirmed uploads (see portfolio/direct_uploads.py)"""
+    serializer_class = PendingUploadSerializer
+    permission_classes = [IsAuthenticated]
+    query_budgets = {'create': 2, 'confirm': 12}
+    
+    def get_queryset(self):
+        # Users can only confirm their own uploads
+        return PendingUpload.objects.filter(user=self.request.user, status='pending')
+    
+    def create(self, request):
+        from django.utils import timezone
+        from datetime import timedelta
+        from .direct_uploads import get_upload_backend, get_expiry
+        
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(user=request.user, expires_at=timezone.now() + timedelta(seconds=get_expiry()))
+        url, headers = get_upload_backend().presign(upload, request)
+        
+        response_data = serializer.data
+        response_data.update({'upload_url': url, 'method': 'PUT', 'headers': headers})
+        return Response(response_data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        """Attach an uploaded file to the record given by object_id"""
+        from django.utils import timezone
+        from .direct_uploads import get_upload_targets, attach_upload
+        
+        upload = self.get_object()
+        if upload.expires_at < timezone.now():
+            return Response({'error': 'This upload has expired'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        model, _, serializer_class = get_upload_targets()[upload.target]
+        if upload.target.startswith('profile.'):
+            instance = request.user.profile
+        else:
+            object_id = request.data.get('object_id')
+            if not object_id:
+                return Response({'error': 'object_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                object_id = int(object_id)
+            except (TypeError, ValueError):
+                return Response({'error': 'object_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            instance = model.objects.filter(pk=object_id).first()
+            if instance is None:
+                return Response({'error': 'Record not found'}, status=status.HTTP_404_NOT_FOUND)
+            # Ensure user can only attach files to their own records (unless admin)
+            if not (request.user.is_superuser or request.user.is_staff):
+                if instance.user_id != request.user.id:
+                    raise PermissionDenied("You can only update your own records")
+        
+        try:
+            attach_upload(upload, instance)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            return Response({'error': ' '.join(str(detail) for detail in e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger = logging.getLogger(__name__)
+        logger.info(f"Attached direct upload {upload.pk} to {upload.target} {instance.pk} for user ID {request.user.id}")
+        return Response(serializer_class(instance, context={'request': request}).data)
+
+
+@csrf_exempt
+def direct_upload_store(request, token):
+    """
+    PUT endpoint of the local object-store stand-in.
+
+    Behaves like a presigned S3 PUT: the signed token names the upload and
+    expires, the Content-Type must match what was signed, and the body may not
+    exceed the declared size.
+    """
+    from django.core import signing
+    from django.http import HttpResponse, JsonResponse
+    from .direct_uploads import SIGNING_SALT, LocalUploadBackend, get_expiry
+    
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        upload_id = signing.loads(token, salt=SIGNING_SALT, max_age=get_expiry())
+    except signing.SignatureExpired:
+        return JsonResponse({'error': 'Upload URL has expired'}, status=403)
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Invalid upload URL'}, status=403)
+    
+    upload = PendingUpload.objects.filter(pk=upload_id, status='pending').first()
+    if upload is None:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    if request.META.get('CONTENT_TYPE', '') != upload.content_type:
+        return JsonResponse({'error': 'Content-Type does not match the signed upload'}, status=403)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length <= 0:
+        return JsonResponse({'error': 'Content-Length is required'}, status=411)
+    if length > upload.size:
+        return JsonResponse({'error': 'Upload is larger than the declared size'}, status=413)
+    
+    written = LocalUploadBackend().receive(upload, request, length)
+    if written != length:
+        return JsonResponse({'error': 'Incomplete upload'}, status=400)
+    return HttpResponse(status=200)
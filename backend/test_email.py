@@ -4,10 +4,28 @@ Run this to test if your Gmail configuration is working.
 
 Usage:
     python test_email.py your-test-email@gmail.com
+
+Benchmark mode measures email throughput without sending anything real:
+
+    python test_email.py --benchmark 200 [--batch-size 50] [--smtp-delay-ms 20] [--inline]
+
+It starts a local SMTP sink, creates a throwaway test database and drives N
+verification (RegisterView), approval (send_approval_email), password reset
+and contact reply (send_contact_reply_email) emails through the real code
+paths, then delivers the queued emails to the sink with the outbox worker.
+It reports the request-side latency of each kind, delivery throughput
+(emails per second), queue-to-sent latency and the SMTP connections opened.
+--inline delivers each email on its own connection the way send_mail() does,
+for a before/after comparison; --smtp-delay-ms makes the sink answer every
+SMTP command that much later, like a slow provider.
 """
 
+import argparse
 import os
+import socketserver
 import sys
+import threading
+import time
 import django
 
 # Setup Django
@@ -17,9 +35,9 @@ django.setup()
 from django.core.mail import send_mail
 from django.conf import settings
 
-def test_email():
+def test_email(recipient=None):
     # Get recipient email from command line or use default
-    recipient = sys.argv[1] if len(sys.argv) > 1 else input("Enter test email address: ")
+    recipient = recipient or input("Enter test email address: ")
     
     print("\n" + "="*50)
     print("Testing Email Configuration")
@@ -63,6 +81,198 @@ def test_email():
         print("   4. See GMAIL_SETUP_GUIDE.md for detailed instructions")
         return False
 
-if __name__ == '__main__':
-    test_email()
 
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Django's backend: accepts any login and every message, and keeps nothing"""
+
+    def reply(self, line):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply('220 localhost benchmark SMTP sink')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            verb = line.decode('ascii', 'replace').strip().split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-localhost\r\n250-AUTH PLAIN\r\n250 8BITMIME')
+            elif verb == 'AUTH':
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay=0):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def timed(latencies, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    latencies.append(time.perf_counter() - start)
+    return result
+
+
+def drive_emails(count):
+    """Queue `count` emails of each kind through the real views and helpers; returns ({kind: [seconds]}, {kind: failures})"""
+    from django.contrib.auth import get_user_model
+    from rest_framework.test import APIClient
+    from core.views import send_approval_email
+    from portfolio.models import ContactMessage
+    from portfolio.utils import send_contact_reply_email
+
+    User = get_user_model()
+    client = APIClient()
+    latencies = {'verification': [], 'approval': [], 'reset': [], 'reply': []}
+    failures = {}
+
+    for i in range(count):
+        response = timed(latencies['verification'], client.post, '/api/v1/auth/register/', {
+            'username': f'bench{i}', 'email': f'bench{i}@example.com',
+            'password': 'benchmark-pass', 'password_confirm': 'benchmark-pass',
+        }, format='json')
+        if response.status_code != 201:
+            failures['verification'] = failures.get('verification', 0) + 1
+
+    users = list(User.objects.filter(username__startswith='bench').order_by('pk'))
+    for user in users:
+        timed(latencies['approval'], send_approval_email, user, True)
+
+    for user in users:
+        response = timed(latencies['reset'], client.post, '/api/v1/auth/password-reset/', {'email': user.email}, format='json')
+        if response.status_code != 200:
+            failures['reset'] = failures.get('reset', 0) + 1
+
+    messages = ContactMessage.objects.bulk_create([
+        ContactMessage(user=user, name=f'Visitor {i}', email=f'visitor{i}@example.com', message='Hello!')
+        for i, user in enumerate(users)
+    ])
+    for message in messages:
+        success, _ = timed(latencies['reply'], send_contact_reply_email, message, 'Thanks for your message!')
+        if not success:
+            failures['reply'] = failures.get('reply', 0) + 1
+    return latencies, failures
+
+
+def deliver_outbox(batch_size, inline):
+    """Send everything queued to the configured backend; returns seconds taken"""
+    from django.core.mail import get_connection
+    from django.utils import timezone
+    from core.mail import build_message, claim_batch, get_breaker, send_batch
+
+    get_breaker().reset()
+    start = time.perf_counter()
+    while True:
+        messages = claim_batch(batch_size)
+        if not messages:
+            break
+        if not inline:
+            send_batch(messages)
+            continue
+        # What send_mail() did per email: a connection of its own
+        for outbox in messages:
+            mail_connection = get_connection()
+            build_message(outbox, mail_connection).send()
+            outbox.status, outbox.attempts, outbox.sent_at = 'sent', outbox.attempts + 1, timezone.now()
+            outbox.save(update_fields=['status', 'attempts', 'sent_at'])
+    return time.perf_counter() - start
+
+
+def benchmark(count, batch_size, smtp_delay_ms, inline):
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    from core.models import EmailOutbox
+
+    sink = SMTPSink(delay=smtp_delay_ms / 1000)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=sink.port, EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER='benchmark@example.com', EMAIL_HOST_PASSWORD='benchmark',
+            DEFAULT_FROM_EMAIL='benchmark@example.com',
+        ):
+            print(f"Queueing {count} emails of each kind through the real code paths...")
+            latencies, failures = drive_emails(count)
+            queued = EmailOutbox.objects.count()
+            mode = 'one connection per email (send_mail)' if inline else f'outbox worker, batches of {batch_size}'
+            print(f"Delivering {queued} queued emails to the SMTP sink ({mode})...")
+            elapsed = deliver_outbox(batch_size, inline)
+            delivery = [
+                (sent_at - created_at).total_seconds()
+                for created_at, sent_at in EmailOutbox.objects.filter(status='sent').values_list('created_at', 'sent_at')
+            ]
+            unsent = EmailOutbox.objects.exclude(status='sent').count()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        sink.shutdown()
+        sink.server_close()
+
+    print("\n" + "="*62)
+    print(f"{'Request path':<16}{'emails':>8}{'p50 ms':>12}{'p95 ms':>12}{'failed':>10}")
+    print("-"*62)
+    for kind, values in latencies.items():
+        print(f"{kind:<16}{len(values):>8}{percentile(values, 0.5) * 1000:>12.2f}"
+              f"{percentile(values, 0.95) * 1000:>12.2f}{failures.get(kind, 0):>10}")
+    print("-"*62)
+    print(f"Delivered:        {sink.messages} emails in {elapsed:.2f}s "
+          f"({sink.messages / elapsed if elapsed else 0:.1f} emails/s), {unsent} not sent")
+    print(f"SMTP connections: {sink.connections}")
+    print(f"Queue to sent:    p50 {percentile(delivery, 0.5) * 1000:.0f} ms, p95 {percentile(delivery, 0.95) * 1000:.0f} ms")
+    print("="*62)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send a test email, or benchmark email throughput against a local SMTP sink.')
+    parser.add_argument('recipient', nargs='?', help='Address to send the test email to')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Benchmark N emails of each kind instead')
+    parser.add_argument('--batch-size', type=int, default=50, help='Outbox batch size (default: 50)')
+    parser.add_argument('--smtp-delay-ms', type=float, default=0, help='Delay before each SMTP reply of the sink')
+    parser.add_argument('--inline', action='store_true', help='Deliver each email on its own connection, like send_mail()')
+    options = parser.parse_args()
+    if options.benchmark:
+        benchmark(options.benchmark, options.batch_size, options.smtp_delay_ms, options.inline)
+    else:
+        sys.exit(0 if test_email(options.recipient) else 1)
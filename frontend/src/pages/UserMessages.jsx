@@ -62,8 +62,8 @@ const UserMessages = () => {
       });
       
       // Check email status
-      if (response.data.email_status === 'sent') {
-        toast.success('Reply sent successfully and email delivered!');
+      if (response.data.email_status === 'queued') {
+        toast.success('Reply saved, and the email is on its way!');
       } else if (response.data.email_status === 'failed') {
         toast.success('Reply saved, but email could not be sent. ' + (response.data.email_message || ''));
         console.warn('Email error:', response.data.email_message);